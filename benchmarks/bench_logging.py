@@ -0,0 +1,119 @@
+"""
+Benchmark of the logging overhead per sync.
+
+Runs `AskenFitbitSync.sync_food_logs` against in-memory Asken/Fitbit stand-ins and compares
+the time per sync when records are written synchronously by a StreamHandler and
+when they go through the QueueHandler/QueueListener pair used by the application.
+
+With a fast local file the queue does not pay off, since the listener thread competes with the
+sync for the GIL. It only helps when writing blocks, like stdout piped to a log collector;
+--write-delay simulates that.
+
+Usage:
+    python -m benchmarks.bench_logging [--syncs 2000] [--write-delay 0]
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+from unittest.mock import MagicMock
+import argparse
+import logging
+import queue
+import tempfile
+import time
+
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.models.asken import FoodLog
+from src.models.fitbit import GetFoodLogResponse
+from src.utils import flush_logs
+from tests.data.json import CREATE_FOOD_LOG_RESPONSE_JSON, GET_FOOD_LOG_RESPONSE_JSON
+
+
+LOGGER_NAMES = ["src.asken_fitbit_sync", "src.sinks", "src.asken", "src.fitbit"]
+FORMAT = "[%(levelname)s] %(asctime)s - %(name)s - %(message)s"
+
+
+def create_syncer() -> AskenFitbitSync:
+    asken = MagicMock()
+    asken.fetch_food_log.side_effect = lambda date, meal_type_id: FoodLog(
+        date=date, meal_type_id=meal_type_id, calories=500, logged=True
+    )
+    fitbit = MagicMock()
+    fitbit.fetch_food_log.return_value = GetFoodLogResponse(
+        **GET_FOOD_LOG_RESPONSE_JSON
+    )
+    fitbit.create_food_log.return_value = CREATE_FOOD_LOG_RESPONSE_JSON
+
+    return AskenFitbitSync(asken, fitbit)
+
+
+class SlowStreamHandler(logging.StreamHandler):
+    """StreamHandler whose writes block for a while, like a pipe drained by a log collector."""
+
+    def __init__(self, stream, delay: float):
+        super().__init__(stream)
+        self._delay = delay
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        if self._delay:
+            time.sleep(self._delay)
+
+
+def use_handler(handler: logging.Handler):
+    for name in LOGGER_NAMES:
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def measure(syncs: int) -> float:
+    syncer = create_syncer()
+    start = time.perf_counter()
+    for _ in range(syncs):
+        syncer.sync_food_logs("2024-01-01")
+    return (time.perf_counter() - start) / syncs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--syncs", type=int, default=2000)
+    parser.add_argument(
+        "--write-delay",
+        type=float,
+        default=0.0,
+        help="Microseconds each write blocks. Defaults to 0.",
+    )
+    args = parser.parse_args()
+
+    flush_logs()
+    # 実際のファイルに書き込むが、作業ディレクトリには残さない
+    with tempfile.TemporaryFile("w") as stream:
+        console = SlowStreamHandler(stream, args.write_delay / 1e6)
+        console.setFormatter(logging.Formatter(FORMAT))
+
+        use_handler(logging.NullHandler())
+        # 最初の同期はモックやモデルの初期化を含むため計測しない
+        measure(min(args.syncs, 100))
+        baseline = measure(args.syncs)
+
+        use_handler(console)
+        sync = measure(args.syncs)
+
+        q: queue.Queue = queue.Queue()
+        listener = QueueListener(q, console, respect_handler_level=True)
+        listener.start()
+        use_handler(QueueHandler(q))
+        # 同期を呼び出した側の時間を計測する。キューに溜まったレコードはその後に出力される
+        queued = measure(args.syncs)
+        listener.stop()
+
+    print(f"no logging   : {baseline * 1e6:8.1f} us/sync")
+    for name, elapsed in [("StreamHandler", sync), ("QueueHandler", queued)]:
+        print(
+            f"{name:13}: {elapsed * 1e6:8.1f} us/sync (+{(elapsed - baseline) * 1e6:.1f} us)"
+        )
+
+
+if __name__ == "__main__":
+    main()
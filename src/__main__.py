@@ -0,0 +1,331 @@
+"""
+Command line interface for syncing Asken food logs to Fitbit.
+
+Each finished day/meal is printed to stdout as one NDJSON record, so the output can be piped into other tools.
+Logs are written to stderr.
+
+Usage:
+    python -m src --date 2024-01-01
+    python -m src --start 2024-01-01 --end 2024-01-31 --meals 1,2,3 --concurrency 4 --mode live
+    python -m src --start 2024-01-01 --end 2024-06-30 --audit --cache-dir --mode live
+"""
+
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import json
+import logging
+import sys
+import threading
+
+from pydantic import BaseModel
+
+from .const import DAILY_MEAL_TYPE_ID_LIST, MEAL_TYPES
+from .models.sync import MealSyncResult
+from .utils import date_range, flush_logs, get_logger
+from .asken_fitbit_sync import AskenFitbitSync
+from .cache import DEFAULT_CACHE_DIR
+from .lambda_function import create_syncer, get_secret, get_token_store
+from .profiling import maybe_profile, profiling_enabled
+
+
+logger = get_logger(__name__)
+
+
+def parse_meal_type_ids(value: str) -> list[int]:
+    """Parse comma separated meal type IDs (e.g. '1,2,3')."""
+    try:
+        meal_type_id_list = [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid meal type IDs: {value}")
+
+    invalid = [v for v in meal_type_id_list if v not in MEAL_TYPES]
+    if invalid or not meal_type_id_list:
+        raise argparse.ArgumentTypeError(
+            f"Meal type IDs must be chosen from {list(MEAL_TYPES)}: {value}"
+        )
+
+    return meal_type_id_list
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src",
+        description="Sync Asken food logs to Fitbit and print results as NDJSON.",
+    )
+    parser.add_argument("--date", help="Date to sync (YYYY-MM-DD). Defaults to today.")
+    parser.add_argument("--start", help="First date of the range (YYYY-MM-DD).")
+    parser.add_argument("--end", help="Last date of the range (YYYY-MM-DD).")
+    parser.add_argument(
+        "--meals",
+        type=parse_meal_type_ids,
+        default=DAILY_MEAL_TYPE_ID_LIST,
+        help="Comma separated meal type IDs (1: 朝食, 2: 昼食, 3: 夕食, 4: 間食). Defaults to 1,2,3,4.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of days synced in parallel. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["dry-run", "live"],
+        default="dry-run",
+        help="'dry-run' never writes to Fitbit. Defaults to dry-run.",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Decouple scraping and writing with a queue. Each stage uses --concurrency threads.",
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        help="Compare daily calorie totals of the range first, print the drifting days and sync only those days.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Only delete duplicate entries registered by this tool in Fitbit. Asken is not scraped.",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request when an Asken page fetch is slower than usual.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Limit concurrent Asken page fetches adaptively, up to --concurrency, "
+        "backing off on 403, 429, 5xx or slow responses.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        nargs="?",
+        const=DEFAULT_CACHE_DIR,
+        help=f"Cache parsed Asken pages in this directory. Defaults to {DEFAULT_CACHE_DIR} when given without a value.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cache and fetch every page again.",
+    )
+    parser.add_argument(
+        "--custom-foods",
+        help="JSON file of Fitbit custom foods, so that meals with the same nutrients reuse a food.",
+    )
+    parser.add_argument(
+        "--ledger",
+        help="SQLite file recording what was synced. Meals unchanged since the last sync are skipped without reading Fitbit.",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        help="Directory of the write-ahead journal. Replacements interrupted by a crash are finished at the next run.",
+    )
+    parser.add_argument(
+        "--export-dir",
+        help="Directory of the columnar nutrition store. If given, every parsed food log is exported.",
+    )
+    parser.add_argument(
+        "--csv",
+        help="CSV file to which every parsed food log is appended.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write CPU (pstats or collapsed stacks, see PROFILE_MODE) and memory profiles of the run. Also enabled by PROFILE=1.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Directory of the profiles. Defaults to PROFILE_DIR or a directory in /tmp.",
+    )
+    parser.add_argument(
+        "--credentials",
+        help="Path to a credentials JSON file. Defaults to the same source as the Lambda function.",
+    )
+
+    return parser
+
+
+def resolve_dates(args: argparse.Namespace) -> list[str]:
+    """Return the dates to sync from the command line arguments."""
+    if args.date and (args.start or args.end):
+        raise ValueError("--date cannot be combined with --start/--end.")
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            raise ValueError("Both --start and --end are required for a range.")
+        return date_range(args.start, args.end)
+
+    return [args.date or datetime.now().strftime("%Y-%m-%d")]
+
+
+def load_credentials(path: Optional[str]) -> dict:
+    if path is None:
+        return get_secret()
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def redirect_log_streams(stream):
+    """Move stream handlers writing to stdout to the given stream so that stdout only contains NDJSON."""
+    for name in logging.getHandlerNames():
+        handler = logging.getHandlerByName(name)
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.setStream(stream)
+
+
+class NdjsonWriter:
+    """Thread safe writer which prints one JSON record per line."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, record: BaseModel):
+        line = json.dumps(record.model_dump(mode="json"), ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+def sync_day(
+    syncer: AskenFitbitSync,
+    date: str,
+    meal_type_id_list: list[int],
+    writer: NdjsonWriter,
+) -> bool:
+    """
+    Sync one day and write the result of each meal as soon as it finishes.
+    Returns:
+        bool: True if no meal failed.
+    """
+    ok = True
+    done: set[int] = set()
+    try:
+        for result in syncer.iter_sync_food_logs(date, meal_type_id_list):
+            done.add(result.meal_type_id)
+            ok = ok and result.status != "failed"
+            writer.write(result)
+    except Exception as e:
+        logger.error("Failed to sync %s: %s", date, e, exc_info=True)
+        for meal_type_id in meal_type_id_list:
+            if meal_type_id in done:
+                continue
+            writer.write(
+                MealSyncResult(
+                    date=date,
+                    meal_type_id=meal_type_id,
+                    status="failed",
+                    reason="error",
+                    error=str(e),
+                )
+            )
+        return False
+
+    return ok
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        dates = resolve_dates(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.concurrency < 1:
+        parser.error("--concurrency must be 1 or more.")
+
+    redirect_log_streams(sys.stderr)
+
+    with maybe_profile(args.profile or profiling_enabled(), directory=args.profile_dir):
+        return run(args, dates)
+
+
+def run(args: argparse.Namespace, dates: list[str]) -> int:
+    """Sync the dates as the command line arguments say. Returns the exit code."""
+    credentials = load_credentials(args.credentials)
+    syncer = create_syncer(
+        mail=credentials["mail"],
+        password=credentials["password"],
+        client_id=credentials["client_id"],
+        access_token=credentials["access_token"],
+        refresh_token=credentials["refresh_token"],
+        dry_run=args.mode == "dry-run",
+        export_dir=args.export_dir,
+        csv_path=args.csv,
+        hedge=args.hedge,
+        adaptive_concurrency=args.concurrency if args.adaptive else None,
+        cache_dir=args.cache_dir,
+        refresh=args.refresh,
+        custom_foods_path=args.custom_foods,
+        ledger_path=args.ledger,
+        journal_dir=args.journal_dir,
+        # 同じアカウントの他の実行とトークンの更新を調停する
+        callback_on_token_refreshed=None,
+        token_store=get_token_store(args.credentials),
+    )
+
+    writer = NdjsonWriter(sys.stdout)
+    # 前回の実行が削除と再登録の間で終了した食事は、どのモードでも最初に再登録する
+    recovered = syncer.fitbit_sink.recover()
+    for result in recovered:
+        writer.write(result)
+    recovered_ok = all(result.status != "failed" for result in recovered)
+
+    if args.compact:
+        report = syncer.compact_dates(dates, args.meals)
+        for result in report.meals:
+            writer.write(result)
+        flush_logs()
+
+        return 0 if report.ok and recovered_ok else 1
+
+    if args.audit:
+        drifts = syncer.audit(dates[0], dates[-1])
+        for drift in drifts:
+            writer.write(drift)
+        dates = [drift.date for drift in drifts]
+
+    if args.pipeline:
+        failed = False
+
+        def on_result(result: MealSyncResult):
+            nonlocal failed
+            failed = failed or result.status == "failed"
+            writer.write(result)
+
+        dead_letters = syncer.sync_food_logs_pipelined(
+            dates,
+            args.meals,
+            scrape_workers=args.concurrency,
+            write_workers=args.concurrency,
+            on_result=on_result,
+        )
+        syncer.fitbit_sink.prune_custom_foods()
+        flush_logs()
+
+        return 1 if failed or dead_letters or not recovered_ok else 0
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(sync_day, syncer, date, args.meals, writer)
+            for date in dates
+        ]
+        ok = all(future.result() for future in futures)
+    # sync_datesと同じく、使われなくなったカスタム食品を1日1回削除する
+    syncer.fitbit_sink.prune_custom_foods()
+
+    if args.adaptive:
+        logger.info("Asken concurrency settled: %s", syncer.concurrency_stats())
+    flush_logs()
+
+    return 0 if ok and recovered_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,88 @@
 from typing import Optional
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from decimal import Decimal
+import hashlib
+import itertools
+import threading
+import time
 
 from bs4 import BeautifulSoup
 import requests
 
-from .utils import remove_unit, get_logger
-from .const import MEAL_TYPES, NUTRITIONS
+from .utils import iter_date_range, remove_unit, get_logger
+from .const import (
+    DAILY_MEAL_TYPE_ID_LIST,
+    DEFAULT_TIMEOUT,
+    MEAL_TYPES,
+    NUTRITIONS,
+    PARSED_PAGE_CACHE_SIZE,
+)
+from .cache import FoodLogCache
+from .hedging import Hedger
+from .metrics import Metrics
 from .models.asken import FoodLog
+from .rate_limit import AimdLimiter
 
 
 logger = get_logger(__name__)
 
+# 栄養素の一覧の各行。_scrape_food_logが読むのはこの行の中だけ
+NUTRITION_ROW_MARKER = 'class="line_left'
+
+
+def nutrition_block_fingerprint(html: str) -> Optional[str]:
+    """
+    Return a hash of the nutrition list of an advice page, cut out by a plain string scan without parsing.
+    The block runs from the first nutrition row to the end of the last one. None if the page has no such block.
+    """
+    start = html.find(NUTRITION_ROW_MARKER)
+    if start < 0:
+        return None
+    end = html.find("</ul>", html.rfind(NUTRITION_ROW_MARKER))
+    if end < 0:
+        return None
+
+    return hashlib.sha256(html[start:end].encode()).hexdigest()
+
+
+class AskenAuthError(requests.exceptions.RequestException):
+    """Asken redirected a page to the login form: the session has expired."""
+
 
 class Asken:
-    def __init__(self, email: str, password: str):
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+        hedger: Optional[Hedger] = None,
+        cache: Optional[FoodLogCache] = None,
+        limiter: Optional[AimdLimiter] = None,
+    ):
+        """
+        Args:
+            email (str): Email address of Asken.
+            password (str): Password of Asken.
+            timeout (tuple[float, float]): (connect, read) timeout seconds of every request.
+            hedger (Optional[Hedger]): If given, slow page fetches are hedged with a duplicate request.
+            cache (Optional[FoodLogCache]): If given, parsed food logs are cached on disk.
+            limiter (Optional[AimdLimiter]): If given, concurrent page fetches are limited adaptively
+                so that Asken does not start rejecting them.
+        """
         self._url = "https://www.asken.jp"
+        self._timeout = timeout  # (接続, 読み込み)タイムアウト秒
+        self._hedger = hedger
+        self._cache = cache
+        self._limiter = limiter
+        self.metrics = Metrics()
         self._session = self.login(email, password)
+        self._logged_in_at = time.monotonic()
+        self._auth_failed = False
+        # (日付, 食事) -> (栄養素の指紋, 解析結果)。内容が変わらないページは解析しない
+        self._parsed: OrderedDict[tuple[str, int], tuple[str, FoodLog]] = OrderedDict()
+        self._parsed_lock = threading.Lock()
 
     @staticmethod
     def _headers() -> dict:
@@ -41,13 +108,68 @@ class Asken:
             "data[Submit][submit][x]": 19,
         }
 
-        response = session.post(login_url, headers=self._headers(), data=payload)
+        response = session.post(
+            login_url, headers=self._headers(), data=payload, timeout=self._timeout
+        )
+        self.metrics.record_response(response)
         response.raise_for_status()  # Check if the request was successful
 
         logger.info("Logged in to Asken successfully.")
 
         return session
 
+    def _get(self, url: str) -> requests.Response:
+        """
+        GET a page of Asken. Hedged if a hedger is given, since every page fetch is idempotent.
+        With a limiter, hedges are counted as concurrent requests as well.
+        """
+
+        def get() -> requests.Response:
+            response = self._session.get(
+                url=url, headers=self._headers(), timeout=self._timeout
+            )
+            self.metrics.record_response(response)
+            return response
+
+        limiter = self._limiter
+        send = (lambda: limiter.request(get)) if limiter else get
+        response = self._hedger.request(send) if self._hedger else send()
+        response.raise_for_status()
+        if "/login" in response.url:
+            # セッションが切れるとログイン画面にリダイレクトされる
+            self._auth_failed = True
+            raise AskenAuthError(f"Asken session expired: {url}", response=response)
+
+        return response
+
+    @property
+    def auth_failed(self) -> bool:
+        """True if a page was redirected to the login form, i.e. the session must be replaced."""
+        return self._auth_failed
+
+    def is_session_alive(self, max_age: float) -> bool:
+        """
+        Return whether the session can be reused, without sending a request.
+        Args:
+            max_age (float): Seconds after the login beyond which the session is not trusted.
+        """
+        if self._auth_failed or time.monotonic() - self._logged_in_at > max_age:
+            return False
+
+        now = time.time()
+        return not any(
+            cookie.expires is not None and cookie.expires <= now
+            for cookie in self._session.cookies
+        )
+
+    def latency_stats(self) -> dict[str, float]:
+        """Return the latency distribution used to pick the hedging threshold. Empty if hedging is off."""
+        return self._hedger.stats() if self._hedger else {}
+
+    def concurrency_stats(self) -> dict[str, float]:
+        """Return the concurrency the adaptive limiter settled on. Empty if it is off."""
+        return self._limiter.stats() if self._limiter else {}
+
     def fetch_food_log(
         self, date: str, meal_type_id: Optional[int] = None
     ) -> Optional[FoodLog]:
@@ -59,14 +181,74 @@ class Asken:
         Returns:
             FoodLog: Parsed food log data.
         """
+        if meal_type_id not in [1, 2, 3, 4, 5]:
+            return None
+
+        if self._cache:
+            hit, food_log = self._cache.get(date, meal_type_id)
+            if hit:
+                self.metrics.increment("cache_hits")
+                return food_log
+
         if meal_type_id in [1, 2, 3]:
-            return self.fetch_one_meal_log(date, meal_type_id)
+            food_log = self.fetch_one_meal_log(date, meal_type_id)
         elif meal_type_id == 4:
-            return self.fetch_snack_log(date)
-        elif meal_type_id == 5:
-            return self.fetch_daily_food_log(date)
+            food_log = self.fetch_snack_log(date)
         else:
-            return None
+            food_log = self.fetch_daily_food_log(date)
+
+        if self._cache:
+            self._cache.put(date, meal_type_id, food_log)
+
+        return food_log
+
+    def iter_food_logs(
+        self,
+        start: str,
+        end: str,
+        meal_type_id_list: list[int] = DAILY_MEAL_TYPE_ID_LIST,
+        prefetch: int = 4,
+    ) -> Iterator[FoodLog]:
+        """
+        Yield food logs from start to end in date order (meal type order within a date).
+        Up to `prefetch` logs are fetched ahead in the background while the caller processes earlier ones,
+        so memory stays bounded however long the range is. Meals without a record are skipped.
+        If a fetch fails, its error is raised at the position of that log.
+        Args:
+            start (str): First date in the format 'YYYY-MM-DD'.
+            end (str): Last date in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): Meal type IDs to fetch. Defaults to [1, 2, 3, 4].
+            prefetch (int): Number of logs fetched ahead (and threads fetching them).
+        Yields:
+            FoodLog: Parsed food log data.
+        """
+        if prefetch < 1:
+            raise ValueError("prefetch must be 1 or more.")
+
+        tasks = (
+            (date, meal_type_id)
+            for date in iter_date_range(start, end)
+            for meal_type_id in meal_type_id_list
+        )
+        executor = ThreadPoolExecutor(
+            max_workers=prefetch, thread_name_prefix="asken-prefetch"
+        )
+        window: deque[Future[Optional[FoodLog]]] = deque()
+        try:
+            for date, meal_type_id in itertools.islice(tasks, prefetch):
+                window.append(executor.submit(self.fetch_food_log, date, meal_type_id))
+            while window:
+                food_log = window.popleft().result()
+                # 1件取り出すごとに1件先読みし、先読みの数を一定に保つ
+                for date, meal_type_id in itertools.islice(tasks, 1):
+                    window.append(
+                        executor.submit(self.fetch_food_log, date, meal_type_id)
+                    )
+                if food_log is not None:
+                    yield food_log
+        finally:
+            # 途中で反復をやめた場合、未着手の先読みは行わない
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def fetch_one_meal_log(self, date: str, meal_type_id: int) -> Optional[FoodLog]:
         """
@@ -81,21 +263,13 @@ class Asken:
             f"{self._url}/wsp/advice/{date}/{MEAL_TYPES[meal_type_id]['asken_id']}"
         )
 
-        response = self._session.get(url=advice_url, headers=self._headers())
-        response.raise_for_status()
+        response = self._get(advice_url)
 
         html = response.text
         if "食事記録が無いためアドバイスが計算できません" in html:
             return None
 
-        nutritions = self._scrape_food_log(html)
-        nutritions["meal_type_id"] = meal_type_id
-        nutritions["date"] = date
-
-        food_log = FoodLog(**nutritions)
-        food_log.logged = True
-
-        return food_log
+        return self._parse_food_log(html, date, meal_type_id)
 
     def fetch_daily_food_log(self, date: str) -> Optional[FoodLog]:
         """
@@ -106,21 +280,13 @@ class Asken:
             FoodLog: Parsed food log data.
         """
         advice_url = f"{self._url}/wsp/advice/{date}"
-        response = self._session.get(url=advice_url, headers=self._headers())
-        response.raise_for_status()
+        response = self._get(advice_url)
 
         html = response.text
         if "食事記録が無いためアドバイスが計算できません" in html:
             return None
 
-        nutritions = self._scrape_food_log(html)
-        nutritions["meal_type_id"] = 5  # Set meal type ID for daily log
-        nutritions["date"] = date
-
-        food_log = FoodLog(**nutritions)
-        food_log.logged = True
-
-        return food_log
+        return self._parse_food_log(html, date, 5)  # 5: 1日分
 
     def fetch_snack_log(self, date: str) -> Optional[FoodLog]:
         """
@@ -185,6 +351,37 @@ class Asken:
 
         return FoodLog(**nutritions) if exists_log else None  # type: ignore
 
+    def _parse_food_log(self, html: str, date: str, meal_type_id: int) -> FoodLog:
+        """
+        Parse an advice page which has a food log.
+        If the nutrition block has the same fingerprint as the last page of the date and meal,
+        the last result is returned without parsing the page.
+        """
+        key = (date, meal_type_id)
+        digest = nutrition_block_fingerprint(html)
+        with self._parsed_lock:
+            parsed = self._parsed.get(key)
+            if digest and parsed and parsed[0] == digest:
+                self._parsed.move_to_end(key)
+                self.metrics.increment("parse_skips")
+                return parsed[1].model_copy()
+
+        nutritions = self._scrape_food_log(html)
+        nutritions["meal_type_id"] = meal_type_id
+        nutritions["date"] = date
+
+        food_log = FoodLog(**nutritions)
+        food_log.logged = True
+
+        if digest:
+            with self._parsed_lock:
+                self._parsed[key] = (digest, food_log.model_copy())
+                self._parsed.move_to_end(key)
+                while len(self._parsed) > PARSED_PAGE_CACHE_SIZE:
+                    self._parsed.popitem(last=False)
+
+        return food_log
+
     def _scrape_food_log(self, html: str) -> dict:
         """
         Scrape food log data from HTML content.
@@ -1,56 +1,89 @@
 from typing import Optional
-
-import requests
-from requests.exceptions import RequestException
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 from .asken import Asken, FoodLog
+from .audit import DriftAuditor
 from .fitbit import Fitbit
-from .const import MEAL_TYPES
-from .models.fitbit import CreateFoodLogParams, GetFoodLogResponse
-from .utils import get_logger
+from .const import DAILY_SUMMARY_TOLERANCE, DEFAULT_TIMEOUT, MEAL_TYPES
+from .custom_foods import CustomFoodCache
+from .deadline import Deadline, prioritize_dates
+from .journal import WriteJournal
+from .ledger import SyncLedger
+from .metrics import Metrics, diff, timer
+from .models.sync import (
+    DayDrift,
+    MealSyncResult,
+    SinkStats,
+    SyncReport,
+    UpstreamStats,
+)
+from .pipeline import FoodLogMessage, MessageQueue, ResultCallback, run_pipeline
+from .sinks import FitbitSink, FoodLogSink
+from .utils import get_logger, safe_api_call
 
 
 logger = get_logger(__name__)
 
 
-def safe_api_call(api_name=""):
-    """
-    A wrapper to safely call API functions and handle exceptions.
-    Args:
-        func (callable): The API function to call.
-        *args: Positional arguments for the function.
-        **kwargs: Keyword arguments for the function.
-    Returns:
-        The result of the API call or None if an error occurs.
-    """
-
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            try:
-                return func(*args, **kwargs)
-            except RequestException as e:
-                logger.error(
-                    f"{api_name} API request error: {e} (func={func.__name__}, args={args}, kwargs={kwargs})",
-                    exc_info=True,
-                )
-                raise
-            except Exception as e:
-                logger.error(
-                    f"Unexpected error in {api_name}: {e} (func={func.__name__}, args={args}, kwargs={kwargs})",
-                    exc_info=True,
-                )
-                raise
-
-        return wrapper
-
-    return decorator
-
-
 class AskenFitbitSync:
-    def __init__(self, asken: Asken, fitbit: Fitbit):
+    def __init__(
+        self,
+        asken: Asken,
+        fitbit: Fitbit,
+        dry_run: bool = False,
+        sinks: Optional[list[FoodLogSink]] = None,
+        precheck: bool = True,
+        request_budget: float = sum(DEFAULT_TIMEOUT),
+        custom_foods: Optional[CustomFoodCache] = None,
+        ledger: Optional[SyncLedger] = None,
+        journal: Optional[WriteJournal] = None,
+    ):
+        """
+        Args:
+            asken (Asken): Asken client.
+            fitbit (Fitbit): Fitbit client. Food logs are always written to Fitbit.
+            dry_run (bool): If True, nothing is written to Fitbit.
+            sinks (Optional[list[FoodLogSink]]): Additional destinations of the scraped food logs.
+            precheck (bool): If True, compare daily totals first and skip the meals when they already match.
+                Only used when Fitbit is the only destination.
+            request_budget (float): Worst-case seconds of one HTTP request (connect + read timeout).
+                Work which cannot finish before the deadline within this budget is not started.
+            custom_foods (Optional[CustomFoodCache]): If given, Fitbit custom foods are reused by foodId.
+            ledger (Optional[SyncLedger]): If given, meals unchanged since the last sync are skipped without
+                fetching Fitbit, and changed meals are replaced by the logId in the ledger. The precheck is not used.
+            journal (Optional[WriteJournal]): If given, writes to Fitbit are journaled before they run,
+                and writes left unfinished by an interrupted run are finished at the start of the next sync.
+        """
         self._asken = asken
         self._fitbit = fitbit
+        self._dry_run = dry_run  # Trueの場合、Fitbitへの書き込みを行わない
+        self._request_budget = request_budget
+        self._fitbit_sink = FitbitSink(
+            fitbit,
+            dry_run=dry_run,
+            request_budget=request_budget,
+            custom_foods=custom_foods,
+            ledger=ledger,
+            journal=journal,
+        )
+        self._ledger = ledger
+        self._sinks: list[FoodLogSink] = [self._fitbit_sink, *(sinks or [])]
+        self._precheck = precheck and not sinks and ledger is None
+
+    @property
+    def sinks(self) -> list[FoodLogSink]:
+        return self._sinks
+
+    @property
+    def fitbit_sink(self) -> FitbitSink:
+        return self._fitbit_sink
+
+    @property
+    def asken_auth_failed(self) -> bool:
+        """True if Asken rejected the session during a sync, i.e. a new login is needed."""
+        return isinstance(self._asken, Asken) and self._asken.auth_failed
 
     @safe_api_call("Asken")
     def fetch_asken_food_log(self, date: str, meal_type_id: int) -> Optional[FoodLog]:
@@ -64,99 +97,320 @@ class AskenFitbitSync:
         """
         return self._asken.fetch_food_log(date, meal_type_id)
 
-    @safe_api_call("Fitbit")
-    def fetch_fitbit_food_log(self, date: str) -> Optional[GetFoodLogResponse]:
+    def is_daily_total_synced(self, date: str) -> bool:
         """
-        Fetch food log from Fitbit for a specific date.
+        Check whether Fitbit's daily summary already matches Asken's daily total.
+        Only true when all foods in Fitbit were registered by this tool, so two requests decide
+        whether any meal needs to be synced.
         Args:
             date (str): Date in the format 'YYYY-MM-DD'.
         Returns:
-            GetFoodLogResponse: Parsed food log data.
+            bool: True if nothing needs to be synced.
         """
-        return self._fitbit.fetch_food_log(date)
+        fitbit_food_logs = self._fitbit_sink.prefetch_food_log(date)
+        if not fitbit_food_logs:
+            return False
+
+        names = {meal_type["name"] for meal_type in MEAL_TYPES.values()}
+        if any(food.loggedFood.name not in names for food in fitbit_food_logs.foods):
+            return False
 
-    @safe_api_call("Fitbit")
-    def delete_fitbit_food_log(self, food_log_id: int) -> requests.Response:
+        daily_log = self.fetch_asken_food_log(date, 5)
+        if not daily_log:
+            return not fitbit_food_logs.foods
+
+        summary = fitbit_food_logs.summary
+        return all(
+            abs(float(getattr(summary, key)) - float(getattr(daily_log, key)))
+            <= tolerance
+            for key, tolerance in DAILY_SUMMARY_TOLERANCE.items()
+        )
+
+    def sync_food_logs(
+        self,
+        date: str,
+        meal_type_id_list: list[int] = [1, 2, 3, 4],
+        deadline: Optional[Deadline] = None,
+    ) -> SyncReport:
         """
-        Delete a food log from Fitbit by its ID.
+        Sync food logs for a specific date and meal type IDs.
         Args:
-            food_log_id (int): The ID of the food log to delete.
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): List of meal type IDs to sync. Defaults to [1, 2, 3, 4] (朝食, 昼食, 夕食, 間食).
+            deadline (Optional[Deadline]): Work which cannot finish before the deadline is not started.
+        Returns:
+            SyncReport: Result of each meal type and sink with timings and call counts.
         """
-        return self._fitbit.delete_food_log(food_log_id)
+        return self.sync_dates([date], meal_type_id_list, deadline)
 
-    @safe_api_call("Fitbit")
-    def create_fitbit_food_log(self, params: CreateFoodLogParams) -> dict:
+    def sync_dates(
+        self,
+        dates: list[str],
+        meal_type_id_list: list[int] = [1, 2, 3, 4],
+        deadline: Optional[Deadline] = None,
+    ) -> SyncReport:
         """
-        Create a food log in Fitbit.
+        Sync food logs of dates in priority order (today first, then newest to oldest).
+        When the deadline comes, remaining work is skipped and reported in `pending_dates` so that it can be resumed.
         Args:
-            params (CreateFoodLogParams): Parameters for creating the food log.
+            dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): List of meal type IDs to sync. Defaults to [1, 2, 3, 4] (朝食, 昼食, 夕食, 間食).
+            deadline (Optional[Deadline]): Work which cannot finish before the deadline is not started.
+        Returns:
+            SyncReport: Result of each meal type and sink with timings and call counts.
         """
-        return self._fitbit.create_food_log(params)
+        deadline = deadline or Deadline()
+        self._fitbit_sink.deadline = deadline
 
-    def sync_food_logs(
-        self, date: str, meal_type_id_list: list[int] = [1, 2, 3, 4]
-    ) -> None:
+        report = SyncReport(dates=prioritize_dates(dates))
+        before = self._snapshot_metrics()
+        with timer(report.phases, "total"):
+            with timer(report.phases, "recover"):
+                # 前回の実行が削除と再登録の間で終了した食事を、Fitbitを取得せずに再登録する
+                report.meals.extend(self._fitbit_sink.recover())
+            for date in report.dates:
+                report.meals.extend(
+                    self.iter_sync_food_logs(
+                        date, meal_type_id_list, report=report, deadline=deadline
+                    )
+                )
+            with timer(report.phases, "prune"):
+                self._fitbit_sink.prune_custom_foods()
+        self._fill_metrics(report, before)
+        self._set_pending_dates(report)
+
+        return report
+
+    def compact_dates(
+        self,
+        dates: list[str],
+        meal_type_id_list: list[int] = [1, 2, 3, 4],
+        deadline: Optional[Deadline] = None,
+    ) -> SyncReport:
         """
-        Sync food logs for a specific date and meal type IDs.
+        Delete duplicate entries registered by this tool in Fitbit, without scraping Asken.
+        Args:
+            dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): List of meal type IDs to compact. Defaults to [1, 2, 3, 4] (朝食, 昼食, 夕食, 間食).
+            deadline (Optional[Deadline]): Work which cannot finish before the deadline is not started.
+        Returns:
+            SyncReport: Result of each meal type. `duplicates_deleted` has the number of deleted entries.
+        """
+        deadline = deadline or Deadline()
+        self._fitbit_sink.deadline = deadline
+
+        report = SyncReport(dates=prioritize_dates(dates))
+        before = self._snapshot_metrics()
+        with timer(report.phases, "compact"):
+            for date in report.dates:
+                if not deadline.has_time_for(2 * self._request_budget):
+                    report.meals.extend(self._deferred_results(date, meal_type_id_list))
+                    continue
+                try:
+                    report.meals.extend(
+                        self._fitbit_sink.compact(date, meal_type_id_list)
+                    )
+                except Exception as e:
+                    report.meals.extend(
+                        self._fitbit_sink.failed_results(
+                            date, dict.fromkeys(meal_type_id_list), e
+                        )
+                    )
+        self._fill_metrics(report, before)
+        self._set_pending_dates(report)
+
+        return report
+
+    def audit(self, start: str, end: str) -> list[DayDrift]:
+        """
+        Find days whose Fitbit calorie total drifts from Asken's daily total, so that only those are synced again.
+        Args:
+            start (str): First date in the format 'YYYY-MM-DD'.
+            end (str): Last date in the format 'YYYY-MM-DD'.
+        Returns:
+            list[DayDrift]: Days which drift beyond the tolerance.
+        """
+        drifts = DriftAuditor(self._asken, self._fitbit).audit(start, end)
+        if self._ledger:
+            # Fitbit側で変更された日は、台帳を信用せず取得して比較する
+            for drift in drifts:
+                self._ledger.forget(drift.date)
+
+        return drifts
+
+    @staticmethod
+    def _set_pending_dates(report: SyncReport) -> None:
+        report.pending_dates = sorted(
+            {meal.date for meal in report.meals if meal.reason == "deadline"},
+            key=report.dates.index,
+        )
+        if report.pending_dates:
+            logger.warning("Deadline reached. Pending dates: %s", report.pending_dates)
+
+    def iter_sync_food_logs(
+        self,
+        date: str,
+        meal_type_id_list: list[int] = [1, 2, 3, 4],
+        report: Optional[SyncReport] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Iterator[MealSyncResult]:
+        """
+        Scrape food logs of a specific date once and publish them to all sinks concurrently.
+        Results are yielded as soon as each sink finishes.
         Args:
             date (str): Date in the format 'YYYY-MM-DD'.
             meal_type_id_list (list[int]): List of meal type IDs to sync. Defaults to [1, 2, 3, 4] (朝食, 昼食, 夕食, 間食).
+            report (Optional[SyncReport]): If given, wall time of each phase is added to it.
+            deadline (Optional[Deadline]): Meals which cannot be synced before the deadline are skipped.
+        Yields:
+            MealSyncResult: Result of each meal type and sink.
         """
+        phases = report.phases if report else {}
+        deadline = deadline or Deadline()
 
-        food_logs: GetFoodLogResponse = self.fetch_fitbit_food_log(date)
-        if not food_logs:
+        # 事前チェック(Fitbit・あすけん各1リクエスト)の時間がなければ何もしない
+        if not deadline.has_time_for(2 * self._request_budget):
+            yield from self._deferred_results(date, meal_type_id_list)
             return
 
-        for meal_type_id in meal_type_id_list:
-            meal: FoodLog = self.fetch_asken_food_log(date, meal_type_id)
-            if not meal or not meal.logged:
-                logger.info(
-                    f"No food log found for date {date} and meal type {meal_type_id}."
-                )
-                continue
+        if self._precheck:
+            with timer(phases, "precheck"):
+                in_sync = self.is_daily_total_synced(date)
+            if in_sync:
+                logger.info("Daily totals already match on %s", date)
+                self._fitbit_sink.discard_prefetched(date)
+                for meal_type_id in meal_type_id_list:
+                    yield MealSyncResult(
+                        date=date,
+                        meal_type_id=meal_type_id,
+                        status="skipped",
+                        sink=self._fitbit_sink.name,
+                        reason="in_sync",
+                        dry_run=self._dry_run,
+                    )
+                return
 
-            is_registered = False
-            for food_log in food_logs.foods:
-                if (
-                    food_log.loggedFood.mealTypeId
-                    == MEAL_TYPES[meal_type_id]["fitbit_id"]
+        food_logs: dict[int, Optional[FoodLog]] = {}
+        deferred: list[int] = []
+        with timer(phases, "scrape"):
+            for meal_type_id in meal_type_id_list:
+                if deferred or not deadline.has_time_for(
+                    self._meal_budget(meal_type_id)
                 ):
-                    registered_log = food_log.loggedFood
-                    food_log_id = food_log.logId
-                    is_registered = True
-
-            # updateではPFC情報が更新できないため、削除して再登録
-            if is_registered:
-                if registered_log.calories != meal.calories:
-                    logger.info(f"Delete {MEAL_TYPES[meal_type_id]['name']} on {date}")
-                    res = self.delete_fitbit_food_log(food_log_id)
-                    if not res:
-                        continue
-                else:
-                    logger.info(
-                        f"Already registered {MEAL_TYPES[meal_type_id]['name']} on {date}"
-                    )
+                    deferred.append(meal_type_id)
                     continue
+                food_logs[meal_type_id] = self.fetch_asken_food_log(date, meal_type_id)
 
-            params = CreateFoodLogParams(
-                **{
-                    "foodName": MEAL_TYPES[meal_type_id]["name"],
-                    "mealTypeId": MEAL_TYPES[meal_type_id]["fitbit_id"],
-                    "unitId": 304,  # 単位: 食分
-                    "amount": 1,
-                    "date": date,
-                    "calories": meal.calories,
-                    "protein": meal.protein,
-                    "totalFat": meal.fat,
-                    "totalCarbohydrate": meal.carbs,
-                }
+        yield from self._deferred_results(date, deferred)
+        if not food_logs:
+            self._fitbit_sink.discard_prefetched(date)
+            return
+
+        def publish(sink: FoodLogSink) -> list[MealSyncResult]:
+            with timer(phases, f"publish:{sink.name}"):
+                return sink.publish(date, food_logs)
+
+        with ThreadPoolExecutor(max_workers=len(self._sinks)) as executor:
+            futures = [executor.submit(publish, sink) for sink in self._sinks]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def _meal_budget(self, meal_type_id: int) -> float:
+        """Worst-case seconds to scrape a meal and replace it in Fitbit (GET, delete and create)."""
+        # 間食は1日分と朝昼夕の4ページから算出する
+        pages = 4 if meal_type_id == 4 else 1
+        return (pages + 3) * self._request_budget
+
+    def _deferred_results(
+        self, date: str, meal_type_id_list: list[int]
+    ) -> list[MealSyncResult]:
+        return [
+            MealSyncResult(
+                date=date,
+                meal_type_id=meal_type_id,
+                status="skipped",
+                reason="deadline",
+                dry_run=self._dry_run,
             )
+            for meal_type_id in meal_type_id_list
+        ]
 
-            res = self.create_fitbit_food_log(params)
-            if not res:
+    def _snapshot_metrics(self) -> dict[str, dict[str, int]]:
+        snapshots = {}
+        for name, client in (("asken", self._asken), ("fitbit", self._fitbit)):
+            metrics = getattr(client, "metrics", None)
+            if isinstance(metrics, Metrics):
+                snapshots[name] = metrics.snapshot()
+        for sink in self._sinks:
+            snapshots[f"sink:{sink.name}"] = sink.stats.model_dump(exclude={"name"})
+
+        return snapshots
+
+    def _fill_metrics(
+        self, report: SyncReport, before: dict[str, dict[str, int]]
+    ) -> None:
+        """Add counters and sink statistics increased since `before` to the report."""
+        for name, after in self._snapshot_metrics().items():
+            counters = diff(after, before.get(name, {}))
+            if name.startswith("sink:"):
+                report.sinks.append(SinkStats(name=name[5:], **counters))
                 continue
 
-            logger.info(f"Create {MEAL_TYPES[meal_type_id]['name']} on {date}")
+            report.upstreams[name] = UpstreamStats(
+                calls=counters.get("calls", 0), bytes=counters.get("bytes", 0)
+            )
+            report.token_refreshes += counters.get("token_refreshes", 0)
+            report.cache_hits += counters.get("cache_hits", 0)
+
+        if isinstance(self._asken, Asken):
+            latency = self._asken.latency_stats()
+            if latency:
+                report.latency["asken"] = latency
+        concurrency = self.concurrency_stats()
+        if concurrency:
+            report.concurrency["asken"] = concurrency
+
+    def concurrency_stats(self) -> dict[str, float]:
+        """Return the concurrency Asken's adaptive limiter settled on. Empty if it is off."""
+        return self._asken.concurrency_stats() if isinstance(self._asken, Asken) else {}
+
+    def sync_food_logs_pipelined(
+        self,
+        dates: list[str],
+        meal_type_id_list: list[int] = [1, 2, 3, 4],
+        queue: Optional[MessageQueue] = None,
+        scrape_workers: int = 2,
+        write_workers: int = 2,
+        batch_size: int = 10,
+        on_result: Optional[ResultCallback] = None,
+    ) -> list[FoodLogMessage]:
+        """
+        Sync food logs of many dates with the scrape stage and the write stage decoupled by a queue,
+        so a slow or failing sink never stalls scraping.
+        Args:
+            dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): List of meal type IDs to sync. Defaults to [1, 2, 3, 4] (朝食, 昼食, 夕食, 間食).
+            queue (Optional[MessageQueue]): Queue between the stages. Defaults to an in-memory queue.
+            scrape_workers (int): Number of threads scraping Asken.
+            write_workers (int): Number of threads writing to the sinks.
+            batch_size (int): Number of messages sent/received at once.
+            on_result (Optional[ResultCallback]): Called with each result as soon as it is available.
+        Returns:
+            list[FoodLogMessage]: Messages which could not be written (dead letters).
+        """
+        tasks = [
+            (date, meal_type_id) for date in dates for meal_type_id in meal_type_id_list
+        ]
+        return run_pipeline(
+            self.fetch_asken_food_log,
+            self._sinks,
+            tasks,
+            queue=queue,
+            scrape_workers=scrape_workers,
+            write_workers=write_workers,
+            batch_size=batch_size,
+            on_result=on_result,
+        )
 
     def sync_weight(
         self, date: str, weight: float, body_fat: Optional[float] = None
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .asken import Asken
+from .const import DAILY_SUMMARY_TOLERANCE, FITBIT_TIME_SERIES_MAX_DAYS
+from .fitbit import Fitbit
+from .models.sync import DayDrift
+from .utils import date_range, get_logger
+
+
+logger = get_logger(__name__)
+
+
+class DriftAuditor:
+    """
+    Find days whose Fitbit calorie total differs from Asken's daily total.
+
+    Fitbit totals of the whole range are fetched with the caloriesIn time series (one request per 1095 days),
+    and Asken is read one daily page per day. Give Asken a FoodLogCache so that repeated audits
+    of old dates do not download the pages again.
+    """
+
+    def __init__(
+        self,
+        asken: Asken,
+        fitbit: Fitbit,
+        tolerance: float = DAILY_SUMMARY_TOLERANCE["calories"],
+        workers: int = 4,
+    ):
+        """
+        Args:
+            asken (Asken): Asken client.
+            fitbit (Fitbit): Fitbit client.
+            tolerance (float): Days whose difference of calories is within this value are in sync.
+            workers (int): Number of threads fetching Asken pages.
+        """
+        self._asken = asken
+        self._fitbit = fitbit
+        self._tolerance = tolerance
+        self._workers = workers
+
+    def fetch_fitbit_calories(self, start: str, end: str) -> dict[str, float]:
+        """Return Fitbit's calories in of each date, splitting the range by the API limit."""
+        calories: dict[str, float] = {}
+        chunk_start = datetime.strptime(start, "%Y-%m-%d")
+        last = datetime.strptime(end, "%Y-%m-%d")
+        while chunk_start <= last:
+            chunk_end = min(
+                chunk_start + timedelta(days=FITBIT_TIME_SERIES_MAX_DAYS - 1), last
+            )
+            calories |= self._fitbit.fetch_calories_in_series(
+                chunk_start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d")
+            )
+            chunk_start = chunk_end + timedelta(days=1)
+
+        return calories
+
+    def _asken_calories(self, date: str) -> float:
+        daily_log = self._asken.fetch_food_log(date, 5)
+        return float(daily_log.calories) if daily_log else 0.0
+
+    def audit(self, start: str, end: str) -> list[DayDrift]:
+        """
+        Compare daily calorie totals of the range.
+        Args:
+            start (str): First date in the format 'YYYY-MM-DD'.
+            end (str): Last date in the format 'YYYY-MM-DD'.
+        Returns:
+            list[DayDrift]: Days which drift beyond the tolerance, in date order.
+        """
+        dates = date_range(start, end)
+        fitbit_calories = self.fetch_fitbit_calories(start, end)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            asken_calories = dict(zip(dates, executor.map(self._asken_calories, dates)))
+
+        drifts = []
+        for date in dates:
+            fitbit = fitbit_calories.get(date, 0.0)
+            difference = fitbit - asken_calories[date]
+            if abs(difference) > self._tolerance:
+                drifts.append(
+                    DayDrift(
+                        date=date,
+                        asken_calories=asken_calories[date],
+                        fitbit_calories=fitbit,
+                        difference=difference,
+                    )
+                )
+
+        logger.info(
+            "%d of %d days drift between %s and %s", len(drifts), len(dates), start, end
+        )
+
+        return drifts
@@ -0,0 +1,171 @@
+from typing import Optional
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .const import (
+    CACHE_MAX_BYTES,
+    CACHE_RECENT_DAYS,
+    CACHE_TTL_OLD,
+    CACHE_TTL_RECENT,
+    CACHE_TTL_TODAY,
+)
+from .models.asken import FoodLog
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "asken-fitbit-sync")
+
+
+class FoodLogCache:
+    """
+    On-disk cache of food logs parsed from Asken pages.
+
+    One JSON file per (account, date, meal). The TTL depends on how old the date is:
+    today's meals are still being logged, while those of a few days ago rarely change.
+    File mtime is the last access time and the least recently used files are evicted
+    when the cache exceeds `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        account: str,
+        max_bytes: int = CACHE_MAX_BYTES,
+        refresh: bool = False,
+    ):
+        """
+        Args:
+            directory (str): Cache directory. Shared by accounts.
+            account (str): Account (e.g. email address). Only its hash is written to disk.
+            max_bytes (int): Maximum total size of the cache files.
+            refresh (bool): If True, cached entries are never read but refreshed by new fetches.
+        """
+        self._directory = directory
+        self._account_dir = os.path.join(
+            directory, hashlib.sha256(account.encode()).hexdigest()[:16]
+        )
+        self._max_bytes = max_bytes
+        self._refresh = refresh
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # 初回の書き込み時に集計する
+        os.makedirs(self._account_dir, exist_ok=True)
+
+    def _path(self, date: str, meal_type_id: int) -> str:
+        return os.path.join(self._account_dir, f"{date}_{meal_type_id}.json")
+
+    @staticmethod
+    def ttl(date: str, today: Optional[str] = None) -> float:
+        """Return the TTL seconds of a date's entries."""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        if date >= today:
+            return CACHE_TTL_TODAY
+
+        recent = datetime.strptime(today, "%Y-%m-%d") - timedelta(
+            days=CACHE_RECENT_DAYS
+        )
+        if date >= recent.strftime("%Y-%m-%d"):
+            return CACHE_TTL_RECENT
+
+        return CACHE_TTL_OLD
+
+    def get(self, date: str, meal_type_id: int) -> tuple[bool, Optional[FoodLog]]:
+        """
+        Get a cached food log.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id (int): Meal type ID (1: 朝食, 2: 昼食, 3: 夕食, 4: 間食, 5: 1日分).
+        Returns:
+            tuple[bool, Optional[FoodLog]]: Whether it was cached, and the food log (None if the meal is not logged).
+        """
+        if self._refresh:
+            return False, None
+
+        path = self._path(date, meal_type_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+
+        if time.time() - entry["cached_at"] > self.ttl(date):
+            return False, None
+
+        try:
+            os.utime(path)  # LRUのためアクセス時刻を更新
+        except OSError:
+            pass
+        food_log = entry["food_log"]
+
+        return True, FoodLog(**food_log) if food_log else None
+
+    def put(self, date: str, meal_type_id: int, food_log: Optional[FoodLog]) -> None:
+        """
+        Cache a food log. None is cached as "not logged".
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id (int): Meal type ID (1: 朝食, 2: 昼食, 3: 夕食, 4: 間食, 5: 1日分).
+            food_log (Optional[FoodLog]): Food log to cache.
+        """
+        body = json.dumps(
+            {
+                "cached_at": time.time(),
+                "food_log": food_log.model_dump(mode="json") if food_log else None,
+            }
+        ).encode()
+        path = self._path(date, meal_type_id)
+
+        with self._lock:
+            size = self._current_size()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+
+            # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+            fd, tmp_path = tempfile.mkstemp(dir=self._account_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+
+            self._size = size + len(body)
+            if self._size > self._max_bytes:
+                self._evict()
+
+    def _files(self) -> list[os.DirEntry]:
+        files: list[os.DirEntry] = []
+        for account in os.scandir(self._directory):
+            if account.is_dir():
+                files.extend(
+                    entry
+                    for entry in os.scandir(account.path)
+                    if entry.name.endswith(".json")
+                )
+        return files
+
+    def _current_size(self) -> int:
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in self._files())
+        return self._size
+
+    def _evict(self) -> None:
+        """Remove least recently used files until the cache fits in max_bytes."""
+        assert self._size is not None
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        for entry in files:
+            if self._size <= self._max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+            logger.debug("Evicted %s from food log cache", entry.name)
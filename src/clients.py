@@ -0,0 +1,125 @@
+from typing import Any, Optional
+from collections.abc import Callable
+import hashlib
+import threading
+
+from .asken import Asken
+from .const import ASKEN_SESSION_MAX_AGE
+from .fitbit import Fitbit
+from .ledger import SqliteLedger
+from .metrics import Metrics
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def credentials_fingerprint(*values: str) -> str:
+    """Return a hash of the credentials, so that changes are detected without keeping them in plain text."""
+    return hashlib.sha256("\0".join(values).encode()).hexdigest()
+
+
+class ClientRegistry:
+    """
+    Authenticated clients of each account, kept between warm invocations.
+    A client is reused while its credentials are unchanged and it passes a health check which sends no request,
+    so a warm invocation skips the Asken login and reuses the kept-alive connections.
+    """
+
+    def __init__(self, asken_max_age: float = ASKEN_SESSION_MAX_AGE):
+        """
+        Args:
+            asken_max_age (float): Seconds after the login beyond which an Asken session is replaced.
+        """
+        self._asken_max_age = asken_max_age
+        # (種類, アカウント) -> (クライアント, 認証情報の指紋)
+        self._entries: dict[tuple[str, str], tuple[Any, str]] = {}
+        self._lock = threading.Lock()
+        self.metrics = Metrics()
+
+    def asken(self, account: str, password: str, login: Callable[[], Asken]) -> Asken:
+        """
+        Return the Asken client of the account, logging in with `login` if none can be reused.
+        Args:
+            account (str): Mail address of the account.
+            password (str): Password. A different password from the kept client's forces a new login.
+            login (Callable[[], Asken]): Creates a logged-in client.
+        """
+        return self._get(
+            "asken",
+            account,
+            credentials_fingerprint(account, password),
+            login,
+            lambda client: client.is_session_alive(self._asken_max_age),
+        )
+
+    def fitbit(
+        self, account: str, client_id: str, create: Callable[[], Fitbit]
+    ) -> Fitbit:
+        """
+        Return the Fitbit client of the account, creating it with `create` if none can be reused.
+        Tokens are not part of the check: an expired access token is refreshed by the client on 401,
+        and tokens refreshed by another process are adopted from the token store.
+        Args:
+            account (str): Mail address of the account.
+            client_id (str): Client ID of the Fitbit app. A different one forces a new client.
+            create (Callable[[], Fitbit]): Creates a client.
+        """
+        return self._get(
+            "fitbit", account, credentials_fingerprint(client_id), create, None
+        )
+
+    def ledger(
+        self, account: str, path: str, open_ledger: Callable[[], SqliteLedger]
+    ) -> SqliteLedger:
+        """
+        Return the ledger of the account, opening it with `open_ledger` if none is open for the path,
+        so that warm invocations share one connection instead of opening a new one every time.
+        Args:
+            account (str): Mail address of the account.
+            path (str): SQLite file. A different one closes the kept ledger and opens a new one.
+            open_ledger (Callable[[], SqliteLedger]): Opens the ledger.
+        """
+        with self._lock:
+            entry = self._entries.get(("ledger", account))
+        ledger = self._get("ledger", account, path, open_ledger, None)
+        if entry and entry[0] is not ledger:
+            entry[0].close()
+
+        return ledger
+
+    def invalidate(self, account: str, kind: Optional[str] = None) -> None:
+        """Drop the clients of the account ('asken', 'fitbit', 'ledger' or all if None)."""
+        with self._lock:
+            for key in list(self._entries):
+                if key[1] == account and kind in (None, key[0]):
+                    client = self._entries.pop(key)[0]
+                    if isinstance(client, SqliteLedger):
+                        client.close()
+
+    def _get(
+        self,
+        kind: str,
+        account: str,
+        fingerprint: str,
+        create: Callable[[], Any],
+        healthy: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        with self._lock:
+            entry = self._entries.get((kind, account))
+        if entry and entry[1] == fingerprint:
+            if healthy is None or healthy(entry[0]):
+                self.metrics.increment(f"{kind}_reuses")
+                logger.debug("Reusing %s client of %s", kind, account)
+                return entry[0]
+            logger.info("Replacing unhealthy %s client of %s", kind, account)
+        elif entry:
+            logger.info("Credentials of %s changed. Replacing %s client", account, kind)
+
+        # ログインは時間がかかるためロックの外で行う。同時に作られた場合は後勝ち
+        client = create()
+        self.metrics.increment(f"{kind}_creations")
+        with self._lock:
+            self._entries[(kind, account)] = (client, fingerprint)
+
+        return client
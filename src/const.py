@@ -35,6 +35,48 @@ MEAL_TYPES: dict[int, dict[str, Any]] = {
 
 DAILY_MEAL_TYPE_ID_LIST: list[int] = [1, 2, 3, 4]  # 朝食, 昼食, 夕食, 間食
 
+# requestsのタイムアウト(接続, 読み込み)秒
+DEFAULT_TIMEOUT: tuple[float, float] = (3.05, 10.0)
+
+# Fitbitの1日の合計とあすけんの1日分の栄養素が一致しているとみなす誤差
+# あすけんは食事ごとに小数点1桁で丸めるため、1日分の合計とは丸め誤差が生じる
+DAILY_SUMMARY_TOLERANCE: dict[str, float] = {
+    "calories": 1.0,
+    "protein": 0.5,
+    "fat": 0.5,
+    "carbs": 0.5,
+}
+
+# あすけんのページキャッシュの有効期間(秒)。数日経った日の記録はほとんど変わらない
+CACHE_TTL_TODAY: float = 10 * 60
+CACHE_TTL_RECENT: float = 24 * 60 * 60  # 過去CACHE_RECENT_DAYS日以内
+CACHE_TTL_OLD: float = 365 * 24 * 60 * 60
+CACHE_RECENT_DAYS = 7
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 栄養素の指紋が前回と同じページの解析結果を、日付と食事ごとにメモリに残す数
+PARSED_PAGE_CACHE_SIZE = 512
+
+# この日数以上記録に使われていないカスタム食品はFitbitから削除する
+CUSTOM_FOOD_MAX_AGE_DAYS = 90
+
+# 1日あたりに削除する重複登録の上限。残りは次回の同期で削除する
+COMPACTION_BATCH_SIZE = 10
+
+# Fitbitの時系列APIで1回に取得できる最大日数
+FITBIT_TIME_SERIES_MAX_DAYS = 1095
+
+# 認証情報を保存するSecrets Managerのシークレット名(単一アカウントで実行する場合)
+SECRET_ID = "askenFitbitSync"
+
+# Lambda関数の最大実行時間(秒)。ワーカーの同期呼び出しの読み込みタイムアウトに使う
+LAMBDA_MAX_TIMEOUT = 900.0
+
+# オンデマンド同期で、最初のトリガーの後にまとめて同期するトリガーを待つ秒数
+TRIGGER_WINDOW = 5.0
+
+# ウォームスタートで使い回すあすけんのセッションを信用する秒数
+ASKEN_SESSION_MAX_AGE = 30 * 60.0
+
 
 NUTRITIONS: dict[str, str] = {
     "エネルギー": "calories",
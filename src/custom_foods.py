@@ -0,0 +1,117 @@
+from typing import Optional
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+
+from .models.asken import FoodLog
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class CustomFoodCache:
+    """
+    Fitbit custom foods created by this tool, keyed by meal type and nutrient values.
+
+    Logging an existing food by foodId avoids creating a new custom food on every write,
+    which would make the user's food database grow forever.
+    The cache is persisted as JSON when a path is given.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (Optional[str]): JSON file to persist the cache. If None, the cache lives only in memory.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        # key -> {"food_id": int, "last_used": "YYYY-MM-DD"}
+        self._foods: dict[str, dict] = {}
+        self.last_pruned: Optional[str] = None
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._foods = data.get("foods", {})
+            self.last_pruned = data.get("last_pruned")
+
+    @staticmethod
+    def key(meal_type_id: int, food_log: FoodLog) -> str:
+        # Fitbitに登録する値(カロリーは整数)で丸める
+        return ":".join(
+            [
+                str(meal_type_id),
+                str(int(food_log.calories)),
+                *(
+                    f"{float(value):.1f}"
+                    for value in (food_log.protein, food_log.fat, food_log.carbs)
+                ),
+            ]
+        )
+
+    def get(self, meal_type_id: int, food_log: FoodLog) -> Optional[int]:
+        """Return the foodId of a custom food with the same meal type and nutrients."""
+        with self._lock:
+            food = self._foods.get(self.key(meal_type_id, food_log))
+        return food["food_id"] if food else None
+
+    def put(
+        self,
+        meal_type_id: int,
+        food_log: FoodLog,
+        food_id: int,
+        today: Optional[str] = None,
+    ) -> None:
+        """
+        Record that a custom food was logged.
+        Args:
+            today (Optional[str]): Day of the use in the format 'YYYY-MM-DD'. Defaults to the current date.
+                Not the date of the food log: a food logged to an old date while backfilling is still in use.
+        """
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        key = self.key(meal_type_id, food_log)
+        with self._lock:
+            last_used = self._foods.get(key, {}).get("last_used", today)
+            self._foods[key] = {
+                "food_id": food_id,
+                "last_used": max(last_used, today),
+            }
+            self._save()
+
+    def invalidate(self, food_id: int) -> None:
+        """Forget a custom food, e.g. when it was deleted in Fitbit."""
+        with self._lock:
+            self._foods = {
+                key: food
+                for key, food in self._foods.items()
+                if food["food_id"] != food_id
+            }
+            self._save()
+
+    def unused(self, max_age_days: int, today: Optional[str] = None) -> list[int]:
+        """Return foodIds which have not been logged for more than max_age_days."""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        threshold = (
+            datetime.strptime(today, "%Y-%m-%d") - timedelta(days=max_age_days)
+        ).strftime("%Y-%m-%d")
+        with self._lock:
+            return [
+                food["food_id"]
+                for food in self._foods.values()
+                if food["last_used"] < threshold
+            ]
+
+    def mark_pruned(self, date: str) -> None:
+        with self._lock:
+            self.last_pruned = date
+            self._save()
+
+    def _save(self) -> None:
+        if not self._path:
+            return
+
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"foods": self._foods, "last_pruned": self.last_pruned}, f)
+        os.replace(tmp_path, self._path)
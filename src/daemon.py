@@ -0,0 +1,288 @@
+"""
+Long-running sync daemon for a home server or a container.
+
+The Asken session, Fitbit connections and caches are kept between runs. Syncs run every --interval seconds
+and can be triggered immediately through a local HTTP endpoint:
+
+    curl -X POST http://127.0.0.1:8765/sync
+    curl -X POST http://127.0.0.1:8765/sync -d '{"dates": ["2024-01-01"]}'
+    curl http://127.0.0.1:8765/status
+
+Usage:
+    python -m src.daemon --credentials credentials.json --mode live --interval 3600 --days 2
+"""
+
+from typing import Optional
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import signal
+import threading
+
+import requests
+
+from .__main__ import load_credentials
+from .asken_fitbit_sync import AskenFitbitSync
+from .cache import DEFAULT_CACHE_DIR
+from .const import DAILY_MEAL_TYPE_ID_LIST
+from .lambda_function import create_syncer, get_token_store
+from .models.sync import SyncReport
+from .utils import flush_logs, get_logger
+
+
+logger = get_logger(__name__)
+
+
+class SyncDaemon:
+    """
+    Run syncs on an internal schedule with a warm syncer.
+    The syncer is created lazily and created again after a run fails, e.g. when the Asken session expired.
+    """
+
+    def __init__(
+        self,
+        create_syncer: Callable[[], AskenFitbitSync],
+        interval: float = 3600.0,
+        days: int = 2,
+        meal_type_id_list: list[int] = DAILY_MEAL_TYPE_ID_LIST,
+    ):
+        """
+        Args:
+            create_syncer (Callable[[], AskenFitbitSync]): Factory of the syncer (logs in to Asken).
+            interval (float): Seconds between scheduled syncs.
+            days (int): Number of days synced by a scheduled run, counting back from today.
+            meal_type_id_list (list[int]): List of meal type IDs to sync.
+        """
+        self._create_syncer = create_syncer
+        self._interval = interval
+        self._days = days
+        self._meal_type_id_list = meal_type_id_list
+        self._syncer: Optional[AskenFitbitSync] = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._requested: list[str] = []  # トリガーで指定された日付
+        self.last_report: Optional[SyncReport] = None
+        self.last_run_at: Optional[str] = None
+
+    def scheduled_dates(self) -> list[str]:
+        today = datetime.now()
+        return [
+            (today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(self._days)
+        ]
+
+    def trigger(self, dates: Optional[list[str]] = None) -> None:
+        """Request an immediate sync. Without dates, the scheduled dates are synced."""
+        with self._lock:
+            self._requested.extend(dates or self.scheduled_dates())
+        self._wakeup.set()
+
+    def run_once(self, dates: Optional[list[str]] = None) -> SyncReport:
+        """Sync the dates (defaults to the scheduled dates) with the warm syncer."""
+        dates = dates or self.scheduled_dates()
+        try:
+            if self._syncer is None:
+                self._syncer = self._create_syncer()
+            report = self._syncer.sync_dates(dates, self._meal_type_id_list)
+        except Exception as e:
+            logger.error("Sync failed: %s", e, exc_info=True)
+            # セッション切れ等に備え、次回はログインからやり直す
+            self._syncer = None
+            report = SyncReport(dates=dates, pending_dates=dates, error=str(e))
+
+        self.last_report = report
+        self.last_run_at = datetime.now().isoformat(timespec="seconds")
+        logger.info(
+            "Synced %s (ok=%s, %.2fs)",
+            report.dates,
+            report.ok,
+            report.phases.get("total", 0.0),
+        )
+        flush_logs()
+
+        return report
+
+    def run(self) -> None:
+        """Run scheduled and triggered syncs until stop is called."""
+        while not self._stop.is_set():
+            # 取り出す前にクリアし、実行中のトリガーを取りこぼさないようにする
+            self._wakeup.clear()
+            with self._lock:
+                dates = sorted(set(self._requested)) or None
+                self._requested.clear()
+            self.run_once(dates)
+            self._wakeup.wait(self._interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+
+def create_trigger_server(
+    daemon: SyncDaemon, host: str = "127.0.0.1", port: int = 8765
+) -> ThreadingHTTPServer:
+    """
+    Create a local HTTP server to trigger a sync and to read the last report.
+    POST /sync (optional JSON body {"dates": [...]}) and GET /status are served.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/sync":
+                self.send_error(404)
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                dates = body.get("dates")
+                if dates is not None and not isinstance(dates, list):
+                    raise ValueError("dates must be a list.")
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+
+            daemon.trigger(dates)
+            self._send_json(202, {"accepted": True})
+
+        def do_GET(self):
+            if self.path != "/status":
+                self.send_error(404)
+                return
+
+            report = daemon.last_report
+            self._send_json(
+                200,
+                {
+                    "last_run_at": daemon.last_run_at,
+                    "report": report.model_dump(mode="json") if report else None,
+                },
+            )
+
+        def _send_json(self, status: int, body: dict):
+            content = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            logger.debug("Trigger server: " + format, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.daemon",
+        description="Keep syncing Asken food logs to Fitbit with warm connections and caches.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=3600.0,
+        help="Seconds between scheduled syncs. Defaults to 3600.",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=2,
+        help="Number of days synced by a scheduled run, counting back from today. Defaults to 2.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["dry-run", "live"],
+        default="dry-run",
+        help="'dry-run' never writes to Fitbit. Defaults to dry-run.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address of the trigger server. Defaults to 127.0.0.1.",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port of the trigger server. 0 disables it. Defaults to 8765.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory of the Asken page cache. Defaults to {DEFAULT_CACHE_DIR}.",
+    )
+    parser.add_argument(
+        "--custom-foods",
+        help="JSON file of Fitbit custom foods, so that meals with the same nutrients reuse a food.",
+    )
+    parser.add_argument(
+        "--ledger",
+        help="SQLite file recording what was synced. Meals unchanged since the last sync are skipped without reading Fitbit.",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        help="Directory of the write-ahead journal. Replacements interrupted by a crash are finished at the next run.",
+    )
+    parser.add_argument(
+        "--credentials",
+        help="Path to a credentials JSON file. Defaults to the same source as the Lambda function.",
+    )
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    credentials = load_credentials(args.credentials)
+    # 同じセッションを使い続けることでFitbitへのコネクションを使い回す
+    fitbit_session = requests.Session()
+
+    def create() -> AskenFitbitSync:
+        return create_syncer(
+            mail=credentials["mail"],
+            password=credentials["password"],
+            client_id=credentials["client_id"],
+            access_token=credentials["access_token"],
+            refresh_token=credentials["refresh_token"],
+            dry_run=args.mode == "dry-run",
+            cache_dir=args.cache_dir,
+            custom_foods_path=args.custom_foods,
+            ledger_path=args.ledger,
+            journal_dir=args.journal_dir,
+            fitbit_session=fitbit_session,
+            callback_on_token_refreshed=on_token_refreshed,
+            token_store=token_store,
+        )
+
+    # 保存はストアが行う。他のプロセスと同時に実行されても最後の書き込みで上書きされない
+    token_store = get_token_store(args.credentials)
+
+    def on_token_refreshed(access_token: str, refresh_token: str):
+        # 作り直したクライアントが最新のトークンを使えるようにする
+        credentials["access_token"] = access_token
+        credentials["refresh_token"] = refresh_token
+
+    daemon = SyncDaemon(create, interval=args.interval, days=args.days)
+    server = create_trigger_server(daemon, args.host, args.port) if args.port else None
+    if server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info("Trigger server listening on %s:%d", args.host, args.port)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.shutdown()
+        flush_logs()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
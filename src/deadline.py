@@ -0,0 +1,54 @@
+from typing import Any, Optional
+from datetime import datetime
+import math
+import time
+
+
+class Deadline:
+    """Point in time by which a run must finish."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Args:
+            seconds (Optional[float]): Seconds from now. None means no deadline.
+        """
+        self._at = time.monotonic() + seconds if seconds is not None else math.inf
+
+    @classmethod
+    def from_lambda_context(cls, context: Any, margin: float = 3.0) -> "Deadline":
+        """
+        Create a deadline from a Lambda context.
+        Args:
+            context: Lambda context which has `get_remaining_time_in_millis`.
+            margin (float): Seconds kept for returning the response and flushing logs.
+        """
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if not callable(get_remaining):
+            return cls()
+
+        return cls(get_remaining() / 1000 - margin)
+
+    def remaining(self) -> float:
+        """Return remaining seconds (inf if there is no deadline)."""
+        return self._at - time.monotonic()
+
+    def has_time_for(self, seconds: float) -> bool:
+        """Return whether work taking `seconds` at worst can finish before the deadline."""
+        return self.remaining() >= seconds
+
+
+def prioritize_dates(dates: list[str], today: Optional[str] = None) -> list[str]:
+    """
+    Order dates so that today comes first and older backfill dates come later.
+    Args:
+        dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+        today (Optional[str]): Today in the format 'YYYY-MM-DD'. Defaults to the current date.
+    Returns:
+        list[str]: Unique dates, today first and then newest to oldest.
+    """
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    return sorted(set(dates), key=lambda date: (date != today, _negate(date)))
+
+
+def _negate(date: str) -> int:
+    return -int(date.replace("-", ""))
@@ -0,0 +1,174 @@
+from array import array
+from collections.abc import Iterable
+import json
+import os
+import sys
+import threading
+
+from .const import NUTRITIONS
+from .models.asken import FoodLog
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+KEY_COLUMNS: dict[str, str] = {
+    "date": "i",  # YYYYMMDD (int32)
+    "meal_type_id": "b",  # int8
+}
+NUTRITION_COLUMNS: list[str] = list(NUTRITIONS.values())
+NUTRITION_TYPECODE = "d"  # float64
+
+
+class NutritionStore:
+    """
+    Columnar store of Asken nutrition history.
+
+    Each month is a partition directory (e.g. '2024-01') which has one typed-array file per column.
+    A column file is a plain sequence of fixed-width values, so it can be read with
+    `array.array.fromfile` or `numpy.fromfile` using the dtype written in 'schema.json'.
+    Rows are keyed by (date, meal_type_id). New rows are appended and changed rows are overwritten in place,
+    so unchanged rows are never written again.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._write_schema()
+
+    def _write_schema(self):
+        schema = {
+            "byteorder": sys.byteorder,
+            "columns": [
+                {"name": name, "typecode": typecode}
+                for name, typecode in self._columns().items()
+            ],
+        }
+        with open(os.path.join(self._directory, "schema.json"), "w") as f:
+            json.dump(schema, f, indent=4)
+
+    @staticmethod
+    def _columns() -> dict[str, str]:
+        return KEY_COLUMNS | {name: NUTRITION_TYPECODE for name in NUTRITION_COLUMNS}
+
+    def _column_path(self, month: str, column: str) -> str:
+        return os.path.join(self._directory, month, f"{column}.bin")
+
+    def months(self) -> list[str]:
+        """Return the partitions (YYYY-MM) in the store."""
+        return sorted(
+            name
+            for name in os.listdir(self._directory)
+            if os.path.isdir(os.path.join(self._directory, name))
+        )
+
+    def read(self, month: str) -> dict[str, array]:
+        """
+        Read all columns of a partition.
+        Args:
+            month (str): Partition in the format 'YYYY-MM'.
+        Returns:
+            dict[str, array]: Column name to values. All columns have the same length.
+        """
+        columns: dict[str, array] = {}
+        for name, typecode in self._columns().items():
+            values = array(typecode)
+            path = self._column_path(month, name)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    values.frombytes(f.read())
+            columns[name] = values
+
+        # 追記中に中断した場合は列ごとに行数が異なるため、全列に揃っている行のみを有効とする
+        rows = min(len(values) for values in columns.values())
+        for name in columns:
+            del columns[name][rows:]
+
+        return columns
+
+    def write(self, food_logs: Iterable[FoodLog]) -> int:
+        """
+        Write food logs which are new or changed.
+        Args:
+            food_logs (Iterable[FoodLog]): Parsed food logs.
+        Returns:
+            int: Number of rows written.
+        """
+        partitions: dict[str, list[FoodLog]] = {}
+        for food_log in food_logs:
+            partitions.setdefault(food_log.date[:7], []).append(food_log)
+
+        written = 0
+        with self._lock:
+            for month, logs in partitions.items():
+                written += self._write_partition(month, logs)
+
+        return written
+
+    def _write_partition(self, month: str, food_logs: list[FoodLog]) -> int:
+        os.makedirs(os.path.join(self._directory, month), exist_ok=True)
+        columns = self.read(month)
+        rows = len(columns["date"])
+        index = {
+            (date, meal_type_id): i
+            for i, (date, meal_type_id) in enumerate(
+                zip(columns["date"], columns["meal_type_id"])
+            )
+        }
+
+        appended: list[FoodLog] = []
+        written = 0
+        for food_log in food_logs:
+            key = (int(food_log.date.replace("-", "")), food_log.meal_type_id)
+            values = [float(getattr(food_log, name)) for name in NUTRITION_COLUMNS]
+            if key not in index:
+                index[key] = rows + len(appended)
+                appended.append(food_log)
+                continue
+
+            row = index[key]
+            if row >= rows:
+                # 同じ書き込み内で重複した行は後勝ち
+                appended[row - rows] = food_log
+                continue
+
+            if all(columns[n][row] == v for n, v in zip(NUTRITION_COLUMNS, values)):
+                continue
+
+            for name, value in zip(NUTRITION_COLUMNS, values):
+                self._overwrite(month, name, row, value)
+            written += 1
+
+        if appended:
+            self._truncate(month, rows)
+            # キー列を最後に書き込むことで、中断時に不完全な行が読み込まれないようにする
+            for name in NUTRITION_COLUMNS + list(KEY_COLUMNS):
+                if name == "date":
+                    values = [int(log.date.replace("-", "")) for log in appended]
+                elif name == "meal_type_id":
+                    values = [log.meal_type_id for log in appended]
+                else:
+                    values = [float(getattr(log, name)) for log in appended]
+                with open(self._column_path(month, name), "ab") as f:
+                    array(self._columns()[name], values).tofile(f)
+            written += len(appended)
+
+        logger.debug("Exported %d rows to %s.", written, month)
+
+        return written
+
+    def _overwrite(self, month: str, column: str, row: int, value: float):
+        values = array(NUTRITION_TYPECODE, [value])
+        with open(self._column_path(month, column), "r+b") as f:
+            f.seek(row * values.itemsize)
+            values.tofile(f)
+
+    def _truncate(self, month: str, rows: int):
+        """Drop rows which were partially appended by an interrupted write."""
+        for name, typecode in self._columns().items():
+            path = self._column_path(month, name)
+            size = rows * array(typecode).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
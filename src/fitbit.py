@@ -4,10 +4,14 @@ from collections.abc import Callable
 import requests
 
 from .models.fitbit import (
+    GetCaloriesInResponse,
     GetFoodLogResponse,
     UpdateFoodLogParams,
     CreateFoodLogParams,
 )
+from src.const import DEFAULT_TIMEOUT
+from src.metrics import Metrics
+from src.token_store import TokenConflictError, TokenStore
 from src.utils import get_logger
 
 
@@ -28,6 +32,9 @@ class Fitbit:
         callback_on_token_refreshed: Optional[
             Callable[[access_token, refresh_token], Any]
         ] = None,
+        timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+        session: Optional[requests.Session] = None,
+        token_store: Optional[TokenStore] = None,
     ):
         self._client_id = client_id
         self._access_token: str = access_token
@@ -35,6 +42,12 @@ class Fitbit:
         self._auto_token_refresh = auto_token_refresh
         self._callback_on_token_refreshed = callback_on_token_refreshed
         self._host = "https://api.fitbit.com"
+        self._timeout = timeout  # (接続, 読み込み)タイムアウト秒
+        self.metrics = Metrics()
+        # Sessionを渡すとコネクションを使い回す。Noneの場合はリクエストごとに接続する
+        self._http: Any = session or requests
+        # 複数プロセスでトークンを共有する場合の保存先。Noneの場合はこのインスタンスだけで更新する
+        self._token_store = token_store
 
     @staticmethod
     def _auto_token_refresh_decorator(func):
@@ -60,7 +73,11 @@ class Fitbit:
                         raise
             except Exception as e:
                 logger.error(
-                    f"Unexpected error: {e} (func={func.__name__}, args={args}, kwargs={kwargs})",
+                    "Unexpected error: %s (func=%s, args=%r, kwargs=%r)",
+                    e,
+                    func.__name__,
+                    args,
+                    kwargs,
                     exc_info=True,
                 )
                 raise
@@ -76,11 +93,28 @@ class Fitbit:
             "accept-language": "ja_JP",
         }
 
-        response = requests.get(url, headers=headers)
+        response = self._http.get(url, headers=headers, timeout=self._timeout)
+        self.metrics.record_response(response)
         response.raise_for_status()  # Raise an error for bad responses
 
         return GetFoodLogResponse(**response.json())
 
+    @_auto_token_refresh_decorator
+    def fetch_calories_in_series(self, start: str, end: str) -> dict[str, float]:
+        """Return the calories in of each date in the range (up to 1095 days) with one request."""
+        url = f"{self._host}/1/user/-/foods/log/caloriesIn/date/{start}/{end}.json"
+        headers = {
+            "Authorization": f"Bearer {self._access_token}",
+            "Accept": "application/json",
+        }
+
+        response = self._http.get(url, headers=headers, timeout=self._timeout)
+        self.metrics.record_response(response)
+        response.raise_for_status()
+
+        series = GetCaloriesInResponse(**response.json())
+        return {item.dateTime: item.value for item in series.caloriesIn}
+
     @_auto_token_refresh_decorator
     def create_food_log(self, params: CreateFoodLogParams) -> dict:
         url = f"{self._host}/1/user/-/foods/log.json"
@@ -90,7 +124,10 @@ class Fitbit:
             "accept-language": "ja_JP",
         }
 
-        response = requests.post(url, headers=headers, params=params.model_dump())
+        response = self._http.post(
+            url, headers=headers, params=params.model_dump(), timeout=self._timeout
+        )
+        self.metrics.record_response(response)
         response.raise_for_status()  # Raise an error for bad responses
 
         return response.json()
@@ -103,7 +140,10 @@ class Fitbit:
             "Accept": "application/json",
             "accept-language": "ja_JP",
         }
-        response = requests.post(url, headers=headers, params=params.model_dump())
+        response = self._http.post(
+            url, headers=headers, params=params.model_dump(), timeout=self._timeout
+        )
+        self.metrics.record_response(response)
         response.raise_for_status()
 
         return response.json()
@@ -115,12 +155,26 @@ class Fitbit:
             "Authorization": f"Bearer {self._access_token}",
             "Accept": "application/json",
         }
-        response = requests.delete(url, headers=headers)
+        response = self._http.delete(url, headers=headers, timeout=self._timeout)
+        self.metrics.record_response(response)
         response.raise_for_status()
 
         return response
 
-    def refresh_access_token(self) -> dict:
+    @_auto_token_refresh_decorator
+    def delete_food(self, food_id: int) -> requests.Response:
+        url = f"{self._host}/1/user/-/foods/{food_id}.json"
+        headers = {
+            "Authorization": f"Bearer {self._access_token}",
+            "Accept": "application/json",
+        }
+        response = self._http.delete(url, headers=headers, timeout=self._timeout)
+        self.metrics.record_response(response)
+        response.raise_for_status()
+
+        return response
+
+    def _request_token_refresh(self, refresh_token: str) -> dict:
         url = f"{self._host}/oauth2/token"
         headers = {
             "Content-Type": "application/x-www-form-urlencoded",
@@ -129,13 +183,31 @@ class Fitbit:
         body = {
             "client_id": self._client_id,
             "grant_type": "refresh_token",
-            "refresh_token": self._refresh_token,
+            "refresh_token": refresh_token,
         }
 
-        response = requests.post(url, headers=headers, data=body)
+        response = self._http.post(
+            url, headers=headers, data=body, timeout=self._timeout
+        )
+        self.metrics.record_response(response)
         response.raise_for_status()  # Raise an error for bad responses
+        self.metrics.increment("token_refreshes")
+
+        return response.json()
+
+    def refresh_access_token(self) -> dict:
+        """
+        Refresh the access token.
+        With a token store, only one process refreshes at a time, and tokens already refreshed
+        by another process are adopted without calling the API.
+        Returns:
+            dict: Tokens. 'access_token' and 'refresh_token' are always included.
+        """
+        if self._token_store is None:
+            tokens = self._request_token_refresh(self._refresh_token)
+        else:
+            tokens = self._refresh_with_store(self._token_store)
 
-        tokens = response.json()
         self._access_token = tokens["access_token"]
         self._refresh_token = tokens["refresh_token"]
 
@@ -143,3 +215,29 @@ class Fitbit:
             self._callback_on_token_refreshed(self._access_token, self._refresh_token)
 
         return tokens
+
+    def _refresh_with_store(self, store: TokenStore) -> dict:
+        with store.lock():
+            stored = store.load()
+            if stored.access_token != self._access_token:
+                # 他のプロセスが更新済みのトークンを使う
+                logger.info("Adopting tokens refreshed by another process.")
+                self.metrics.increment("token_adoptions")
+                return stored.model_dump(include={"access_token", "refresh_token"})
+
+            tokens = self._request_token_refresh(stored.refresh_token)
+            try:
+                store.save(
+                    tokens["access_token"], tokens["refresh_token"], stored.version
+                )
+            except TokenConflictError:
+                # ロックを共有しない書き込みに先を越された。保存済みのトークンに合わせる
+                logger.warning(
+                    "Tokens were refreshed concurrently, adopting the stored ones."
+                )
+                self.metrics.increment("token_adoptions")
+                return store.load().model_dump(
+                    include={"access_token", "refresh_token"}
+                )
+
+        return tokens
@@ -0,0 +1,169 @@
+from typing import Optional
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import math
+import threading
+import time
+
+import requests
+
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class LatencyTracker:
+    """Sliding window of response times used to pick the hedging threshold."""
+
+    def __init__(
+        self,
+        window: int = 200,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        initial_threshold: float = 1.0,
+    ):
+        """
+        Args:
+            window (int): Number of recent samples kept.
+            percentile (float): Percentile of the samples used as the threshold (0-1).
+            min_samples (int): Until this many samples are recorded, `initial_threshold` is used.
+            initial_threshold (float): Threshold seconds before enough samples are recorded.
+        """
+        self._samples: deque[float] = deque(maxlen=window)
+        self._percentile = percentile
+        self._min_samples = min_samples
+        self._initial_threshold = initial_threshold
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> float:
+        """Return seconds after which a request is hedged."""
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return self._initial_threshold
+            return _percentile(sorted(self._samples), self._percentile)
+
+    def latency_stats(self) -> dict[str, float]:
+        """Return the latency distribution in seconds and the current threshold."""
+        with self._lock:
+            samples = sorted(self._samples)
+        stats: dict[str, float] = {"count": len(samples)}
+        if samples:
+            for p in (0.5, 0.9, 0.95, 0.99):
+                stats[f"p{round(p * 100)}"] = _percentile(samples, p)
+            stats["max"] = samples[-1]
+        stats["threshold"] = self.threshold()
+
+        return stats
+
+
+def _percentile(samples: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    return samples[max(math.ceil(p * len(samples)) - 1, 0)]
+
+
+class Hedger:
+    """
+    Send a duplicate of a slow idempotent request and use whichever response comes first.
+    The duplicate is sent when the request takes longer than the tracker's threshold,
+    at most `max_hedge_ratio` of all requests so that the server is not overloaded.
+    """
+
+    def __init__(
+        self,
+        tracker: Optional[LatencyTracker] = None,
+        max_hedge_ratio: float = 0.1,
+        max_workers: int = 8,
+    ):
+        """
+        Args:
+            tracker (Optional[LatencyTracker]): Latency distribution used to pick the threshold.
+            max_hedge_ratio (float): Maximum ratio of hedged requests to all requests.
+            max_workers (int): Number of threads sending requests.
+        """
+        self.tracker = tracker or LatencyTracker()
+        self._max_hedge_ratio = max_hedge_ratio
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _acquire_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self._max_hedge_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _timed(self, send: Callable[[], requests.Response]) -> requests.Response:
+        start = time.monotonic()
+        response = send()
+        self.tracker.record(time.monotonic() - start)
+        return response
+
+    def request(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Send a request, hedging it if it is slow.
+        Args:
+            send (Callable[[], requests.Response]): Sends the idempotent request. May be called twice.
+        Returns:
+            requests.Response: The first successful response.
+        """
+        with self._lock:
+            self.requests += 1
+
+        primary = self._executor.submit(self._timed, send)
+        try:
+            return primary.result(timeout=self.tracker.threshold())
+        except TimeoutError:
+            pass
+
+        if not self._acquire_hedge():
+            return primary.result()
+
+        logger.debug("Hedging a request slower than %.3fs", self.tracker.threshold())
+        hedge = self._executor.submit(self._timed, send)
+        pending: set[Future[requests.Response]] = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # 遅れた方のレスポンスは使わないので、キャンセルするか届き次第閉じる
+                    for loser in pending:
+                        loser.cancel()
+                        loser.add_done_callback(_close_response)
+                    return future.result()
+
+        assert error is not None
+        raise error
+
+    def stats(self) -> dict[str, float]:
+        """Return the latency distribution and hedging counters."""
+        with self._lock:
+            counters = {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+        return {**self.tracker.latency_stats(), **counters}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _close_response(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
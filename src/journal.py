@@ -0,0 +1,147 @@
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from .models.asken import FoodLog
+from .models.sync import JournalEntry
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class WriteJournal:
+    """
+    Write-ahead journal of Fitbit writes of an account in a JSON Lines file.
+    A write is planned (and fsynced) before its first request and marked done after the last one,
+    so that a replacement interrupted between the delete and the create can be finished at the next startup.
+    """
+
+    def __init__(self, directory: str, account: str):
+        """
+        Args:
+            directory (str): Journal directory. Shared by accounts.
+            account (str): Account (e.g. email address). Only its hash is written to disk.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(
+            directory, f"{hashlib.sha256(account.encode()).hexdigest()[:16]}.jsonl"
+        )
+        self._lock = threading.Lock()
+        self._pending = self._load()
+        if os.path.exists(self._path):
+            # 完了した記録と途中で切れた行を除いて書き直し、以降の追記が壊れた行に繋がらないようにする
+            self._rewrite()
+
+    def _load(self) -> dict[str, JournalEntry]:
+        pending: dict[str, JournalEntry] = {}
+        if not os.path.exists(self._path):
+            return pending
+
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み中に終了した最後の行は、その書き込みを始める前の状態として扱う
+                    logger.warning("Ignoring a broken line of journal %s", self._path)
+                    continue
+                if record["op"] == "plan":
+                    entry = JournalEntry(**record["entry"])
+                    pending[entry.id] = entry
+                elif record["op"] == "deleted" and record["id"] in pending:
+                    pending[record["id"]].deleted = True
+                elif record["op"] == "done":
+                    pending.pop(record["id"], None)
+
+        if pending:
+            logger.info("%d unfinished writes in journal %s", len(pending), self._path)
+
+        return pending
+
+    def plan(
+        self,
+        date: str,
+        meal_type_id: int,
+        meal: FoodLog,
+        delete_log_id: Optional[int] = None,
+    ) -> str:
+        """
+        Record a write before it runs. Unfinished writes of the same meal are superseded by it.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id (int): Meal type ID.
+            meal (FoodLog): Food log to create.
+            delete_log_id (Optional[int]): logId deleted before the create. None if nothing is replaced.
+        Returns:
+            str: ID of the write.
+        """
+        entry = JournalEntry(
+            id=uuid.uuid4().hex,
+            date=date,
+            meal_type_id=meal_type_id,
+            meal=meal,
+            delete_log_id=delete_log_id,
+        )
+        with self._lock:
+            superseded = [
+                planned.id
+                for planned in self._pending.values()
+                if planned.date == date and planned.meal_type_id == meal_type_id
+            ]
+            for entry_id in superseded:
+                del self._pending[entry_id]
+            self._pending[entry.id] = entry
+            self._append(
+                [{"op": "done", "id": entry_id} for entry_id in superseded]
+                + [{"op": "plan", "entry": entry.model_dump(mode="json")}]
+            )
+
+        return entry.id
+
+    def mark_deleted(self, entry_id: str) -> None:
+        """Record that the entry to replace has been deleted."""
+        with self._lock:
+            if entry_id not in self._pending:
+                return
+            self._pending[entry_id].deleted = True
+            self._append([{"op": "deleted", "id": entry_id}])
+
+    def mark_done(self, entry_id: str) -> None:
+        """Record that the write has finished or has been given up without changing Fitbit."""
+        with self._lock:
+            if self._pending.pop(entry_id, None) is None:
+                return
+            self._append([{"op": "done", "id": entry_id}])
+
+    def pending(self) -> list[JournalEntry]:
+        """Return writes which have not finished, oldest first."""
+        with self._lock:
+            return [entry.model_copy() for entry in self._pending.values()]
+
+    def _rewrite(self) -> None:
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._pending.values():
+                f.write(
+                    json.dumps({"op": "plan", "entry": entry.model_dump(mode="json")})
+                    + "\n"
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path)
+
+    def _append(self, records: list[dict]) -> None:
+        if not self._pending:
+            # 未完了の書き込みが無ければ、ファイルを空にして肥大化を防ぐ
+            with open(self._path, "w", encoding="utf-8") as f:
+                os.fsync(f.fileno())
+            return
+
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
@@ -1,43 +1,77 @@
-from typing import Optional
+from typing import Any, Optional
+from collections.abc import Callable
 import json
 from datetime import datetime
 import copy
+import math
 import os
 
 import requests
 import boto3  # type: ignore
+from botocore.config import Config  # type: ignore
 from botocore.exceptions import ClientError  # type: ignore
 
-from .asken import Asken
+from .asken import Asken, AskenAuthError
 from .fitbit import Fitbit
 from .asken_fitbit_sync import AskenFitbitSync
-from .const import DAILY_MEAL_TYPE_ID_LIST
-from .utils import get_logger
+from .cache import FoodLogCache
+from .clients import ClientRegistry
+from .custom_foods import CustomFoodCache
+from .const import (
+    DAILY_MEAL_TYPE_ID_LIST,
+    DEFAULT_TIMEOUT,
+    LAMBDA_MAX_TIMEOUT,
+    SECRET_ID,
+    TRIGGER_WINDOW,
+)
+from .deadline import Deadline, prioritize_dates
+from .hedging import Hedger
+from .journal import WriteJournal
+from .ledger import SqliteLedger
+from .metrics import timer
+from .orchestrator import LambdaInvoker, Orchestrator, run_worker
+from .models.fitbit import GetFoodLogResponse
+from .models.sync import SyncReport
+from .rate_limit import AimdLimiter
+from .profiling import maybe_profile, profiling_enabled
+from .export import NutritionStore
+from .startup import TaskGraph
+from .sinks import CsvSink, FoodLogSink, NutritionStoreSink
+from .trigger import DynamoDBTriggerStore, SyncTrigger, handle_function_url
+from .token_store import FileTokenStore, SecretsManagerTokenStore, TokenStore
+from .utils import date_range, flush_logs, get_logger
 from .mock import FitbitMock
 
 
 logger = get_logger(__name__)
 
+# ウォームスタートした実行環境のトリガーは同じインスタンスを使う
+_trigger: Optional[SyncTrigger] = None
+# ウォームスタートした実行環境では、ログイン済みのクライアントと接続を使い回す
+_clients = ClientRegistry()
+
 
 def get_secret_manager_client():
     session = boto3.session.Session()
     return session.client(service_name="secretsmanager", region_name="ap-northeast-1")
 
 
-def get_secret():
+def get_secret(secret_id: str = SECRET_ID):
     """
     Get credentials from AWS Secrets Manager or local file based on the environment.
+    Args:
+        secret_id (str): Name of the secret of the account.
     Returns:
         dict: Credentials containing mail, password, client_id, access_token, and refresh_token.
     """
     # ローカル開発用
-    if os.environ["ENV"] == "local":
+    if os.environ.get("ENV") == "local":
         with open("src/.credentials.json", "r") as f:
             return json.load(f)
 
     client = get_secret_manager_client()
     try:
-        get_secret_value_response = client.get_secret_value(SecretId="askenFitbitSync")
+        get_secret_value_response = client.get_secret_value(SecretId=secret_id)
     except ClientError as e:
         # For a list of exceptions thrown, see
         # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
@@ -46,62 +80,462 @@ def get_secret():
     return json.loads(get_secret_value_response["SecretString"])
 
 
+def get_token_store(
+    path: Optional[str] = None, secret_id: str = SECRET_ID
+) -> TokenStore:
+    """
+    Get the store of Fitbit tokens shared by every process of the account.
+    Args:
+        path (Optional[str]): Credentials JSON file. If None, the same source as get_secret is used.
+        secret_id (str): Name of the secret of the account.
+    """
+    if path is None and os.environ.get("ENV") == "local":
+        path = "src/.credentials.json"
+    if path:
+        return FileTokenStore(path)
+
+    return SecretsManagerTokenStore(get_secret_manager_client(), secret_id)
+
+
 def refresh_token_callback(access_token: str, refresh_token: str):
     logger.debug("Refreshing token callback start.")
     client = get_secret_manager_client()
     credencials = get_secret()
     credencials["access_token"] = access_token
     credencials["refresh_token"] = refresh_token
-    client.update_secret(
-        SecretId="askenFitbitSync", SecretString=json.dumps(credencials)
-    )
+    client.update_secret(SecretId=SECRET_ID, SecretString=json.dumps(credencials))
     logger.debug("Refreshing token callback end.")
 
 
+def create_syncer(
+    mail: str,
+    password: str,
+    client_id: str,
+    access_token: str,
+    refresh_token: str,
+    dry_run: bool = False,
+    export_dir: Optional[str] = None,
+    csv_path: Optional[str] = None,
+    callback_on_token_refreshed: Optional[
+        Callable[[str, str], Any]
+    ] = refresh_token_callback,
+    timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+    hedge: bool = False,
+    adaptive_concurrency: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+    custom_foods_path: Optional[str] = None,
+    fitbit_session: Optional[requests.Session] = None,
+    token_store: Optional[TokenStore] = None,
+    prefetch_date: Optional[str] = None,
+    phases: Optional[dict[str, float]] = None,
+    ledger_path: Optional[str] = None,
+    journal_dir: Optional[str] = None,
+    clients: Optional[ClientRegistry] = None,
+) -> AskenFitbitSync:
+    """
+    Create a syncer which links Asken and Fitbit.
+    Args:
+        dry_run (bool): If True, nothing is written to Fitbit.
+        export_dir (Optional[str]): If given, every parsed food log is exported to the nutrition store in this directory.
+        csv_path (Optional[str]): If given, every parsed food log is appended to this CSV file.
+        callback_on_token_refreshed (Optional[Callable[[str, str], Any]]): Called with new tokens when Fitbit tokens are refreshed.
+            Pass None when token_store saves them.
+        timeout (tuple[float, float]): (connect, read) timeout seconds of every request.
+        hedge (bool): If True, slow Asken page fetches are hedged with a duplicate request.
+        adaptive_concurrency (Optional[int]): If given, concurrent Asken page fetches are limited adaptively
+            up to this number, backing off when Asken rejects or slows down requests.
+        cache_dir (Optional[str]): If given, parsed Asken food logs are cached in this directory.
+        refresh (bool): If True, cached food logs are ignored and fetched again.
+        custom_foods_path (Optional[str]): JSON file of Fitbit custom foods reused by foodId.
+            If None, they are reused only within the run.
+        fitbit_session (Optional[requests.Session]): If given, connections to Fitbit are kept alive with this session.
+        token_store (Optional[TokenStore]): If given, Fitbit tokens are refreshed by one process at a time
+            and saved with a version check, so that overlapping runs of the account share them.
+        prefetch_date (Optional[str]): If given, Fitbit food log of this date is fetched while logging in to Asken
+            and used by the first sync of the date. Ignored when ledger_path is given.
+        phases (Optional[dict[str, float]]): If given, wall time of each startup step is added to it.
+        ledger_path (Optional[str]): If given, what was synced is recorded in this SQLite file,
+            and meals unchanged since the last sync are skipped without fetching Fitbit.
+        journal_dir (Optional[str]): If given, writes to Fitbit are journaled in this directory before they run,
+            so that a replacement interrupted between the delete and the create is finished by the next sync.
+        clients (Optional[ClientRegistry]): If given, Asken and Fitbit clients and the ledger of the account kept in it
+            are reused when they are healthy, and new ones are kept in it.
+    Returns:
+        AskenFitbitSync: Syncer.
+    """
+    cache = FoodLogCache(cache_dir, mail, refresh=refresh) if cache_dir else None
+
+    def login() -> Asken:
+        return Asken(
+            mail,
+            password,
+            timeout=timeout,
+            hedger=Hedger() if hedge else None,
+            cache=cache,
+            limiter=(
+                AimdLimiter(max_limit=adaptive_concurrency)
+                if adaptive_concurrency
+                else None
+            ),
+        )
+
+    def create_fitbit() -> Fitbit:
+        if os.environ.get("ENV") == "local":
+            return FitbitMock()
+
+        return Fitbit(
+            client_id,
+            access_token,
+            refresh_token,
+            callback_on_token_refreshed=callback_on_token_refreshed,
+            timeout=timeout,
+            # 使い回すクライアントはコネクションプールも次の実行に持ち越す
+            session=fitbit_session
+            or (requests.Session() if clients is not None else None),
+            token_store=token_store,
+        )
+
+    if clients is not None:
+        registry = clients
+        get_asken = lambda: registry.asken(mail, password, login)
+        fitbit = registry.fitbit(mail, client_id, create_fitbit)
+    else:
+        get_asken = login
+        fitbit = create_fitbit()
+
+    sinks: list[FoodLogSink] = []
+    if export_dir:
+        sinks.append(NutritionStoreSink(NutritionStore(export_dir)))
+    if csv_path:
+        sinks.append(CsvSink(csv_path))
+
+    def fetch_fitbit_day(date: str) -> Optional[GetFoodLogResponse]:
+        try:
+            return fitbit.fetch_food_log(date)
+        except Exception as e:
+            # 先読みできなくても、同期時に改めて取得する
+            logger.warning("Failed to prefetch Fitbit food log of %s: %s", date, e)
+            return None
+
+    # あすけんへのログインとFitbitの取得は互いに依存しないため並行して行う
+    graph = TaskGraph()
+    graph.add("asken_login", get_asken)
+    # 台帳がある場合、変わっていない食事はFitbitを取得しないため先読みもしない
+    prefetch_date = prefetch_date if not ledger_path else None
+    if prefetch_date:
+        graph.add("fitbit_day", lambda: fetch_fitbit_day(prefetch_date))
+    results = graph.run(phases)
+
+    ledger: Optional[SqliteLedger] = None
+    if ledger_path:
+        path = ledger_path
+        open_ledger = lambda: SqliteLedger(path, mail)
+        ledger = (
+            clients.ledger(mail, path, open_ledger)
+            if clients is not None
+            else open_ledger()
+        )
+
+    syncer = AskenFitbitSync(
+        results["asken_login"],
+        fitbit,
+        dry_run=dry_run,
+        sinks=sinks,
+        request_budget=sum(timeout),
+        custom_foods=CustomFoodCache(custom_foods_path),
+        ledger=ledger,
+        journal=WriteJournal(journal_dir, mail) if journal_dir else None,
+    )
+    if prefetch_date and results["fitbit_day"]:
+        syncer.fitbit_sink.keep_prefetched(prefetch_date, results["fitbit_day"])
+
+    return syncer
+
+
 def main(
-    date: str,
+    dates: list[str],
     mail: str,
     password: str,
     client_id: str,
     access_token: str,
     refresh_token: str,
     meal_type_id_list: list[int] = DAILY_MEAL_TYPE_ID_LIST,
-):
-    logger.info(f"Syncing food logs for date: {date}")
+    deadline: Optional[Deadline] = None,
+    timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+    hedge: bool = False,
+    cache_dir: Optional[str] = None,
+    custom_foods_path: Optional[str] = None,
+    secret_id: str = SECRET_ID,
+    ledger_path: Optional[str] = None,
+    journal_dir: Optional[str] = None,
+    clients: Optional[ClientRegistry] = None,
+) -> SyncReport:
+    logger.info("Syncing food logs for dates: %s", dates)
 
-    asken = Asken(mail, password)
-    if os.environ["ENV"] == "local":
-        fitbit: Fitbit = FitbitMock()
-    else:
-        fitbit = Fitbit(
+    phases: dict[str, float] = {}
+
+    def create() -> AskenFitbitSync:
+        return create_syncer(
+            mail,
+            password,
             client_id,
             access_token,
             refresh_token,
-            callback_on_token_refreshed=refresh_token_callback,
+            timeout=timeout,
+            hedge=hedge,
+            cache_dir=cache_dir,
+            custom_foods_path=custom_foods_path,
+            # トークンはストアがバージョンを確認して保存する
+            callback_on_token_refreshed=None,
+            token_store=get_token_store(secret_id=secret_id),
+            # 最初に同期する日付のFitbitの記録をログイン中に取得しておく
+            prefetch_date=prioritize_dates(dates)[0] if dates else None,
+            phases=phases,
+            ledger_path=ledger_path,
+            journal_dir=journal_dir,
+            clients=clients,
         )
-    syncer = AskenFitbitSync(asken, fitbit)
-    syncer.sync_food_logs(date, meal_type_id_list)
 
-    logger.info(f"Food logs synced successfully for date: {date}")
+    with timer(phases, "startup"):
+        syncer = create()
+    try:
+        report = syncer.sync_dates(dates, meal_type_id_list, deadline)
+        session_expired = syncer.asken_auth_failed
+    except AskenAuthError:
+        if clients is None:
+            raise
+        session_expired = True
+    if clients is not None and session_expired:
+        # 使い回したセッションが切れていた場合は、ログインし直して一度だけ同期し直す
+        logger.warning("Asken session of %s expired. Logging in again.", mail)
+        clients.invalidate(mail, "asken")
+        with timer(phases, "startup"):
+            syncer = create()
+        report = syncer.sync_dates(dates, meal_type_id_list, deadline)
+    report.phases.update(phases)
+
+    logger.info("Food logs synced for dates: %s", report.dates)
+
+    return report
+
+
+def get_event_dates(event: dict) -> list[str]:
+    """
+    Get dates to sync from the event.
+    The event may have 'dates' (list), 'start_date' and 'end_date' (range) or 'date'. Defaults to today.
+    """
+    if event.get("dates"):
+        return list(event["dates"])
+    if event.get("start_date") and event.get("end_date"):
+        return date_range(event["start_date"], event["end_date"])
+
+    return [event.get("date", datetime.now().strftime("%Y-%m-%d"))]
+
+
+def get_timeout() -> tuple[float, float]:
+    """Get (connect, read) timeout seconds from CONNECT_TIMEOUT and READ_TIMEOUT environment variables."""
+    return (
+        float(os.environ.get("CONNECT_TIMEOUT", DEFAULT_TIMEOUT[0])),
+        float(os.environ.get("READ_TIMEOUT", DEFAULT_TIMEOUT[1])),
+    )
+
+
+def _syncer_options_from_env(account: Optional[str] = None) -> dict[str, Any]:
+    """
+    Get the options of `main` shared by the handlers from environment variables.
+    Args:
+        account (Optional[str]): Secret name of the account. Replaces '{account}' in CUSTOM_FOODS_PATH.
+    """
+    custom_foods_path = os.environ.get("CUSTOM_FOODS_PATH")
+    if custom_foods_path and account:
+        # アカウント間でカスタム食品が混ざらないよう、'{account}'をシークレット名に置き換える
+        custom_foods_path = custom_foods_path.format(account=account)
+
+    return {
+        "timeout": get_timeout(),
+        "hedge": os.environ.get("ASKEN_HEDGE") == "1",
+        # ウォームスタートした実行環境では/tmpが残るため、前回取得したページを再利用できる
+        "cache_dir": os.environ.get("CACHE_DIR"),
+        "custom_foods_path": custom_foods_path,
+        "ledger_path": os.environ.get("LEDGER_PATH"),
+        "journal_dir": os.environ.get("JOURNAL_DIR"),
+    }
 
 
 def lambda_handler(event, context):
     logger.info("Starting Asken-Fitbit sync...")
 
-    date = event.get("date", datetime.now().strftime("%Y-%m-%d"))
+    dates = get_event_dates(event)
+    deadline = Deadline.from_lambda_context(context)
     credencials = get_secret()
+    # 環境変数PROFILE=1またはイベントの"profile"で有効化。無効時はnullcontextのみ
+    profiling = maybe_profile(
+        profiling_enabled(event),
+        name=f"lambda-{getattr(context, 'aws_request_id', None) or 'local'}",
+    )
     try:
-        main(
-            date=date,
-            mail=credencials["mail"],
-            password=credencials["password"],
-            client_id=credencials["client_id"],
-            access_token=credencials["access_token"],
-            refresh_token=credencials["refresh_token"],
-        )
+        with profiling:
+            report = main(
+                dates=dates,
+                mail=credencials["mail"],
+                password=credencials["password"],
+                client_id=credencials["client_id"],
+                access_token=credencials["access_token"],
+                refresh_token=credencials["refresh_token"],
+                deadline=deadline,
+                clients=_clients,
+                **_syncer_options_from_env(),
+            )
     except requests.exceptions.RequestException as e:
-        logger.error(f"An error occurred: {e}", exc_info=True)
+        logger.error("An error occurred: %s", e, exc_info=True)
+        report = SyncReport(dates=dates, pending_dates=dates, error=str(e))
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+        logger.error("An unexpected error occurred: %s", e, exc_info=True)
+        report = SyncReport(dates=dates, pending_dates=dates, error=str(e))
     else:
         logger.info("Asken-Fitbit sync completed.")
+    finally:
+        # Lambdaは応答後に実行環境を凍結するため、キューに残ったログを出力しておく
+        flush_logs()
+
+    # pending_datesがある場合は {"dates": pending_dates} で再実行すると続きから同期できる
+    return report.model_dump(mode="json")
+
+
+def _sync_triggered(account: str, dates: list[str], deadline: Deadline) -> SyncReport:
+    credencials = get_secret()
+    return main(
+        dates=dates,
+        mail=credencials["mail"],
+        password=credencials["password"],
+        client_id=credencials["client_id"],
+        access_token=credencials["access_token"],
+        refresh_token=credencials["refresh_token"],
+        deadline=deadline,
+        clients=_clients,
+        **_syncer_options_from_env(),
+    )
+
+
+def function_url_handler(event, context):
+    """
+    On-demand sync through a function URL: POST {"dates": [...]} with an optional Idempotency-Key header.
+    Triggers within TRIGGER_WINDOW seconds are synced together, and the response has the report of that sync.
+    Triggers are coalesced across execution environments through the DynamoDB table TRIGGER_TABLE if it is set.
+    """
+    global _trigger
+    if _trigger is None:
+        table = os.environ.get("TRIGGER_TABLE")
+        _trigger = SyncTrigger(
+            _sync_triggered,
+            window=float(os.environ.get("TRIGGER_WINDOW", TRIGGER_WINDOW)),
+            # 実行環境ごとの状態では、別の実行環境に届いたトリガーと合流できない
+            store=(
+                DynamoDBTriggerStore(
+                    boto3.session.Session().client(
+                        service_name="dynamodb", region_name="ap-northeast-1"
+                    ),
+                    table,
+                )
+                if table
+                else None
+            ),
+        )
+
+    deadline = Deadline.from_lambda_context(context)
+    remaining = deadline.remaining()
+    response = handle_function_url(
+        _trigger,
+        get_secret()["mail"],
+        event,
+        timeout=max(remaining, 0.0) if remaining != math.inf else None,
+        # この呼び出しで始めた同期は、削除後に再登録できなくなる前に止める
+        deadline=deadline,
+    )
+    flush_logs()
+
+    return response
+
+
+def get_accounts(event: dict) -> list[str]:
+    """Get secret names of the accounts from the event's 'accounts' or ACCOUNT_SECRET_IDS (comma separated)."""
+    if event.get("accounts"):
+        return list(event["accounts"])
+
+    return [
+        account.strip()
+        for account in os.environ.get("ACCOUNT_SECRET_IDS", SECRET_ID).split(",")
+        if account.strip()
+    ]
+
+
+def orchestrator_handler(event, context):
+    """
+    Sync many accounts with SHARDS parallel invocations of WORKER_FUNCTION_NAME.
+    The event has the dates (same as lambda_handler) and optionally 'accounts'.
+    """
+    dates = get_event_dates(event)
+    accounts = get_accounts(event)
+    deadline = Deadline.from_lambda_context(context)
+    remaining = deadline.remaining()
+    invoker = LambdaInvoker(
+        boto3.session.Session().client(
+            service_name="lambda",
+            region_name="ap-northeast-1",
+            # 既定の60秒で読み込みがタイムアウトすると再試行され、同じアカウントが並行して同期される。
+            # ワーカーはこの関数の期限までに終わるため、それまで待ち、再試行はしない
+            config=Config(
+                read_timeout=(
+                    math.ceil(remaining)
+                    if remaining != math.inf
+                    else LAMBDA_MAX_TIMEOUT
+                ),
+                retries={"max_attempts": 0},
+            ),
+        ),
+        os.environ["WORKER_FUNCTION_NAME"],
+    )
+    orchestrator = Orchestrator(
+        invoker, int(event.get("shards") or os.environ.get("SHARDS", 1))
+    )
+    report = orchestrator.run(accounts, dates, deadline=deadline)
+    flush_logs()
+
+    return report.model_dump(mode="json")
+
+
+def _sync_account(
+    account: str, dates: list[str], meal_type_id_list: list[int], deadline: Deadline
+) -> SyncReport:
+    credencials = get_secret(account)
+    return main(
+        dates=dates,
+        mail=credencials["mail"],
+        password=credencials["password"],
+        client_id=credencials["client_id"],
+        access_token=credencials["access_token"],
+        refresh_token=credencials["refresh_token"],
+        meal_type_id_list=meal_type_id_list,
+        deadline=deadline,
+        secret_id=account,
+        clients=_clients,
+        **_syncer_options_from_env(account),
+    )
+
+
+def worker_handler(event, context):
+    """Sync the accounts of a shard given by orchestrator_handler."""
+    deadline = Deadline.from_lambda_context(context)
+    if event.get("deadline_seconds") is not None:
+        # オーケストレーターの期限の方が早い場合はそちらに合わせる
+        shard_deadline = Deadline(event["deadline_seconds"])
+        if shard_deadline.remaining() < deadline.remaining():
+            deadline = shard_deadline
+
+    result = run_worker(
+        event, _sync_account, deadline, startup_budget=2 * sum(get_timeout())
+    )
+    flush_logs()
+
+    return result
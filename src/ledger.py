@@ -0,0 +1,132 @@
+from typing import Optional
+from abc import ABC, abstractmethod
+from datetime import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+
+from pydantic import BaseModel
+
+from .models.asken import FoodLog
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class LedgerEntry(BaseModel):
+    fingerprint: str  # 最後に同期したあすけんの栄養素の指紋
+    log_id: Optional[int] = None  # Fitbitに登録した食事記録のlogId。未登録の場合None
+
+
+def fingerprint(food_log: Optional[FoodLog]) -> str:
+    """
+    Return a fingerprint of the nutrients written to Fitbit.
+    Only calories and PFC are written, so changes of other nutrients do not require a write.
+    """
+    if not food_log or not food_log.logged:
+        return "none"
+
+    values = [
+        str(int(food_log.calories)),
+        *(
+            f"{float(value):.1f}"
+            for value in (food_log.protein, food_log.fat, food_log.carbs)
+        ),
+    ]
+    return hashlib.sha256(":".join(values).encode()).hexdigest()[:16]
+
+
+class SyncLedger(ABC):
+    """
+    What was last synced to Fitbit for each date and meal of an account.
+    A key-value store keyed by '<account>#<date>#<meal type>' can implement this in the cloud.
+    """
+
+    @abstractmethod
+    def get(self, date: str, meal_type_id: int) -> Optional[LedgerEntry]:
+        """Return the entry of the meal, or None if it has never been synced."""
+
+    @abstractmethod
+    def put(self, date: str, meal_type_id: int, entry: LedgerEntry) -> None:
+        """Record the entry of the meal."""
+
+    @abstractmethod
+    def forget(self, date: str, meal_type_id: Optional[int] = None) -> None:
+        """Forget entries of the date (all meals if meal_type_id is None), so that they are checked against Fitbit again."""
+
+
+class SqliteLedger(SyncLedger):
+    """Ledger in a local SQLite file, scoped to an account."""
+
+    def __init__(self, path: str, account: str):
+        """
+        Args:
+            path (str): SQLite file. Created if it does not exist.
+            account (str): Account whose entries are read and written.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._account = account
+        self._lock = threading.Lock()
+        # 同期は複数スレッドから行われるため、接続を共有してロックで直列化する
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ledger (
+                    account TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    meal_type_id INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    log_id INTEGER,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (account, date, meal_type_id)
+                )
+                """
+            )
+
+    def get(self, date: str, meal_type_id: int) -> Optional[LedgerEntry]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fingerprint, log_id FROM ledger"
+                " WHERE account = ? AND date = ? AND meal_type_id = ?",
+                (self._account, date, meal_type_id),
+            ).fetchone()
+        if row is None:
+            return None
+
+        return LedgerEntry(fingerprint=row[0], log_id=row[1])
+
+    def put(self, date: str, meal_type_id: int, entry: LedgerEntry) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._account,
+                    date,
+                    meal_type_id,
+                    entry.fingerprint,
+                    entry.log_id,
+                    datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+
+    def forget(self, date: str, meal_type_id: Optional[int] = None) -> None:
+        with self._lock, self._connection:
+            if meal_type_id is None:
+                self._connection.execute(
+                    "DELETE FROM ledger WHERE account = ? AND date = ?",
+                    (self._account, date),
+                )
+            else:
+                self._connection.execute(
+                    "DELETE FROM ledger WHERE account = ? AND date = ? AND meal_type_id = ?",
+                    (self._account, date, meal_type_id),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,44 @@
+from collections import Counter
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+
+class Metrics:
+    """Thread safe counters of an API client (HTTP calls, bytes, token refreshes, cache hits...)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Counter[str] = Counter()
+
+    def record_response(self, response: requests.Response) -> None:
+        """Count an HTTP call and the size of its response body."""
+        size = len(response.content or b"")
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["bytes"] += size
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def diff(after: dict[str, int], before: dict[str, int]) -> dict[str, int]:
+    """Return counters increased between two snapshots."""
+    return {key: value - before.get(key, 0) for key, value in after.items()}
+
+
+@contextmanager
+def timer(phases: dict[str, float], name: str):
+    """Add the wall time of the block to phases[name] in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
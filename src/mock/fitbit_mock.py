@@ -70,6 +70,19 @@ class FitbitMock(Fitbit):
 
         return super().fetch_food_log(date)
 
+    @patch("requests.get")
+    def fetch_calories_in_series(
+        self, start: str, end: str, mock: MagicMock
+    ) -> dict[str, float]:
+        res = requests.Response()
+        res.status_code = 200
+        res._content = (
+            f'{{"foods-log-caloriesIn": [{{"dateTime": "{start}", "value": "280"}}]}}'
+        ).encode()
+        mock.return_value = res
+
+        return super().fetch_calories_in_series(start, end)
+
     @patch("requests.post")
     def create_food_log(self, params: CreateFoodLogParams, mock: MagicMock) -> dict:
         res = requests.Response()
@@ -183,6 +196,14 @@ class FitbitMock(Fitbit):
 
         return super().delete_food_log(food_log_id)
 
+    @patch("requests.delete")
+    def delete_food(self, food_id: int, mock: MagicMock) -> requests.Response:
+        res = requests.Response()
+        res.status_code = 204
+        mock.return_value = res
+
+        return super().delete_food(food_id)
+
     @patch("requests.post")
     def refresh_access_token(self, mock: MagicMock) -> dict:
         res = requests.Response()
@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Unit(BaseModel):
@@ -64,6 +64,15 @@ class GetFoodLogResponse(BaseModel):
     summary: Summary
 
 
+class TimeSeriesValue(BaseModel):
+    dateTime: str
+    value: float
+
+
+class GetCaloriesInResponse(BaseModel):
+    caloriesIn: list[TimeSeriesValue] = Field(alias="foods-log-caloriesIn")
+
+
 class UpdateFoodLogParams(BaseModel):
     mealTypeId: int
     unitid: int = 304  # 単位: 食分
@@ -0,0 +1,110 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+from .asken import FoodLog
+
+
+# deleted: 削除後の再登録に失敗した状態
+# compacted: 重複した登録を削除した状態(compactのみ)
+type SyncStatus = Literal[
+    "created", "replaced", "deleted", "skipped", "failed", "compacted"
+]
+
+
+class MealSyncResult(BaseModel):
+    date: str
+    meal_type_id: int
+    status: SyncStatus
+    sink: Optional[str] = None  # 書き込み先
+    reason: Optional[str] = (
+        None  # skipped/failedの理由。ジャーナルから復旧した場合は'recovered'
+    )
+    calories: Optional[float] = None  # あすけん側のカロリー(kcal)
+    dry_run: bool = False  # Trueの場合、Fitbitへの書き込みは行っていない
+    duplicates_deleted: int = 0  # 削除した重複登録の数
+    log_id: Optional[int] = None  # Fitbitに登録されている食事記録のlogId
+    error: Optional[str] = None
+
+
+class SinkStats(BaseModel):
+    name: str
+    succeeded: int = 0  # 書き込み(スキップ含む)に成功した食事数
+    failed: int = 0  # 書き込みに失敗した食事数
+    retries: int = 0  # リトライした回数
+
+
+class UpstreamStats(BaseModel):
+    calls: int = 0  # HTTPリクエスト数
+    bytes: int = 0  # レスポンスボディの合計サイズ
+
+
+class SyncReport(BaseModel):
+    dates: list[str]
+    meals: list[MealSyncResult] = []
+    phases: dict[str, float] = {}  # フェーズごとの経過時間(秒)
+    upstreams: dict[str, UpstreamStats] = {}  # 'asken', 'fitbit'
+    token_refreshes: int = 0
+    cache_hits: int = 0
+    latency: dict[str, dict[str, float]] = {}  # ヘッジ判定に使ったレイテンシ分布(秒)
+    concurrency: dict[str, dict[str, float]] = (
+        {}
+    )  # 適応的な同時実行数の制限が落ち着いた値
+    sinks: list[SinkStats] = []
+    pending_dates: list[str] = []  # 期限までに同期できなかった日付。再実行で再開する
+    error: Optional[str] = None
+
+    @property
+    def completed(self) -> bool:
+        return not self.pending_dates
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(
+            meal.status not in ("failed", "deleted") for meal in self.meals
+        )
+
+
+class OrchestrationReport(BaseModel):
+    shards: dict[int, list[str]] = {}  # シャードごとのアカウント
+    accounts: dict[str, SyncReport] = {}  # アカウントごとの同期結果
+    failed_shards: list[int] = []  # 呼び出しに失敗したシャード
+    phases: dict[str, float] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed_shards and all(
+            report.ok for report in self.accounts.values()
+        )
+
+    @property
+    def pending_accounts(self) -> list[str]:
+        return [
+            account for account, report in self.accounts.items() if not report.completed
+        ]
+
+
+class TriggerResult(BaseModel):
+    ticket: str  # 合流した同期のID
+    dates: list[str]  # 合流した同期で同期する日付(受付時点)
+    duplicate: bool = False  # 冪等キーが既に受け付けられていた場合True
+
+
+class DayDrift(BaseModel):
+    """Day whose Fitbit calorie total differs from Asken's daily total."""
+
+    date: str
+    asken_calories: float  # あすけんの1日分のカロリー(記録が無い場合は0)
+    fitbit_calories: float  # Fitbitの1日の摂取カロリー
+    difference: float  # fitbit_calories - asken_calories
+
+
+class JournalEntry(BaseModel):
+    """Write to Fitbit recorded in the journal before it runs."""
+
+    id: str
+    date: str
+    meal_type_id: int
+    meal: FoodLog  # 登録するあすけんの食事記録
+    delete_log_id: Optional[int] = None  # 登録前に削除するlogId。新規登録の場合None
+    deleted: bool = False  # delete_log_idの削除が完了したかどうか
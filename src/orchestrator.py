@@ -0,0 +1,210 @@
+from typing import Any, Optional
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import math
+
+from .const import DAILY_MEAL_TYPE_ID_LIST
+from .deadline import Deadline
+from .metrics import timer
+from .models.sync import OrchestrationReport, SyncReport
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+type WorkerHandler = Callable[[dict, Any], dict]
+
+
+def shard_of(account: str, shards: int) -> int:
+    """
+    Return the shard of the account by rendezvous hashing.
+    An account stays on the same shard as long as the number of shards does not change,
+    and only about 1/N of the accounts move when a shard is added.
+    """
+    return max(
+        range(shards),
+        key=lambda shard: hashlib.sha256(f"{shard}:{account}".encode()).digest(),
+    )
+
+
+def assign_shards(accounts: list[str], shards: int) -> dict[int, list[str]]:
+    """Return accounts of each shard which has at least one account."""
+    if shards < 1:
+        raise ValueError("shards must be 1 or more.")
+
+    assignment: dict[int, list[str]] = {}
+    for account in accounts:
+        assignment.setdefault(shard_of(account, shards), []).append(account)
+
+    return assignment
+
+
+class Invoker(ABC):
+    """Runs the worker of a shard and returns its result."""
+
+    @abstractmethod
+    def invoke(self, shard: int, payload: dict) -> dict:
+        """
+        Args:
+            shard (int): Shard number.
+            payload (dict): Event of the worker.
+        Returns:
+            dict: Result of the worker.
+        """
+
+
+class LocalInvoker(Invoker):
+    """Runs the worker handler in-process. For tests and local runs."""
+
+    def __init__(self, handler: WorkerHandler):
+        self._handler = handler
+
+    def invoke(self, shard: int, payload: dict) -> dict:
+        # Lambdaと同じくJSONを経由させ、シリアライズできない値を渡していないことを確かめる
+        return json.loads(
+            json.dumps(self._handler(json.loads(json.dumps(payload)), None))
+        )
+
+
+class LambdaInvoker(Invoker):
+    """Invokes the worker Lambda function synchronously."""
+
+    def __init__(self, client: Any, function_name: str):
+        """
+        Args:
+            client: boto3 Lambda client. Its read timeout must be longer than the worker's.
+            function_name (str): Name of the worker function. '{shard}' is replaced with the shard number,
+                so that each shard can have its own function or alias and keep its execution environments warm.
+        """
+        self._client = client
+        self._function_name = function_name
+
+    def invoke(self, shard: int, payload: dict) -> dict:
+        response = self._client.invoke(
+            FunctionName=self._function_name.format(shard=shard),
+            InvocationType="RequestResponse",
+            Payload=json.dumps(payload).encode(),
+        )
+        result = json.loads(response["Payload"].read())
+        if response.get("FunctionError"):
+            raise RuntimeError(f"Worker of shard {shard} failed: {result}")
+
+        return result
+
+
+class Orchestrator:
+    """
+    Split accounts across worker invocations and merge their reports.
+    Each worker gets the deadline of the orchestrator minus `margin` so that the results come back in time.
+    """
+
+    def __init__(self, invoker: Invoker, shards: int, margin: float = 5.0):
+        """
+        Args:
+            invoker (Invoker): Runs the worker of a shard.
+            shards (int): Number of shards (parallel workers).
+            margin (float): Seconds kept for invoking the workers and merging their results.
+        """
+        self._invoker = invoker
+        self._shards = shards
+        self._margin = margin
+
+    def run(
+        self,
+        accounts: list[str],
+        dates: list[str],
+        meal_type_id_list: Optional[list[int]] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> OrchestrationReport:
+        """
+        Sync the dates of every account.
+        Args:
+            accounts (list[str]): Accounts (secret names).
+            dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+            meal_type_id_list (Optional[list[int]]): Meal type IDs to sync. Defaults to the worker's default.
+            deadline (Optional[Deadline]): Deadline of the whole run.
+        Returns:
+            OrchestrationReport: Report of each account.
+        """
+        deadline = deadline or Deadline()
+        assignment = assign_shards(accounts, self._shards)
+        remaining = deadline.remaining() - self._margin
+        report = OrchestrationReport(shards=assignment)
+
+        def invoke(shard: int) -> dict:
+            payload: dict[str, Any] = {
+                "shard": shard,
+                "accounts": assignment[shard],
+                "dates": dates,
+                "deadline_seconds": remaining if remaining != math.inf else None,
+            }
+            if meal_type_id_list is not None:
+                payload["meal_type_id_list"] = meal_type_id_list
+            return self._invoker.invoke(shard, payload)
+
+        with timer(report.phases, "total"):
+            with ThreadPoolExecutor(max_workers=max(len(assignment), 1)) as executor:
+                futures = {
+                    shard: executor.submit(invoke, shard) for shard in assignment
+                }
+                for shard, future in futures.items():
+                    try:
+                        result = future.result()
+                        for account, account_report in result["reports"].items():
+                            report.accounts[account] = SyncReport(**account_report)
+                    except Exception as e:
+                        logger.error("Shard %d failed: %s", shard, e, exc_info=True)
+                        report.failed_shards.append(shard)
+                        for account in assignment[shard]:
+                            report.accounts[account] = SyncReport(
+                                dates=dates, pending_dates=dates, error=str(e)
+                            )
+
+        logger.info(
+            "Synced %d accounts in %d shards (failed shards: %s)",
+            len(report.accounts),
+            len(assignment),
+            report.failed_shards,
+        )
+
+        return report
+
+
+def run_worker(
+    event: dict,
+    sync_account: Callable[[str, list[str], list[int], Deadline], SyncReport],
+    deadline: Deadline,
+    startup_budget: float = 0.0,
+) -> dict:
+    """
+    Sync the accounts of a shard one by one.
+    Accounts which cannot start before the deadline are reported as pending.
+    Args:
+        event (dict): Payload created by the orchestrator.
+        sync_account (Callable): Syncs (account, dates, meal_type_id_list, deadline) and returns the report.
+        deadline (Deadline): Deadline of the worker.
+        startup_budget (float): Seconds needed to log in to an account at worst.
+    Returns:
+        dict: {"shard": shard, "reports": {account: report}}.
+    """
+    dates: list[str] = event["dates"]
+    meal_type_id_list: list[int] = (
+        event.get("meal_type_id_list") or DAILY_MEAL_TYPE_ID_LIST
+    )
+    reports: dict[str, dict] = {}
+    for account in event["accounts"]:
+        if not deadline.has_time_for(startup_budget):
+            report = SyncReport(dates=dates, pending_dates=dates)
+        else:
+            try:
+                report = sync_account(account, dates, meal_type_id_list, deadline)
+            except Exception as e:
+                logger.error("Sync of %s failed: %s", account, e, exc_info=True)
+                report = SyncReport(dates=dates, pending_dates=dates, error=str(e))
+        reports[account] = report.model_dump(mode="json")
+
+    return {"shard": event.get("shard"), "reports": reports}
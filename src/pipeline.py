@@ -0,0 +1,394 @@
+from typing import Optional
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import threading
+import time
+import uuid
+
+from pydantic import BaseModel
+
+from .models.asken import FoodLog
+from .models.sync import MealSyncResult
+from .sinks import FoodLogSink
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+type FetchFoodLog = Callable[[str, int], Optional[FoodLog]]
+type ResultCallback = Callable[[MealSyncResult], None]
+
+
+class FoodLogMessage(BaseModel):
+    """Message between the scrape stage and the write stage."""
+
+    message_id: str  # 冪等キー。同じ日付・食事・栄養素なら同じIDになる
+    date: str
+    meal_type_id: int
+    food_log: Optional[FoodLog] = None  # 食事記録が無い場合はNone
+
+    @classmethod
+    def create(
+        cls, date: str, meal_type_id: int, food_log: Optional[FoodLog]
+    ) -> "FoodLogMessage":
+        payload = food_log.model_dump_json() if food_log else ""
+        digest = hashlib.sha256(payload.encode()).hexdigest()[:16]
+        return cls(
+            message_id=f"{date}:{meal_type_id}:{digest}",
+            date=date,
+            meal_type_id=meal_type_id,
+            food_log=food_log,
+        )
+
+
+class ReceivedMessage(BaseModel):
+    receipt_handle: str
+    receive_count: int
+    message: FoodLogMessage
+
+
+class MessageQueue(ABC):
+    """
+    Queue between pipeline stages with at-least-once delivery (the same semantics as Amazon SQS).
+    A received message is hidden for the visibility timeout and delivered again unless it is deleted.
+    """
+
+    @abstractmethod
+    def send_batch(self, messages: list[FoodLogMessage]) -> None:
+        """Send messages to the queue."""
+
+    @abstractmethod
+    def receive(
+        self, max_messages: int = 10, wait_seconds: float = 0.0
+    ) -> list[ReceivedMessage]:
+        """Receive up to max_messages messages, waiting up to wait_seconds if the queue is empty."""
+
+    @abstractmethod
+    def delete_batch(self, receipt_handles: list[str]) -> None:
+        """Delete messages which have been processed."""
+
+    @abstractmethod
+    def approximate_count(self) -> int:
+        """Return the number of messages which are not deleted yet, including in-flight ones."""
+
+
+class InMemoryQueue(MessageQueue):
+    """MessageQueue for local runs. Bodies are serialized to JSON like SQS and validated on receive."""
+
+    def __init__(self, visibility_timeout: float = 30.0):
+        self._visibility_timeout = visibility_timeout
+        self._messages: deque[tuple[str, int]] = deque()  # (body, receive_count)
+        self._in_flight: dict[str, tuple[str, int, float]] = {}
+        self._condition = threading.Condition()
+
+    def send_batch(self, messages: list[FoodLogMessage]) -> None:
+        with self._condition:
+            for message in messages:
+                self._messages.append((message.model_dump_json(), 0))
+            self._condition.notify_all()
+
+    def receive(
+        self, max_messages: int = 10, wait_seconds: float = 0.0
+    ) -> list[ReceivedMessage]:
+        deadline = time.monotonic() + wait_seconds
+        with self._condition:
+            while True:
+                self._requeue_expired()
+                if self._messages:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(min(remaining, self._visibility_timeout))
+
+            received: list[ReceivedMessage] = []
+            while self._messages and len(received) < max_messages:
+                body, receive_count = self._messages.popleft()
+                receipt_handle = uuid.uuid4().hex
+                self._in_flight[receipt_handle] = (
+                    body,
+                    receive_count + 1,
+                    time.monotonic() + self._visibility_timeout,
+                )
+                received.append(
+                    ReceivedMessage(
+                        receipt_handle=receipt_handle,
+                        receive_count=receive_count + 1,
+                        message=FoodLogMessage.model_validate_json(body),
+                    )
+                )
+
+            return received
+
+    def delete_batch(self, receipt_handles: list[str]) -> None:
+        with self._condition:
+            for receipt_handle in receipt_handles:
+                self._in_flight.pop(receipt_handle, None)
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        expired = [
+            handle
+            for handle, (_, _, visible_at) in self._in_flight.items()
+            if visible_at <= now
+        ]
+        for handle in expired:
+            body, receive_count, _ = self._in_flight.pop(handle)
+            self._messages.append((body, receive_count))
+
+    def approximate_count(self) -> int:
+        with self._condition:
+            return len(self._messages) + len(self._in_flight)
+
+
+class ScrapeStage:
+    """Scrape Asken and send a message per date and meal."""
+
+    def __init__(
+        self,
+        fetch_food_log: FetchFoodLog,
+        queue: MessageQueue,
+        workers: int = 2,
+        batch_size: int = 10,
+        on_result: Optional[ResultCallback] = None,
+    ):
+        self._fetch_food_log = fetch_food_log
+        self._queue = queue
+        self._workers = workers
+        self._batch_size = batch_size
+        self._on_result = on_result
+
+    def run(self, tasks: Iterable[tuple[str, int]]) -> int:
+        """
+        Scrape food logs of the tasks and send them to the queue in batches.
+        Args:
+            tasks (Iterable[tuple[str, int]]): Pairs of date and meal type ID.
+        Returns:
+            int: Number of messages sent.
+        """
+        sent = 0
+        batch: list[FoodLogMessage] = []
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                executor.submit(self._fetch_food_log, date, meal_type_id): (
+                    date,
+                    meal_type_id,
+                )
+                for date, meal_type_id in tasks
+            }
+            for future in as_completed(futures):
+                date, meal_type_id = futures[future]
+                try:
+                    food_log = future.result()
+                except Exception as e:
+                    logger.error(
+                        "Failed to scrape %s (meal type %s): %s", date, meal_type_id, e
+                    )
+                    if self._on_result:
+                        self._on_result(
+                            MealSyncResult(
+                                date=date,
+                                meal_type_id=meal_type_id,
+                                status="failed",
+                                reason="scrape_failed",
+                                error=str(e),
+                            )
+                        )
+                    continue
+
+                batch.append(FoodLogMessage.create(date, meal_type_id, food_log))
+                if len(batch) >= self._batch_size:
+                    self._queue.send_batch(batch)
+                    sent += len(batch)
+                    batch = []
+
+        if batch:
+            self._queue.send_batch(batch)
+            sent += len(batch)
+
+        return sent
+
+
+class WriteStage:
+    """
+    Receive messages and publish them to the sinks.
+    Messages are deleted only when every sink succeeded, otherwise they are redelivered after the visibility timeout.
+    Pairs of message ID and sink which already succeeded are never written again, so redelivery is idempotent.
+    A message redelivered while another worker is still publishing it (a publish longer than the visibility timeout)
+    is not published again: it is deleted together with the first delivery when that one succeeds.
+    Results are reported to `on_result` only once they are final: on success, or on the last failed attempt.
+    """
+
+    def __init__(
+        self,
+        sinks: list[FoodLogSink],
+        queue: MessageQueue,
+        workers: int = 2,
+        batch_size: int = 10,
+        max_receive_count: int = 3,
+        on_result: Optional[ResultCallback] = None,
+    ):
+        self._sinks = sinks
+        self._queue = queue
+        self._workers = workers
+        self._batch_size = batch_size
+        self._max_receive_count = max_receive_count
+        self._on_result = on_result
+        self._processed: set[tuple[str, str]] = set()  # (message_id, sink名)
+        # 処理中のmessage_id -> 処理中に再配信された同じメッセージのreceipt handle
+        self._in_flight: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+        self.dead_letters: list[FoodLogMessage] = []
+
+    def run(self, stop: threading.Event, wait_seconds: float = 0.5) -> None:
+        """
+        Process messages with worker threads until stop is set and the queue is drained.
+        Args:
+            stop (threading.Event): Set when no more messages will be sent.
+            wait_seconds (float): Long polling time of each receive.
+        """
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = [
+                executor.submit(self._work, stop, wait_seconds)
+                for _ in range(self._workers)
+            ]
+            for future in futures:
+                future.result()
+
+    def _work(self, stop: threading.Event, wait_seconds: float):
+        while True:
+            received = self._queue.receive(self._batch_size, wait_seconds)
+            if received:
+                self.process(received)
+            elif stop.is_set() and self._queue.approximate_count() == 0:
+                return
+
+    def process(self, received: list[ReceivedMessage]) -> None:
+        """Publish a batch of received messages and delete those which succeeded."""
+        owned: list[ReceivedMessage] = []
+        for item in received:
+            with self._lock:
+                redelivered = self._in_flight.get(item.message.message_id)
+                if redelivered is not None:
+                    # 他のワーカーが書き込み中。二重に書き込まず、成功したら一緒に削除してもらう
+                    redelivered.append(item.receipt_handle)
+                    continue
+                self._in_flight[item.message.message_id] = []
+            owned.append(item)
+
+        done: list[ReceivedMessage] = []
+        try:
+            done = self._publish(owned)
+        finally:
+            handles = [item.receipt_handle for item in done]
+            with self._lock:
+                for item in owned:
+                    redelivered = self._in_flight.pop(item.message.message_id)
+                    if item in done:
+                        handles.extend(redelivered)
+            if handles:
+                self._queue.delete_batch(handles)
+
+    def _publish(self, received: list[ReceivedMessage]) -> list[ReceivedMessage]:
+        """Publish messages to the sinks. Returns the messages which can be deleted."""
+        done: list[ReceivedMessage] = []
+        pending: dict[str, list[ReceivedMessage]] = {}
+        for item in received:
+            if item.receive_count > self._max_receive_count:
+                logger.error(
+                    "Give up message %s after %d receives",
+                    item.message.message_id,
+                    item.receive_count - 1,
+                )
+                with self._lock:
+                    self.dead_letters.append(item.message)
+                done.append(item)
+            else:
+                pending.setdefault(item.message.date, []).append(item)
+
+        for date, items in pending.items():
+            failed: set[str] = set()
+            for sink in self._sinks:
+                with self._lock:
+                    targets = [
+                        item
+                        for item in items
+                        if (item.message.message_id, sink.name) not in self._processed
+                    ]
+                if not targets:
+                    continue
+
+                by_meal = {item.message.meal_type_id: item for item in targets}
+                food_logs = {
+                    meal_type_id: item.message.food_log
+                    for meal_type_id, item in by_meal.items()
+                }
+                results = sink.publish(date, food_logs)
+                failed_meals = {r.meal_type_id for r in results if r.status == "failed"}
+                for result in results:
+                    # 再配信される失敗は途中経過のため報告しない
+                    final = (
+                        result.status != "failed"
+                        or result.meal_type_id not in by_meal
+                        or by_meal[result.meal_type_id].receive_count
+                        >= self._max_receive_count
+                    )
+                    if self._on_result and final:
+                        self._on_result(result)
+
+                with self._lock:
+                    for item in targets:
+                        if item.message.meal_type_id in failed_meals:
+                            failed.add(item.message.message_id)
+                        else:
+                            self._processed.add((item.message.message_id, sink.name))
+
+            done.extend(item for item in items if item.message.message_id not in failed)
+
+        return done
+
+
+def run_pipeline(
+    fetch_food_log: FetchFoodLog,
+    sinks: list[FoodLogSink],
+    tasks: Iterable[tuple[str, int]],
+    queue: Optional[MessageQueue] = None,
+    scrape_workers: int = 2,
+    write_workers: int = 2,
+    batch_size: int = 10,
+    on_result: Optional[ResultCallback] = None,
+) -> list[FoodLogMessage]:
+    """
+    Run the scrape stage and the write stage concurrently, connected by a queue.
+    Args:
+        fetch_food_log (FetchFoodLog): Function to fetch a food log of Asken.
+        sinks (list[FoodLogSink]): Destinations of the food logs.
+        tasks (Iterable[tuple[str, int]]): Pairs of date and meal type ID.
+        queue (Optional[MessageQueue]): Queue between the stages. Defaults to InMemoryQueue.
+            The visibility timeout of a remote queue must be longer than the slowest publish,
+            since only the workers of this process know which messages are still being written.
+        on_result (Optional[ResultCallback]): Called with the final result of each meal as soon as it is available.
+    Returns:
+        list[FoodLogMessage]: Messages which could not be written (dead letters).
+    """
+    # ローカル実行では失敗したメッセージを早めに再配信する。書き込み中の再配信はWriteStageが重複を除く
+    queue = queue or InMemoryQueue(visibility_timeout=5.0)
+    scrape = ScrapeStage(
+        fetch_food_log, queue, scrape_workers, batch_size, on_result=on_result
+    )
+    write = WriteStage(sinks, queue, write_workers, batch_size, on_result=on_result)
+
+    stop = threading.Event()
+    writer = threading.Thread(target=write.run, args=(stop,), daemon=True)
+    writer.start()
+    try:
+        scrape.run(tasks)
+    finally:
+        stop.set()
+        writer.join()
+
+    return write.dead_letters
@@ -0,0 +1,163 @@
+from typing import Any, Optional
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from datetime import datetime
+import cProfile
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+DEFAULT_PROFILE_DIR = os.path.join(tempfile.gettempdir(), "asken-fitbit-sync-profiles")
+PROFILE_MODES = ("sampling", "deterministic")
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler which samples the stacks of all threads at a fixed interval.
+    Much cheaper than cProfile on I/O heavy runs, and the result is written as collapsed stacks
+    which flamegraph.pl or speedscope can read.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Args:
+            interval (float): Seconds between samples.
+        """
+        self._interval = interval
+        self._stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                current: Any = frame
+                while current is not None:
+                    code = current.f_code
+                    stack.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}:{current.f_lineno}"
+                    )
+                    current = current.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profiling_enabled(event: Optional[dict] = None) -> bool:
+    """Return whether profiling is switched on by the PROFILE environment variable or the event's 'profile' field."""
+    if os.environ.get("PROFILE") == "1":
+        return True
+    return bool(event and event.get("profile"))
+
+
+@contextmanager
+def profile(
+    name: str,
+    directory: Optional[str] = None,
+    mode: Optional[str] = None,
+    top_n: int = 25,
+) -> Iterator[None]:
+    """
+    Profile CPU and memory of the block and write the results to the directory.
+
+    Files:
+        <name>.collapsed: Collapsed stacks of all threads (sampling mode).
+        <name>.pstats: cProfile statistics (deterministic mode). Read with `python -m pstats` or snakeviz.
+            cProfile hooks sys.monitoring since Python 3.12, so calls in worker threads are included.
+        <name>.alloc.txt: Top allocations by line and the peak traced memory.
+    Args:
+        name (str): Prefix of the result files.
+        directory (Optional[str]): Output directory. Defaults to PROFILE_DIR environment variable or a directory in /tmp.
+        mode (Optional[str]): 'sampling' or 'deterministic' (cProfile). Defaults to PROFILE_MODE environment variable or 'sampling'.
+        top_n (int): Number of allocation sites written to the summary.
+    """
+    directory = directory or os.environ.get("PROFILE_DIR", DEFAULT_PROFILE_DIR)
+    # 同期の大半はワーカースレッドで行われるため、全スレッドを低コストで見られるサンプリングを既定にする
+    mode = mode or os.environ.get("PROFILE_MODE", "sampling")
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, name)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    cpu_profiler = cProfile.Profile() if mode == "deterministic" else None
+    sampler = SamplingProfiler() if mode == "sampling" else None
+    if cpu_profiler:
+        cpu_profiler.enable()
+    if sampler:
+        sampler.start()
+
+    try:
+        yield
+    finally:
+        if cpu_profiler:
+            cpu_profiler.disable()
+            cpu_profiler.dump_stats(f"{prefix}.pstats")
+        if sampler:
+            sampler.stop()
+            sampler.write_collapsed(f"{prefix}.collapsed")
+
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+        _write_allocations(f"{prefix}.alloc.txt", snapshot, peak, top_n)
+        logger.info("Profile written to %s.*", prefix)
+
+
+def _write_allocations(
+    path: str, snapshot: tracemalloc.Snapshot, peak: int, top_n: int
+) -> None:
+    # 計測用のモジュール自体の確保は除外する
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    stats = snapshot.statistics("lineno")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+        f.write(
+            f"Current traced memory: {sum(s.size for s in stats) / 1024:.1f} KiB\n\n"
+        )
+        for stat in stats[:top_n]:
+            f.write(f"{stat}\n")
+
+
+def maybe_profile(
+    enabled: bool, name: Optional[str] = None, **kwargs
+) -> AbstractContextManager:
+    """
+    Return `profile(...)` if enabled, otherwise a no-op context manager.
+    Args:
+        enabled (bool): Whether to profile.
+        name (Optional[str]): Prefix of the result files. Defaults to 'run-<timestamp>'.
+    """
+    if not enabled:
+        return nullcontext()
+
+    name = name or f"run-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+    return profile(name, **kwargs)
@@ -0,0 +1,142 @@
+from typing import Optional
+from collections.abc import Callable
+import math
+import threading
+import time
+
+import requests
+
+from .hedging import LatencyTracker
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# 負荷が高すぎる、または制限されていると判断するステータスコード
+OVERLOAD_STATUS_CODES = {403, 429}
+
+
+class AimdLimiter:
+    """
+    Adaptive limit of concurrent requests (additive increase, multiplicative decrease).
+
+    While responses succeed and stay fast, the limit grows by about one per round of requests.
+    On 403, 429, 5xx, a timeout, or a response slower than `latency_factor` times the unloaded latency,
+    the limit is multiplied by `decrease`. Responses of requests sent before the last decrease
+    do not decrease it again, so that one overload is punished only once.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 2.0,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        decrease: float = 0.5,
+        latency_factor: float = 3.0,
+        min_baseline: float = 0.05,
+        tracker: Optional[LatencyTracker] = None,
+    ):
+        """
+        Args:
+            initial_limit (float): Concurrency at the start.
+            min_limit (int): Concurrency never goes below this.
+            max_limit (int): Concurrency never goes above this.
+            decrease (float): Factor by which the limit is multiplied on overload (0-1).
+            latency_factor (float): Responses slower than this times the unloaded latency count as overload.
+            min_baseline (float): Unloaded latency is assumed to be at least this many seconds,
+                so that jitter of very fast responses is not taken for overload.
+            tracker (Optional[LatencyTracker]): Latency distribution. Its threshold is used as the unloaded latency.
+        """
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1.")
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("min_limit must be between 1 and max_limit.")
+
+        self._limit = min(max(initial_limit, min_limit), max_limit)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._decrease = decrease
+        self._latency_factor = latency_factor
+        self._min_baseline = min_baseline
+        # 低い分位点を負荷の無い時のレイテンシとみなす
+        self.tracker = tracker or LatencyTracker(
+            percentile=0.1, min_samples=10, initial_threshold=math.inf
+        )
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self.requests = 0
+        self.decreases = 0
+        self.peak_limit = self._limit
+
+    @property
+    def limit(self) -> int:
+        """Current number of requests allowed in flight."""
+        with self._condition:
+            return int(self._limit)
+
+    def _acquire(self) -> float:
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            self.requests += 1
+        return time.monotonic()
+
+    def _release(self, started: float, overloaded: bool) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if overloaded:
+                if started >= self._last_decrease:
+                    self._limit = max(self._limit * self._decrease, self._min_limit)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+                    logger.info("Overload detected, concurrency -> %d", self._limit)
+            else:
+                # 1往復分の応答ごとに1増える
+                self._limit = min(self._limit + 1 / self._limit, self._max_limit)
+                self.peak_limit = max(self.peak_limit, self._limit)
+            self._condition.notify_all()
+
+    def _is_overloaded(self, response: requests.Response, seconds: float) -> bool:
+        if response.status_code in OVERLOAD_STATUS_CODES or response.status_code >= 500:
+            return True
+        baseline = max(self.tracker.threshold(), self._min_baseline)
+        return seconds > self._latency_factor * baseline
+
+    def request(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Send a request when a slot is free and adjust the limit by its outcome.
+        Args:
+            send (Callable[[], requests.Response]): Sends the request.
+        Returns:
+            requests.Response: Response of the request. Error statuses are returned as they are.
+        """
+        started = self._acquire()
+        overloaded = True
+        try:
+            response = send()
+            seconds = time.monotonic() - started
+            overloaded = self._is_overloaded(response, seconds)
+            if response.ok:
+                self.tracker.record(seconds)
+            return response
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            raise
+        except Exception:
+            # 負荷と関係の無いエラーで制限を下げない
+            overloaded = False
+            raise
+        finally:
+            self._release(started, overloaded)
+
+    def stats(self) -> dict[str, float]:
+        """Return the concurrency the limiter settled on and its counters."""
+        with self._condition:
+            return {
+                "limit": int(self._limit),
+                "peak_limit": int(self.peak_limit),
+                "requests": self.requests,
+                "decreases": self.decreases,
+            }
@@ -0,0 +1,829 @@
+from typing import Any, Optional
+from abc import ABC, abstractmethod
+from datetime import datetime
+import csv
+import os
+import threading
+import time
+
+import requests
+from requests.exceptions import HTTPError, RequestException
+
+from .const import (
+    COMPACTION_BATCH_SIZE,
+    CUSTOM_FOOD_MAX_AGE_DAYS,
+    DEFAULT_TIMEOUT,
+    MEAL_TYPES,
+    NUTRITIONS,
+)
+from .custom_foods import CustomFoodCache
+from .deadline import Deadline
+from .export import NutritionStore
+from .fitbit import Fitbit
+from .journal import WriteJournal
+from .ledger import LedgerEntry, SyncLedger, fingerprint
+from .models.asken import FoodLog
+from .models.fitbit import CreateFoodLogParams, Food, GetFoodLogResponse
+from .models.sync import MealSyncResult, SinkStats
+from .utils import get_logger, safe_api_call
+
+
+logger = get_logger(__name__)
+
+
+class FoodLogSink(ABC):
+    """
+    Destination of food logs scraped from Asken.
+
+    Subclasses implement `write`. `publish` wraps it with retries and keeps per-sink statistics,
+    so one failing sink never affects the others.
+    """
+
+    name: str = "sink"
+    retryable_errors: tuple[type[Exception], ...] = (RequestException, OSError)
+
+    def __init__(self, max_retries: int = 2, retry_interval: float = 1.0):
+        self._max_retries = max_retries
+        self._retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self.stats = SinkStats(name=self.name)
+
+    @abstractmethod
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        """
+        Write food logs of one day.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            food_logs (dict[int, Optional[FoodLog]]): Meal type ID to food log. None if the meal is not logged.
+        Returns:
+            list[MealSyncResult]: Result of each meal type.
+        """
+
+    def publish(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        """
+        Write food logs of one day with retries. Never raises.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            food_logs (dict[int, Optional[FoodLog]]): Meal type ID to food log. None if the meal is not logged.
+        Returns:
+            list[MealSyncResult]: Result of each meal type.
+        """
+        for attempt in range(self._max_retries + 1):
+            try:
+                results = self.write(date, food_logs)
+                break
+            except self.retryable_errors as e:
+                if attempt >= self._max_retries:
+                    results = self.failed_results(date, food_logs, e)
+                    break
+
+                with self._lock:
+                    self.stats.retries += 1
+                logger.warning(
+                    "Retrying %s sink for %s (%d/%d): %s",
+                    self.name,
+                    date,
+                    attempt + 1,
+                    self._max_retries,
+                    e,
+                )
+                time.sleep(self._retry_interval * 2**attempt)
+            except Exception as e:
+                logger.error(
+                    "Unexpected error in %s sink for %s: %s",
+                    self.name,
+                    date,
+                    e,
+                    exc_info=True,
+                )
+                results = self.failed_results(date, food_logs, e)
+                break
+
+        with self._lock:
+            for result in results:
+                result.sink = self.name
+                if result.status == "failed":
+                    self.stats.failed += 1
+                else:
+                    self.stats.succeeded += 1
+
+        return results
+
+    @staticmethod
+    def failed_results(
+        date: str, food_logs: dict[int, Optional[FoodLog]], error: Exception
+    ) -> list[MealSyncResult]:
+        """Return a failed result for each meal, e.g. when the date could not be written."""
+        return [
+            MealSyncResult(
+                date=date,
+                meal_type_id=meal_type_id,
+                status="failed",
+                reason="error",
+                calories=float(food_log.calories) if food_log else None,
+                error=str(error),
+            )
+            for meal_type_id, food_log in food_logs.items()
+        ]
+
+
+class FitbitSink(FoodLogSink):
+    """Register food logs to Fitbit as one food per meal."""
+
+    name = "fitbit"
+
+    def __init__(
+        self,
+        fitbit: Fitbit,
+        dry_run: bool = False,
+        request_budget: float = sum(DEFAULT_TIMEOUT),
+        custom_foods: Optional[CustomFoodCache] = None,
+        compaction_batch_size: int = COMPACTION_BATCH_SIZE,
+        ledger: Optional[SyncLedger] = None,
+        journal: Optional[WriteJournal] = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._fitbit = fitbit
+        self._dry_run = dry_run  # Trueの場合、Fitbitへの書き込みを行わない
+        self._request_budget = request_budget  # 1リクエストにかかる最大秒数
+        self._custom_foods = custom_foods
+        self._compaction_batch_size = (
+            compaction_batch_size  # 1日に削除する重複登録の上限
+        )
+        # 前回同期した内容。変わっていない食事はFitbitを参照せずにスキップする
+        self._ledger = ledger
+        # 削除と再登録の間で終了しても、次回の起動時に再登録できるよう書き込みを先に記録する
+        self._journal = journal
+        self.deadline = Deadline()
+        self._prefetched: dict[str, GetFoodLogResponse] = {}
+        self._prefetched_lock = threading.Lock()
+
+    def prefetch_food_log(self, date: str) -> Optional[GetFoodLogResponse]:
+        """
+        Fetch food log from Fitbit and keep it for the next write of the date.
+        If it is already kept (e.g. fetched during startup), it is returned without fetching again.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+        Returns:
+            GetFoodLogResponse: Parsed food log data.
+        """
+        with self._prefetched_lock:
+            food_logs = self._prefetched.get(date)
+        if food_logs:
+            return food_logs
+
+        food_logs = self.fetch_fitbit_food_log(date)
+        if food_logs:
+            self.keep_prefetched(date, food_logs)
+
+        return food_logs
+
+    def keep_prefetched(self, date: str, food_logs: GetFoodLogResponse) -> None:
+        """Keep food log of the date fetched elsewhere for the next write of the date."""
+        with self._prefetched_lock:
+            self._prefetched[date] = food_logs
+
+    def discard_prefetched(self, date: str) -> None:
+        """Drop the prefetched food log of the date when it will not be written."""
+        with self._prefetched_lock:
+            self._prefetched.pop(date, None)
+
+    @safe_api_call("Fitbit")
+    def fetch_fitbit_food_log(self, date: str) -> Optional[GetFoodLogResponse]:
+        """
+        Fetch food log from Fitbit for a specific date.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+        Returns:
+            GetFoodLogResponse: Parsed food log data.
+        """
+        return self._fitbit.fetch_food_log(date)
+
+    @safe_api_call("Fitbit")
+    def delete_fitbit_food_log(self, food_log_id: int) -> requests.Response:
+        """
+        Delete a food log from Fitbit by its ID.
+        Args:
+            food_log_id (int): The ID of the food log to delete.
+        """
+        return self._fitbit.delete_food_log(food_log_id)
+
+    @safe_api_call("Fitbit")
+    def create_fitbit_food_log(self, params: CreateFoodLogParams) -> dict:
+        """
+        Create a food log in Fitbit.
+        Args:
+            params (CreateFoodLogParams): Parameters for creating the food log.
+        """
+        return self._fitbit.create_food_log(params)
+
+    @safe_api_call("Fitbit")
+    def delete_fitbit_food(self, food_id: int) -> requests.Response:
+        """
+        Delete a custom food from Fitbit by its ID.
+        Args:
+            food_id (int): The ID of the custom food to delete.
+        """
+        return self._fitbit.delete_food(food_id)
+
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        with self._prefetched_lock:
+            prefetched = self._prefetched.pop(date, None)
+
+        results: list[MealSyncResult] = []
+        if self._ledger:
+            # 台帳にある食事はFitbitの記録を取得せずに同期し、残りだけ取得して比較する
+            food_logs, results = self._write_from_ledger(date, food_logs)
+            if not food_logs:
+                return results
+
+        fitbit_food_logs = prefetched
+        if not fitbit_food_logs:
+            if not self.deadline.has_time_for(self._request_budget):
+                return results + [
+                    MealSyncResult(
+                        date=date,
+                        meal_type_id=meal_type_id,
+                        status="skipped",
+                        reason="deadline",
+                        dry_run=self._dry_run,
+                    )
+                    for meal_type_id in food_logs
+                ]
+            fitbit_food_logs = self.fetch_fitbit_food_log(date)
+        if not fitbit_food_logs:
+            return results + self.failed_results(
+                date, food_logs, ValueError("Fitbit food log is not available.")
+            )
+
+        max_deletes = self._compaction_batch_size
+        for meal_type_id, meal in food_logs.items():
+            result = self._sync_meal(
+                date, meal_type_id, meal, fitbit_food_logs, max_deletes
+            )
+            max_deletes -= result.duplicates_deleted
+            self._record(date, meal, result)
+            results.append(result)
+
+        return results
+
+    def _write_from_ledger(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> tuple[dict[int, Optional[FoodLog]], list[MealSyncResult]]:
+        """
+        Sync meals recorded in the ledger without fetching the Fitbit food log.
+        Returns:
+            tuple[dict[int, Optional[FoodLog]], list[MealSyncResult]]: Meals not in the ledger, and results of the others.
+        """
+        assert self._ledger is not None
+        remaining: dict[int, Optional[FoodLog]] = {}
+        results = []
+        for meal_type_id, meal in food_logs.items():
+            entry = self._ledger.get(date, meal_type_id)
+            if entry is None:
+                remaining[meal_type_id] = meal
+            elif entry.fingerprint == fingerprint(meal):
+                results.append(
+                    MealSyncResult(
+                        date=date,
+                        meal_type_id=meal_type_id,
+                        status="skipped",
+                        reason="unchanged",
+                        calories=float(meal.calories) if meal else None,
+                        log_id=entry.log_id,
+                        dry_run=self._dry_run,
+                    )
+                )
+            else:
+                result = self._replace_by_log_id(date, meal_type_id, meal, entry)
+                self._record(date, meal, result)
+                results.append(result)
+
+        return remaining, results
+
+    def _replace_by_log_id(
+        self,
+        date: str,
+        meal_type_id: int,
+        meal: Optional[FoodLog],
+        entry: LedgerEntry,
+    ) -> MealSyncResult:
+        """Replace a changed meal, deleting the entry by the logId in the ledger."""
+        result = MealSyncResult(
+            date=date,
+            meal_type_id=meal_type_id,
+            status="skipped",
+            log_id=entry.log_id,
+            dry_run=self._dry_run,
+        )
+        if not meal or not meal.logged:
+            # 取得して比較する場合と同じく、Fitbitの登録は残す
+            result.reason = "no_log"
+            return result
+
+        result.calories = float(meal.calories)
+        needed = (2 if entry.log_id else 1) * self._request_budget
+        if not self._dry_run and not self.deadline.has_time_for(needed):
+            result.reason = "deadline"
+            return result
+
+        is_registered = entry.log_id is not None
+        journal_id = self._plan_write(date, meal_type_id, meal, entry.log_id)
+        if entry.log_id and not self._dry_run:
+            logger.info("Delete %s on %s", MEAL_TYPES[meal_type_id]["name"], date)
+            if not self._delete_if_exists(entry.log_id):
+                self._finish_write(journal_id)
+                result.status = "failed"
+                result.reason = "delete_failed"
+                return result
+            self._mark_deleted(journal_id)
+
+        result.log_id = None
+        if not self._dry_run:
+            created = self._create_food_log(date, meal_type_id, meal)
+            if not created:
+                result.status = "deleted" if is_registered else "failed"
+                result.reason = "create_failed"
+                return result
+            self._finish_write(journal_id)
+            result.log_id = self._created_log_id(created)
+
+        logger.info("Create %s on %s", MEAL_TYPES[meal_type_id]["name"], date)
+        result.status = "replaced" if is_registered else "created"
+
+        return result
+
+    @staticmethod
+    def _created_log_id(response: dict) -> Optional[int]:
+        """Return the logId of a created food log, or None if the response has none."""
+        return response.get("foodLog", {}).get("logId")
+
+    def _record(
+        self, date: str, meal: Optional[FoodLog], result: MealSyncResult
+    ) -> None:
+        """Record the result of a meal in the ledger."""
+        if not self._ledger or self._dry_run:
+            return
+
+        if result.status in ("failed", "deleted") or (
+            result.status in ("created", "replaced") and result.log_id is None
+        ):
+            # Fitbitの状態が分からない場合や、登録したlogIdが分からず台帳から削除できない場合は、次回は取得して比較する
+            self._ledger.forget(date, result.meal_type_id)
+        elif result.status in ("created", "replaced") or result.reason in (
+            "already_registered",
+            "no_log",
+        ):
+            self._ledger.put(
+                date,
+                result.meal_type_id,
+                LedgerEntry(fingerprint=fingerprint(meal), log_id=result.log_id),
+            )
+
+    def compact(
+        self, date: str, meal_type_id_list: list[int] = [1, 2, 3, 4]
+    ) -> list[MealSyncResult]:
+        """
+        Delete duplicate entries registered by this tool without scraping Asken.
+        The latest entry of each meal is kept.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id_list (list[int]): List of meal type IDs to compact.
+        Returns:
+            list[MealSyncResult]: Result of each meal type.
+        """
+        food_logs = self.fetch_fitbit_food_log(date)
+        results = []
+        max_deletes = self._compaction_batch_size
+        for meal_type_id in meal_type_id_list:
+            result = MealSyncResult(
+                date=date,
+                meal_type_id=meal_type_id,
+                status="skipped",
+                reason="no_duplicates",
+                sink=self.name,
+                dry_run=self._dry_run,
+            )
+            _, duplicates = self._select_entries(meal_type_id, food_logs)
+            if duplicates:
+                result.duplicates_deleted = self._delete_duplicates(
+                    date, meal_type_id, duplicates, max_deletes
+                )
+                max_deletes -= result.duplicates_deleted
+                if result.duplicates_deleted < len(duplicates):
+                    result.reason = "partially_compacted"
+                else:
+                    result.reason = None
+                if result.duplicates_deleted:
+                    result.status = "compacted"
+                    if self._ledger:
+                        # 台帳のlogIdが削除された可能性があるため、次回は取得して比較する
+                        self._ledger.forget(date, meal_type_id)
+            results.append(result)
+
+        return results
+
+    @staticmethod
+    def _select_entries(
+        meal_type_id: int, food_logs: GetFoodLogResponse, calories: Any = None
+    ) -> tuple[Optional[Food], list[Food]]:
+        """
+        Select the Fitbit entry of a meal to keep and the duplicate entries to delete.
+        Only entries named as this tool's meal are treated as duplicates.
+        Args:
+            meal_type_id (int): Meal type ID (1: 朝食, 2: 昼食, 3: 夕食, 4: 間食).
+            food_logs (GetFoodLogResponse): Food logs registered in Fitbit on the date.
+            calories: Calories of Asken. The entry with the same calories is kept if any.
+        Returns:
+            tuple[Optional[Food], list[Food]]: The entry to keep, and the duplicates.
+        """
+        meal_type = MEAL_TYPES[meal_type_id]
+        entries = [
+            food
+            for food in food_logs.foods
+            if food.loggedFood.mealTypeId == meal_type["fitbit_id"]
+        ]
+        ours = [food for food in entries if food.loggedFood.name == meal_type["name"]]
+        if not ours:
+            return (entries[-1] if entries else None), []
+
+        kept = next(
+            (
+                food
+                for food in reversed(ours)
+                if calories is not None and food.loggedFood.calories == calories
+            ),
+            ours[-1],
+        )
+
+        return kept, [food for food in ours if food is not kept]
+
+    def _delete_duplicates(
+        self, date: str, meal_type_id: int, duplicates: list[Food], max_deletes: int
+    ) -> int:
+        """Delete up to max_deletes duplicate entries within the deadline. Returns the number deleted."""
+        deleted = 0
+        for food in duplicates[: max(max_deletes, 0)]:
+            if not self._dry_run:
+                if not self.deadline.has_time_for(self._request_budget):
+                    break
+                # 同時に実行したcompactや再試行で削除済みの場合も、削除できたものとして扱う
+                if not self._delete_if_exists(food.logId):
+                    continue
+            deleted += 1
+
+        if deleted:
+            logger.info(
+                "Deleted %d duplicate %s on %s",
+                deleted,
+                MEAL_TYPES[meal_type_id]["name"],
+                date,
+            )
+
+        return deleted
+
+    def _sync_meal(
+        self,
+        date: str,
+        meal_type_id: int,
+        meal: Optional[FoodLog],
+        food_logs: GetFoodLogResponse,
+        max_deletes: int = COMPACTION_BATCH_SIZE,
+    ) -> MealSyncResult:
+        """
+        Sync one meal of Asken to Fitbit.
+        Args:
+            date (str): Date in the format 'YYYY-MM-DD'.
+            meal_type_id (int): Meal type ID (1: 朝食, 2: 昼食, 3: 夕食, 4: 間食).
+            meal (Optional[FoodLog]): Food log of Asken.
+            food_logs (GetFoodLogResponse): Food logs registered in Fitbit on the date.
+            max_deletes (int): Maximum number of duplicate entries to delete.
+        Returns:
+            MealSyncResult: Result of the meal.
+        """
+        result = MealSyncResult(
+            date=date,
+            meal_type_id=meal_type_id,
+            status="skipped",
+            dry_run=self._dry_run,
+        )
+
+        # 部分的な失敗で残った重複登録は、正しい1件を残して削除する
+        registered, duplicates = self._select_entries(
+            meal_type_id, food_logs, meal.calories if meal else None
+        )
+        if duplicates:
+            result.duplicates_deleted = self._delete_duplicates(
+                date, meal_type_id, duplicates, max_deletes
+            )
+
+        result.log_id = registered.logId if registered else None
+        if not meal or not meal.logged:
+            logger.info(
+                "No food log found for date %s and meal type %s.", date, meal_type_id
+            )
+            result.reason = "no_log"
+            return result
+
+        result.calories = float(meal.calories)
+
+        is_registered = registered is not None
+        if registered and registered.loggedFood.calories == meal.calories:
+            logger.info(
+                "Already registered %s on %s", MEAL_TYPES[meal_type_id]["name"], date
+            )
+            result.reason = "already_registered"
+            return result
+
+        # 削除後に再登録できないと食事記録が消えてしまうため、両方を終えられる時間がなければ何もしない
+        needed = (2 if is_registered else 1) * self._request_budget
+        if not self._dry_run and not self.deadline.has_time_for(needed):
+            result.reason = "deadline"
+            return result
+
+        # updateではPFC情報が更新できないため、削除して再登録
+        journal_id = self._plan_write(
+            date, meal_type_id, meal, registered.logId if registered else None
+        )
+        if registered:
+            logger.info("Delete %s on %s", MEAL_TYPES[meal_type_id]["name"], date)
+            if not self._dry_run:
+                res = self.delete_fitbit_food_log(registered.logId)
+                if not res:
+                    self._finish_write(journal_id)
+                    result.status = "failed"
+                    result.reason = "delete_failed"
+                    return result
+                self._mark_deleted(journal_id)
+
+        result.log_id = None
+        if not self._dry_run:
+            res = self._create_food_log(date, meal_type_id, meal)
+            if not res:
+                result.status = "deleted" if is_registered else "failed"
+                result.reason = "create_failed"
+                return result
+            self._finish_write(journal_id)
+            result.log_id = self._created_log_id(res)
+
+        logger.info("Create %s on %s", MEAL_TYPES[meal_type_id]["name"], date)
+        result.status = "replaced" if is_registered else "created"
+
+        return result
+
+    def _delete_if_exists(self, food_log_id: int) -> bool:
+        """Delete a food log. Returns True if it is gone, including when it was already deleted."""
+        try:
+            return bool(self.delete_fitbit_food_log(food_log_id))
+        except HTTPError as e:
+            # ユーザーが削除済みの場合は404が返る
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return True
+
+    def _plan_write(
+        self,
+        date: str,
+        meal_type_id: int,
+        meal: FoodLog,
+        delete_log_id: Optional[int],
+    ) -> Optional[str]:
+        """Record a write in the journal before it runs. Returns its ID, or None if nothing is journaled."""
+        if not self._journal or self._dry_run:
+            return None
+
+        return self._journal.plan(date, meal_type_id, meal, delete_log_id)
+
+    def _mark_deleted(self, journal_id: Optional[str]) -> None:
+        if self._journal and journal_id:
+            self._journal.mark_deleted(journal_id)
+
+    def _finish_write(self, journal_id: Optional[str]) -> None:
+        if self._journal and journal_id:
+            self._journal.mark_done(journal_id)
+
+    def recover(self) -> list[MealSyncResult]:
+        """
+        Finish writes left unfinished in the journal by an interrupted run, without fetching Fitbit.
+        Writes which fail again stay in the journal for the next run.
+        Returns:
+            list[MealSyncResult]: Result of each unfinished write. The reason is 'recovered'.
+        """
+        if not self._journal or self._dry_run:
+            return []
+
+        results = []
+        for entry in self._journal.pending():
+            needed = (
+                2 if entry.delete_log_id and not entry.deleted else 1
+            ) * self._request_budget
+            if not self.deadline.has_time_for(needed):
+                break
+            # 先読みした記録には復旧前の状態が残っているため、同期時に取得し直す
+            self.discard_prefetched(entry.date)
+
+            result = MealSyncResult(
+                date=entry.date,
+                meal_type_id=entry.meal_type_id,
+                status="failed",
+                reason="recovered",
+                sink=self.name,
+                calories=float(entry.meal.calories),
+            )
+            logger.info(
+                "Recover %s on %s from the journal",
+                MEAL_TYPES[entry.meal_type_id]["name"],
+                entry.date,
+            )
+            try:
+                if entry.delete_log_id and not entry.deleted:
+                    # 削除の途中で終了した場合、削除されたかは分からないため改めて削除する
+                    if not self._delete_if_exists(entry.delete_log_id):
+                        raise ValueError(f"Failed to delete {entry.delete_log_id}")
+                    self._journal.mark_deleted(entry.id)
+                created = self._create_food_log(
+                    entry.date, entry.meal_type_id, entry.meal
+                )
+                if not created:
+                    raise ValueError("Failed to create the food log.")
+            except Exception as e:
+                logger.warning(
+                    "Failed to recover %s on %s: %s",
+                    MEAL_TYPES[entry.meal_type_id]["name"],
+                    entry.date,
+                    e,
+                )
+                result.error = str(e)
+                results.append(result)
+                continue
+
+            self._journal.mark_done(entry.id)
+            result.status = "replaced" if entry.delete_log_id else "created"
+            result.log_id = self._created_log_id(created)
+            self._record(entry.date, entry.meal, result)
+            results.append(result)
+
+        return results
+
+    def _create_food_log(
+        self, date: str, meal_type_id: int, meal: FoodLog
+    ) -> Optional[dict]:
+        """
+        Log a meal to Fitbit. An existing custom food with the same nutrients is reused by foodId,
+        and a new custom food is created only on a cache miss.
+        Returns:
+            Optional[dict]: Response of Fitbit. None if it failed.
+        """
+        food_id = (
+            self._custom_foods.get(meal_type_id, meal) if self._custom_foods else None
+        )
+        if self._custom_foods and food_id:
+            try:
+                res = self.create_fitbit_food_log(
+                    CreateFoodLogParams(
+                        foodId=food_id,
+                        mealTypeId=MEAL_TYPES[meal_type_id]["fitbit_id"],
+                        unitId=304,  # 単位: 食分
+                        amount=1,
+                        date=date,
+                    )
+                )
+            except HTTPError as e:
+                # ユーザーがカスタム食品を削除した場合は400/404が返るため、作り直す
+                if e.response is None or e.response.status_code not in (400, 404):
+                    raise
+                logger.warning("Custom food %s is not available: %s", food_id, e)
+                self._custom_foods.invalidate(food_id)
+            else:
+                self._custom_foods.put(meal_type_id, meal, food_id)
+                return res
+
+        params = CreateFoodLogParams(
+            **{
+                "foodName": MEAL_TYPES[meal_type_id]["name"],
+                "mealTypeId": MEAL_TYPES[meal_type_id]["fitbit_id"],
+                "unitId": 304,  # 単位: 食分
+                "amount": 1,
+                "date": date,
+                "calories": meal.calories,
+                "protein": meal.protein,
+                "totalFat": meal.fat,
+                "totalCarbohydrate": meal.carbs,
+            }
+        )
+        res = self.create_fitbit_food_log(params)
+        if res and self._custom_foods:
+            food_id = res.get("foodLog", {}).get("loggedFood", {}).get("foodId")
+            # 登録は済んでいるため、foodIdが無くても失敗にはせず、再利用しないだけにする
+            if food_id:
+                self._custom_foods.put(meal_type_id, meal, food_id)
+
+        return res
+
+    def prune_custom_foods(
+        self, max_age_days: int = CUSTOM_FOOD_MAX_AGE_DAYS, today: Optional[str] = None
+    ) -> int:
+        """
+        Delete custom foods which have not been logged for a while. Runs at most once a day.
+        Args:
+            max_age_days (int): Custom foods unused for more than this many days are deleted.
+            today (Optional[str]): Today in the format 'YYYY-MM-DD'. Defaults to the current date.
+        Returns:
+            int: Number of deleted custom foods.
+        """
+        if not self._custom_foods or self._dry_run:
+            return 0
+
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        if self._custom_foods.last_pruned == today:
+            return 0
+
+        deleted = 0
+        for food_id in self._custom_foods.unused(max_age_days, today):
+            if not self.deadline.has_time_for(self._request_budget):
+                return deleted
+            if self.delete_fitbit_food(food_id):
+                self._custom_foods.invalidate(food_id)
+                deleted += 1
+
+        self._custom_foods.mark_pruned(today)
+        if deleted:
+            logger.info("Deleted %d unused custom foods", deleted)
+
+        return deleted
+
+
+class NutritionStoreSink(FoodLogSink):
+    """Export every nutrient of food logs to the columnar nutrition store."""
+
+    name = "nutrition_store"
+
+    def __init__(self, store: NutritionStore, **kwargs):
+        super().__init__(**kwargs)
+        self._store = store
+
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        results = []
+        for meal_type_id, food_log in food_logs.items():
+            result = MealSyncResult(
+                date=date, meal_type_id=meal_type_id, status="skipped"
+            )
+            if not food_log:
+                result.reason = "no_log"
+            elif self._store.write([food_log]):
+                result.status = "created"
+                result.calories = float(food_log.calories)
+            else:
+                result.reason = "unchanged"
+                result.calories = float(food_log.calories)
+            results.append(result)
+
+        return results
+
+
+class CsvSink(FoodLogSink):
+    """Append food logs to a CSV archive. One row per date and meal."""
+
+    name = "csv"
+    fieldnames = ["date", "meal_type_id"] + list(NUTRITIONS.values())
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self._path = path
+        self._file_lock = threading.Lock()
+
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        rows = [
+            food_log.model_dump(include=set(self.fieldnames))
+            for food_log in food_logs.values()
+            if food_log
+        ]
+        with self._file_lock:
+            exists = os.path.exists(self._path)
+            with open(self._path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                if not exists:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+        return [
+            MealSyncResult(
+                date=date,
+                meal_type_id=meal_type_id,
+                status="created" if food_log else "skipped",
+                reason=None if food_log else "no_log",
+                calories=float(food_log.calories) if food_log else None,
+            )
+            for meal_type_id, food_log in food_logs.items()
+        ]
@@ -0,0 +1,87 @@
+from typing import Any, Optional
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from .metrics import timer
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class TaskGraph:
+    """
+    Small dependency graph of startup steps.
+    Each step starts as soon as the steps it depends on finish, so the wall time is the longest path
+    instead of the sum of the steps. Steps must be added after their dependencies, which rules out cycles.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[str, tuple[Callable[..., Any], tuple[str, ...]]] = {}
+
+    def add(
+        self, name: str, func: Callable[..., Any], depends_on: tuple[str, ...] = ()
+    ) -> None:
+        """
+        Add a step.
+        Args:
+            name (str): Name of the step. Its result is stored under this name.
+            func (Callable[..., Any]): Called with the results of `depends_on` as positional arguments.
+            depends_on (tuple[str, ...]): Names of steps which must finish first.
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task {name} is already added.")
+        unknown = [
+            dependency for dependency in depends_on if dependency not in self._tasks
+        ]
+        if unknown:
+            raise ValueError(f"Task {name} depends on unknown tasks: {unknown}")
+
+        self._tasks[name] = (func, depends_on)
+
+    def run(
+        self,
+        phases: Optional[dict[str, float]] = None,
+        max_workers: Optional[int] = None,
+    ) -> dict[str, Any]:
+        """
+        Run all steps.
+        Args:
+            phases (Optional[dict[str, float]]): If given, wall time of each step is added as 'startup:<name>'.
+            max_workers (Optional[int]): Number of threads. Defaults to the number of steps.
+        Returns:
+            dict[str, Any]: Result of each step.
+        Raises:
+            Exception: The first error of a step. Steps not started yet are cancelled.
+        """
+        phases = phases if phases is not None else {}
+        results: dict[str, Any] = {}
+        running: dict[Future, str] = {}
+        waiting = dict(self._tasks)
+
+        def call(name: str, func: Callable[..., Any], args: list[Any]) -> Any:
+            with timer(phases, f"startup:{name}"):
+                return func(*args)
+
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(len(self._tasks), 1),
+            thread_name_prefix="startup",
+        )
+        try:
+            while waiting or running:
+                for name, (func, depends_on) in list(waiting.items()):
+                    if all(dependency in results for dependency in depends_on):
+                        args = [results[dependency] for dependency in depends_on]
+                        running[executor.submit(call, name, func, args)] = name
+                        del waiting[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    logger.debug("Startup step %s finished", name)
+        finally:
+            # 失敗した場合、まだ始まっていないステップは実行しない
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return results
@@ -0,0 +1,199 @@
+from typing import Any
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from botocore.exceptions import ClientError  # type: ignore
+from pydantic import BaseModel
+
+from .utils import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class Tokens(BaseModel):
+    access_token: str
+    refresh_token: str
+    version: str  # 保存先での版。保存時にこの版から変わっていれば競合
+
+
+class TokenConflictError(Exception):
+    """Tokens were updated by another process since they were loaded."""
+
+
+class TokenStore(ABC):
+    """
+    Fitbit tokens shared by processes of one account.
+
+    A process refreshes tokens holding `lock()`, after checking that nobody refreshed them yet,
+    and saves them with `save(..., expected_version)`. The version check catches writers
+    which do not share the lock, so the last writer never silently wins.
+    """
+
+    @abstractmethod
+    def load(self) -> Tokens:
+        """Load the current tokens."""
+
+    @abstractmethod
+    def save(
+        self, access_token: str, refresh_token: str, expected_version: str
+    ) -> Tokens:
+        """
+        Save new tokens if the stored version is still expected_version.
+        Raises:
+            TokenConflictError: Tokens were updated by another process.
+        """
+
+    def lock(self) -> Any:
+        """Context manager which excludes other processes refreshing tokens. No-op by default."""
+        return nullcontext()
+
+
+class FileTokenStore(TokenStore):
+    """
+    Tokens in a local credentials JSON file, locked with flock (POSIX).
+    Other fields of the file (mail, password...) are kept as they are.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock_path = f"{path}.lock"
+        self._thread_lock = (
+            threading.Lock()
+        )  # flockはプロセス単位のため、スレッド間は別途排他する
+
+    @staticmethod
+    def _version(data: dict) -> str:
+        tokens = f"{data['access_token']}:{data['refresh_token']}"
+        return hashlib.sha256(tokens.encode()).hexdigest()[:16]
+
+    def _read(self) -> dict:
+        with open(self._path, "r") as f:
+            return json.load(f)
+
+    def load(self) -> Tokens:
+        data = self._read()
+        return Tokens(
+            access_token=data["access_token"],
+            refresh_token=data["refresh_token"],
+            version=self._version(data),
+        )
+
+    def save(
+        self, access_token: str, refresh_token: str, expected_version: str
+    ) -> Tokens:
+        data = self._read()
+        if self._version(data) != expected_version:
+            raise TokenConflictError(f"{self._path} was updated by another process.")
+
+        data["access_token"] = access_token
+        data["refresh_token"] = refresh_token
+        tmp_path = f"{self._path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self._path)
+
+        return Tokens(
+            access_token=access_token,
+            refresh_token=refresh_token,
+            version=self._version(data),
+        )
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with self._thread_lock, open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SecretsManagerTokenStore(TokenStore):
+    """
+    Tokens in an AWS Secrets Manager secret, with optimistic concurrency on version stages.
+
+    New tokens are put as a pending version, and AWSCURRENT is moved to it only if it is still on
+    the version which was loaded. Secrets Manager rejects the move otherwise, which works as compare-and-swap.
+    """
+
+    def __init__(self, client: Any, secret_id: str):
+        """
+        Args:
+            client: boto3 Secrets Manager client.
+            secret_id (str): Name or ARN of the secret.
+        """
+        self._client = client
+        self._secret_id = secret_id
+        self._lock = threading.Lock()  # 同一プロセス内のスレッドは排他する
+
+    def _read(self) -> tuple[dict, str]:
+        response = self._client.get_secret_value(
+            SecretId=self._secret_id, VersionStage="AWSCURRENT"
+        )
+        return json.loads(response["SecretString"]), response["VersionId"]
+
+    def load(self) -> Tokens:
+        data, version = self._read()
+        return Tokens(
+            access_token=data["access_token"],
+            refresh_token=data["refresh_token"],
+            version=version,
+        )
+
+    def save(
+        self, access_token: str, refresh_token: str, expected_version: str
+    ) -> Tokens:
+        data, version = self._read()
+        if version != expected_version:
+            raise TokenConflictError(
+                f"{self._secret_id} was updated by another process."
+            )
+
+        data["access_token"] = access_token
+        data["refresh_token"] = refresh_token
+        new_version = self._client.put_secret_value(
+            SecretId=self._secret_id,
+            ClientRequestToken=str(uuid.uuid4()),
+            SecretString=json.dumps(data),
+            VersionStages=["AWSPENDING"],
+        )["VersionId"]
+        try:
+            self._client.update_secret_version_stage(
+                SecretId=self._secret_id,
+                VersionStage="AWSCURRENT",
+                MoveToVersionId=new_version,
+                RemoveFromVersionId=expected_version,
+            )
+        except ClientError as e:
+            # 負けた版にAWSPENDINGが残ると、ローテーションが未完了と判断されるため外しておく
+            try:
+                self._client.update_secret_version_stage(
+                    SecretId=self._secret_id,
+                    VersionStage="AWSPENDING",
+                    RemoveFromVersionId=new_version,
+                )
+            except ClientError:
+                logger.warning(
+                    "Could not remove AWSPENDING from version %s of %s",
+                    new_version,
+                    self._secret_id,
+                    exc_info=True,
+                )
+            raise TokenConflictError(
+                f"{self._secret_id} was updated by another process."
+            ) from e
+
+        return Tokens(
+            access_token=access_token, refresh_token=refresh_token, version=new_version
+        )
+
+    def lock(self) -> Any:
+        return self._lock
@@ -0,0 +1,648 @@
+"""
+On-demand sync trigger which collapses bursts of triggers into one sync.
+
+Triggers of the same account arriving within `window` seconds are synced together, with one login.
+A trigger carrying an idempotency key which was already seen (e.g. retried by the client while
+the sync is running) joins the sync of the first one instead of starting another.
+The state is kept in a TriggerStore, which must be shared (DynamoDBTriggerStore) when several
+processes accept triggers, like the execution environments of a Lambda function.
+
+The handler has the shape of a Lambda function URL. To try it locally:
+
+    python -m src.trigger --credentials credentials.json --window 10
+    curl -X POST http://127.0.0.1:8766/sync -H 'Idempotency-Key: abc' -d '{"dates": ["2024-01-01"]}'
+"""
+
+from typing import Any, Optional
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import base64
+import json
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError  # type: ignore
+
+from .const import LAMBDA_MAX_TIMEOUT, TRIGGER_WINDOW
+from .deadline import Deadline
+from .models.sync import SyncReport, TriggerResult
+from .utils import flush_logs, get_logger
+
+
+logger = get_logger(__name__)
+
+
+type SyncFunction = Callable[[str, list[str], Deadline], SyncReport]
+type FunctionUrlHandler = Callable[[dict, Any], dict]
+
+
+class TriggerStore(ABC):
+    """
+    Batches, idempotency keys and reports of the triggers, shared by the processes accepting them.
+
+    A batch is opened by the first trigger of an account and synced by the process which opened it,
+    so triggers accepted by other processes (e.g. other Lambda execution environments) join it
+    instead of starting their own sync.
+    """
+
+    @abstractmethod
+    def join(
+        self, account: str, dates: list[str], ticket: str
+    ) -> tuple[str, list[str]]:
+        """
+        Add the dates to the open batch of the account, opening one with `ticket` if none is open.
+        Returns:
+            tuple[str, list[str]]: Ticket and dates of the batch. The ticket is `ticket` if the batch was opened.
+        """
+
+    @abstractmethod
+    def close(self, account: str, ticket: str) -> list[str]:
+        """Stop accepting triggers in the batch and return its dates."""
+
+    @abstractmethod
+    def find_key(self, key: str) -> Optional[TriggerResult]:
+        """Return the result of the trigger which claimed the idempotency key, or None."""
+
+    @abstractmethod
+    def claim_key(self, key: str, result: TriggerResult) -> Optional[TriggerResult]:
+        """
+        Remember the result of the trigger carrying the idempotency key.
+        Returns:
+            Optional[TriggerResult]: Result of the trigger which claimed the key first. None if this one did.
+        """
+
+    @abstractmethod
+    def finish(self, ticket: str, report: SyncReport) -> None:
+        """Save the report of the batch."""
+
+    @abstractmethod
+    def report(self, ticket: str) -> Optional[SyncReport]:
+        """Return the report of the batch, or None if it has not finished or is unknown."""
+
+    @abstractmethod
+    def lock(self, account: str) -> AbstractContextManager:
+        """Context manager which excludes other syncs of the account."""
+
+    def wait(
+        self, ticket: str, timeout: Optional[float] = None, interval: float = 0.5
+    ) -> Optional[SyncReport]:
+        """Poll the report of the batch until it finishes or the timeout passes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            report = self.report(ticket)
+            if report is not None:
+                return report
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(
+                interval
+                if deadline is None
+                else max(min(interval, deadline - time.monotonic()), 0.0)
+            )
+
+
+class InMemoryTriggerStore(TriggerStore):
+    """State of the triggers in a process. Enough when one long-running process accepts all triggers."""
+
+    def __init__(self, key_ttl: float = 3600.0):
+        """
+        Args:
+            key_ttl (float): Seconds an idempotency key, and the report of a finished sync, are remembered.
+        """
+        self._key_ttl = key_ttl
+        self._condition = threading.Condition()
+        self._open: dict[str, tuple[str, set[str]]] = (
+            {}
+        )  # アカウント -> (チケット, 日付)
+        self._keys: dict[str, tuple[float, TriggerResult]] = {}
+        self._reports: dict[str, tuple[float, SyncReport]] = {}
+        self._tickets: set[str] = set()  # 開いたバッチのチケット
+        self._running: dict[str, threading.Lock] = {}
+
+    def join(
+        self, account: str, dates: list[str], ticket: str
+    ) -> tuple[str, list[str]]:
+        with self._condition:
+            ticket, batch_dates = self._open.setdefault(account, (ticket, set()))
+            self._tickets.add(ticket)
+            batch_dates.update(dates)
+            return ticket, sorted(batch_dates)
+
+    def close(self, account: str, ticket: str) -> list[str]:
+        with self._condition:
+            if self._open.get(account, ("", set()))[0] != ticket:
+                raise KeyError(f"Batch {ticket} of {account} is not open.")
+            return sorted(self._open.pop(account)[1])
+
+    def find_key(self, key: str) -> Optional[TriggerResult]:
+        with self._condition:
+            self._expire(time.monotonic())
+            return self._keys[key][1] if key in self._keys else None
+
+    def claim_key(self, key: str, result: TriggerResult) -> Optional[TriggerResult]:
+        with self._condition:
+            if key in self._keys:
+                return self._keys[key][1]
+            self._keys[key] = (time.monotonic(), result)
+            return None
+
+    def finish(self, ticket: str, report: SyncReport) -> None:
+        with self._condition:
+            self._expire(time.monotonic())
+            self._reports[ticket] = (time.monotonic(), report)
+            self._condition.notify_all()
+
+    def report(self, ticket: str) -> Optional[SyncReport]:
+        with self._condition:
+            return self._reports[ticket][1] if ticket in self._reports else None
+
+    def lock(self, account: str) -> AbstractContextManager:
+        with self._condition:
+            return self._running.setdefault(account, threading.Lock())
+
+    def wait(
+        self, ticket: str, timeout: Optional[float] = None, interval: float = 0.5
+    ) -> Optional[SyncReport]:
+        with self._condition:
+            if ticket not in self._tickets:
+                return None
+            self._condition.wait_for(lambda: ticket in self._reports, timeout)
+            return self._reports[ticket][1] if ticket in self._reports else None
+
+    def _expire(self, now: float) -> None:
+        for key, (seen_at, _) in list(self._keys.items()):
+            if now - seen_at > self._key_ttl:
+                del self._keys[key]
+        for ticket, (finished_at, _) in list(self._reports.items()):
+            if now - finished_at > self._key_ttl:
+                del self._reports[ticket]
+                self._tickets.discard(ticket)
+
+
+class DynamoDBTriggerStore(TriggerStore):
+    """
+    State of the triggers in a DynamoDB table, shared by Lambda execution environments.
+
+    The table has a string partition key 'pk' and TTL on 'expires_at'. Batches are opened and
+    idempotency keys claimed with conditional puts, so concurrent triggers never open two batches
+    of an account or claim a key twice. Syncs of an account are excluded by a lease.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        table: str,
+        key_ttl: float = 3600.0,
+        open_timeout: float = 60.0,
+        lease: float = LAMBDA_MAX_TIMEOUT,
+    ):
+        """
+        Args:
+            client: boto3 DynamoDB client.
+            table (str): Name of the table.
+            key_ttl (float): Seconds an idempotency key, and the report of a finished sync, are remembered.
+            open_timeout (float): Seconds after which a batch never closed (its process died) is replaced.
+                Must be longer than the window.
+            lease (float): Seconds after which the lock of a sync which never released it expires.
+        """
+        self._client = client
+        self._table = table
+        self._key_ttl = key_ttl
+        self._open_timeout = open_timeout
+        self._lease = lease
+
+    def join(
+        self, account: str, dates: list[str], ticket: str
+    ) -> tuple[str, list[str]]:
+        key = {"pk": {"S": f"open#{account}"}}
+        # 文字列セットに重複した値は含められない
+        dates = sorted(set(dates))
+        while True:
+            now = time.time()
+            try:
+                item = self._client.update_item(
+                    TableName=self._table,
+                    Key=key,
+                    UpdateExpression="ADD dates :dates",
+                    ConditionExpression="attribute_exists(ticket) AND expires_at > :now",
+                    ExpressionAttributeValues={
+                        ":dates": {"SS": dates},
+                        ":now": {"N": str(now)},
+                    },
+                    ReturnValues="ALL_NEW",
+                )["Attributes"]
+                return item["ticket"]["S"], sorted(item["dates"]["SS"])
+            except ClientError as e:
+                if not _conditional_check_failed(e):
+                    raise
+
+            try:
+                self._client.put_item(
+                    TableName=self._table,
+                    Item={
+                        **key,
+                        "ticket": {"S": ticket},
+                        "dates": {"SS": dates},
+                        "expires_at": {"N": str(now + self._open_timeout)},
+                    },
+                    ConditionExpression="attribute_not_exists(pk) OR expires_at <= :now",
+                    ExpressionAttributeValues={":now": {"N": str(now)}},
+                )
+                return ticket, dates
+            except ClientError as e:
+                # 同時に他のプロセスがバッチを開いた場合は、そのバッチに合流する
+                if not _conditional_check_failed(e):
+                    raise
+
+    def close(self, account: str, ticket: str) -> list[str]:
+        item = self._client.delete_item(
+            TableName=self._table,
+            Key={"pk": {"S": f"open#{account}"}},
+            ConditionExpression="ticket = :ticket",
+            ExpressionAttributeValues={":ticket": {"S": ticket}},
+            ReturnValues="ALL_OLD",
+        )["Attributes"]
+        return sorted(item["dates"]["SS"])
+
+    def find_key(self, key: str) -> Optional[TriggerResult]:
+        item = self._get(f"key#{key}")
+        return TriggerResult.model_validate_json(item["result"]["S"]) if item else None
+
+    def claim_key(self, key: str, result: TriggerResult) -> Optional[TriggerResult]:
+        now = time.time()
+        try:
+            self._client.put_item(
+                TableName=self._table,
+                Item={
+                    "pk": {"S": f"key#{key}"},
+                    "result": {"S": result.model_dump_json()},
+                    "expires_at": {"N": str(now + self._key_ttl)},
+                },
+                ConditionExpression="attribute_not_exists(pk) OR expires_at <= :now",
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except ClientError as e:
+            if not _conditional_check_failed(e):
+                raise
+            return self.find_key(key)
+
+        return None
+
+    def finish(self, ticket: str, report: SyncReport) -> None:
+        self._client.put_item(
+            TableName=self._table,
+            Item={
+                "pk": {"S": f"report#{ticket}"},
+                "report": {"S": report.model_dump_json()},
+                "expires_at": {"N": str(time.time() + self._key_ttl)},
+            },
+        )
+
+    def report(self, ticket: str) -> Optional[SyncReport]:
+        item = self._get(f"report#{ticket}")
+        return SyncReport.model_validate_json(item["report"]["S"]) if item else None
+
+    @contextmanager
+    def lock(self, account: str) -> Iterator[None]:
+        key = {"pk": {"S": f"lock#{account}"}}
+        owner = uuid.uuid4().hex
+        while True:
+            now = time.time()
+            try:
+                self._client.put_item(
+                    TableName=self._table,
+                    Item={
+                        **key,
+                        "owner": {"S": owner},
+                        "expires_at": {"N": str(now + self._lease)},
+                    },
+                    ConditionExpression="attribute_not_exists(pk) OR expires_at <= :now",
+                    ExpressionAttributeValues={":now": {"N": str(now)}},
+                )
+                break
+            except ClientError as e:
+                if not _conditional_check_failed(e):
+                    raise
+                time.sleep(1.0)
+
+        try:
+            yield
+        finally:
+            try:
+                self._client.delete_item(
+                    TableName=self._table,
+                    Key=key,
+                    ConditionExpression="#owner = :owner",
+                    ExpressionAttributeNames={"#owner": "owner"},
+                    ExpressionAttributeValues={":owner": {"S": owner}},
+                )
+            except ClientError as e:
+                # リースが切れて他のプロセスが取得済みの場合は何もしない
+                if not _conditional_check_failed(e):
+                    raise
+
+    def _get(self, pk: str) -> Optional[dict]:
+        item = self._client.get_item(
+            TableName=self._table, Key={"pk": {"S": pk}}, ConsistentRead=True
+        ).get("Item")
+        # TTLによる削除は遅れることがあるため、期限切れの項目は無いものとして扱う
+        if item is None or float(item["expires_at"]["N"]) <= time.time():
+            return None
+
+        return item
+
+
+def _conditional_check_failed(error: ClientError) -> bool:
+    return error.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+class SyncTrigger:
+    """Coalesce triggers per account within a window and deduplicate them by idempotency key."""
+
+    def __init__(
+        self,
+        sync: SyncFunction,
+        window: float = TRIGGER_WINDOW,
+        key_ttl: float = 3600.0,
+        store: Optional[TriggerStore] = None,
+    ):
+        """
+        Args:
+            sync (SyncFunction): Syncs the dates of the account within the deadline and returns the report.
+            window (float): Seconds to wait for more triggers after the first one.
+            key_ttl (float): Seconds an idempotency key, and the report of a finished sync, are remembered.
+                Used only by the default store.
+            store (Optional[TriggerStore]): State shared with other processes. Defaults to InMemoryTriggerStore.
+        """
+        self._sync = sync
+        self._window = window
+        self._store = store or InMemoryTriggerStore(key_ttl)
+        self._lock = threading.Lock()
+        self._flushes: dict[str, threading.Thread] = {}  # このプロセスで同期するバッチ
+
+    def submit(
+        self,
+        account: str,
+        dates: list[str],
+        idempotency_key: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> TriggerResult:
+        """
+        Accept a trigger.
+        Args:
+            account (str): Account whose dates are synced.
+            dates (list[str]): Dates in the format 'YYYY-MM-DD'.
+            idempotency_key (Optional[str]): Triggers with the same key are synced once.
+            deadline (Optional[Deadline]): Deadline of the caller. A batch opened by this trigger is synced within it.
+        Returns:
+            TriggerResult: Ticket of the sync which the trigger joined.
+        """
+        if idempotency_key:
+            claimed = self._store.find_key(idempotency_key)
+            if claimed is not None:
+                logger.info(
+                    "Duplicate trigger %s joins %s", idempotency_key, claimed.ticket
+                )
+                return claimed.model_copy(update={"duplicate": True})
+
+        new_ticket = uuid.uuid4().hex
+        ticket, batch_dates = self._store.join(account, dates, new_ticket)
+        if ticket == new_ticket:
+            self._open_batch(account, ticket, deadline or Deadline())
+        result = TriggerResult(ticket=ticket, dates=batch_dates)
+        if idempotency_key:
+            claimed = self._store.claim_key(idempotency_key, result)
+            if claimed is not None:
+                # 同じキーのトリガーが同時に届いた場合は先に登録した方に合流する
+                return claimed.model_copy(update={"duplicate": True})
+
+        return result
+
+    def _open_batch(self, account: str, ticket: str, deadline: Deadline) -> None:
+        timer = threading.Timer(
+            self._window, self._flush, args=(account, ticket, deadline)
+        )
+        timer.daemon = True
+        with self._lock:
+            self._flushes[ticket] = timer
+        timer.start()
+
+    def _flush(self, account: str, ticket: str, deadline: Deadline) -> None:
+        dates: list[str] = []
+        try:
+            # これ以降のトリガーは次のバッチで同期する
+            dates = self._store.close(account, ticket)
+            with self._store.lock(account):
+                logger.info("Syncing %s triggered for %s", dates, ticket)
+                report = self._sync(account, dates, deadline)
+        except Exception as e:
+            logger.error("Triggered sync failed: %s", e, exc_info=True)
+            report = SyncReport(dates=dates, pending_dates=dates, error=str(e))
+
+        try:
+            self._store.finish(ticket, report)
+        finally:
+            with self._lock:
+                self._flushes.pop(ticket, None)
+            flush_logs()
+
+    def wait(
+        self, ticket: str, timeout: Optional[float] = None
+    ) -> Optional[SyncReport]:
+        """
+        Wait for the sync of the ticket.
+        A sync run by this process is waited for regardless of the timeout: Lambda freezes the execution
+        environment once the handler returns, which would stop the sync halfway.
+        Returns:
+            Optional[SyncReport]: Report of the sync. None if it did not finish within the timeout or the ticket is unknown.
+        """
+        with self._lock:
+            flush = self._flushes.get(ticket)
+        if flush is not None:
+            flush.join()
+            return self._store.report(ticket)
+
+        return self._store.wait(ticket, timeout)
+
+
+def _parse_event(event: dict) -> tuple[list[str], Optional[str]]:
+    """Return dates and the idempotency key of a function URL event."""
+    body = event.get("body") or "{}"
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode()
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Body must be a JSON object.")
+
+    dates = payload.get("dates") or [
+        payload.get("date", datetime.now().strftime("%Y-%m-%d"))
+    ]
+    if not isinstance(dates, list):
+        raise ValueError("dates must be a list.")
+    for date in dates:
+        datetime.strptime(date, "%Y-%m-%d")
+
+    # 関数URLではヘッダー名は小文字になる
+    headers = {
+        key.lower(): value for key, value in (event.get("headers") or {}).items()
+    }
+    key = headers.get("idempotency-key") or payload.get("idempotency_key")
+
+    return dates, key
+
+
+def _response(status: int, body: dict) -> dict:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body, ensure_ascii=False),
+    }
+
+
+def handle_function_url(
+    trigger: SyncTrigger,
+    account: str,
+    event: dict,
+    timeout: Optional[float] = None,
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """
+    Handle a function URL event: submit the trigger and wait for its sync.
+    Args:
+        trigger (SyncTrigger): Trigger shared by invocations of the process.
+        account (str): Account whose dates are synced.
+        event (dict): Function URL event (payload format 2.0) with a JSON body {"dates": [...]} or {"date": ...}.
+        timeout (Optional[float]): Seconds to wait for a sync run by another process.
+            202 is returned if it does not finish in time. A sync run by this process is always waited for.
+        deadline (Optional[Deadline]): Deadline of the invocation. A sync run by this process stops within it.
+    Returns:
+        dict: Function URL response. 200 with the report, 202 with the ticket, or 400.
+    """
+    try:
+        dates, key = _parse_event(event)
+    except (ValueError, TypeError) as e:
+        return _response(400, {"error": str(e)})
+
+    result = trigger.submit(account, dates, key, deadline)
+    report = trigger.wait(result.ticket, timeout)
+    body = result.model_dump(mode="json")
+    if report is None:
+        return _response(202, body)
+
+    return _response(200, {**body, "report": report.model_dump(mode="json")})
+
+
+def create_function_url_server(
+    handler: FunctionUrlHandler, host: str = "127.0.0.1", port: int = 8766
+) -> ThreadingHTTPServer:
+    """Create a local HTTP server which passes requests to a function URL handler as events."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            event = {
+                "version": "2.0",
+                "rawPath": self.path,
+                "requestContext": {"http": {"method": "POST", "path": self.path}},
+                "headers": dict(self.headers.items()),
+                "body": self.rfile.read(length).decode(),
+                "isBase64Encoded": False,
+            }
+            response = handler(event, None)
+
+            content = response.get("body", "").encode()
+            self.send_response(response["statusCode"])
+            for key, value in response.get("headers", {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            logger.debug("Function URL server: " + format, *args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.trigger",
+        description="Serve the on-demand sync trigger locally.",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=TRIGGER_WINDOW,
+        help=f"Seconds to wait for more triggers before syncing. Defaults to {TRIGGER_WINDOW:g}.",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["dry-run", "live"],
+        default="dry-run",
+        help="'dry-run' never writes to Fitbit. Defaults to dry-run.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address of the server. Defaults to 127.0.0.1.",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8766,
+        help="Port of the server. Defaults to 8766.",
+    )
+    parser.add_argument(
+        "--credentials",
+        help="Path to a credentials JSON file. Defaults to the same source as the Lambda function.",
+    )
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    # lambda_functionがこのモジュールを読み込むため、循環しないようにここで読み込む
+    from .__main__ import load_credentials
+    from .lambda_function import create_syncer, get_token_store
+
+    args = build_parser().parse_args(argv)
+    credentials = load_credentials(args.credentials)
+
+    def sync(account: str, dates: list[str], deadline: Deadline) -> SyncReport:
+        syncer = create_syncer(
+            mail=credentials["mail"],
+            password=credentials["password"],
+            client_id=credentials["client_id"],
+            access_token=credentials["access_token"],
+            refresh_token=credentials["refresh_token"],
+            dry_run=args.mode == "dry-run",
+            callback_on_token_refreshed=None,
+            token_store=get_token_store(args.credentials),
+        )
+        return syncer.sync_dates(dates, deadline=deadline)
+
+    trigger = SyncTrigger(sync, window=args.window)
+    server = create_function_url_server(
+        lambda event, context: handle_function_url(trigger, credentials["mail"], event),
+        args.host,
+        args.port,
+    )
+    logger.info("Trigger listening on %s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        flush_logs()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,15 @@
-import logging
+from typing import Optional
+from collections.abc import Iterator
+from datetime import datetime, timedelta
 from logging import config
+from logging.handlers import QueueListener
+import atexit
+import functools
+import logging
 import os
 
 import yaml
+from requests.exceptions import RequestException
 
 from .const import UNITS
 
@@ -25,17 +32,118 @@ def remove_unit(nutrition_value: str) -> float:
     return float(nutrition_value)
 
 
+_queue_listener: Optional[QueueListener] = None
+_logging_configured = False
+
+
+def _configure_logging() -> None:
+    global _queue_listener, _logging_configured
+
+    conf_file = (
+        r"./src/logging.conf.prd.yaml"
+        if os.environ.get("ENV") == "production"
+        else r"./src/logging.conf.dev.yaml"
+    )
+    with open(conf_file, "r") as f:
+        conf = yaml.safe_load(f.read())
+        config.dictConfig(conf)
+
+    _queue_listener = getattr(logging.getHandlerByName("queue"), "listener", None)
+    if _queue_listener:
+        _queue_listener.start()
+        atexit.register(_queue_listener.stop)
+
+    _logging_configured = True
+
+
 def get_logger(name: str) -> logging.Logger:
     """Get a logger with the specified name."""
 
-    if not logging.getHandlerNames():
-        conf_file = (
-            r"./src/logging.conf.prd.yaml"
-            if os.environ.get("ENV") == "production"
-            else r"./src/logging.conf.dev.yaml"
-        )
-        with open(conf_file, "r") as f:
-            conf = yaml.safe_load(f.read())
-            config.dictConfig(conf)
+    if not _logging_configured:
+        _configure_logging()
 
     return logging.getLogger(name)
+
+
+def flush_logs() -> None:
+    """
+    Emit all queued log records.
+    Call this before the process may be frozen, e.g. before a Lambda handler returns.
+    """
+    if not _queue_listener:
+        return
+
+    # stopは待機中のレコードをすべて出力してからスレッドを終了する
+    _queue_listener.stop()
+    _queue_listener.start()
+
+
+def date_range(start: str, end: str) -> list[str]:
+    """
+    Return dates from start to end (both inclusive).
+    Args:
+        start (str): Start date in the format 'YYYY-MM-DD'.
+        end (str): End date in the format 'YYYY-MM-DD'.
+    Returns:
+        list[str]: Dates in the format 'YYYY-MM-DD'.
+    """
+    return list(iter_date_range(start, end))
+
+
+def iter_date_range(start: str, end: str) -> Iterator[str]:
+    """Yield dates from start to end (both inclusive) without building the whole list."""
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    if start_date > end_date:
+        raise ValueError(f"start ({start}) must not be after end ({end}).")
+
+    days = (end_date - start_date).days
+    for i in range(days + 1):
+        yield (start_date + timedelta(days=i)).isoformat()
+
+
+def safe_api_call(api_name=""):
+    """
+    A wrapper to safely call API functions and handle exceptions.
+    Args:
+        func (callable): The API function to call.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+    Returns:
+        The result of the API call or None if an error occurs.
+    """
+
+    def decorator(func):
+        # エラーは呼び出し元のモジュールのロガーに出力する
+        logger = logging.getLogger(func.__module__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except RequestException as e:
+                logger.error(
+                    "%s API request error: %s (func=%s, args=%r, kwargs=%r)",
+                    api_name,
+                    e,
+                    func.__name__,
+                    args,
+                    kwargs,
+                    exc_info=True,
+                )
+                raise
+            except Exception as e:
+                logger.error(
+                    "Unexpected error in %s: %s (func=%s, args=%r, kwargs=%r)",
+                    api_name,
+                    e,
+                    func.__name__,
+                    args,
+                    kwargs,
+                    exc_info=True,
+                )
+                raise
+
+        return wrapper
+
+    return decorator
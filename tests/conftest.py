@@ -0,0 +1,17 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.models.fitbit import GetFoodLogResponse
+from tests.data.json import CREATE_FOOD_LOG_RESPONSE_JSON, GET_FOOD_LOG_RESPONSE_JSON
+
+
+@pytest.fixture
+def fitbit() -> MagicMock:
+    """Fitbit client whose day has a lunch of 280kcal (fitbit mealTypeId: 3) and whose creates succeed."""
+    fitbit = MagicMock()
+    fitbit.fetch_food_log.return_value = GetFoodLogResponse(
+        **GET_FOOD_LOG_RESPONSE_JSON
+    )
+    fitbit.create_food_log.return_value = CREATE_FOOD_LOG_RESPONSE_JSON
+    return fitbit
@@ -131,3 +131,10 @@ REFRESH_ACCESS_TOKEN_RESPONSE = {
     "token_type": "Bearer",
     "user_id": "GGNJL9",
 }
+
+CALORIES_IN_SERIES_RESPONSE_JSON = {
+    "foods-log-caloriesIn": [
+        {"dateTime": "2024-06-01", "value": "1800"},
+        {"dateTime": "2024-06-02", "value": "0"},
+    ]
+}
@@ -0,0 +1,19 @@
+from src.models.asken import FoodLog
+from tests.data.json import CREATE_FOOD_LOG_RESPONSE_JSON
+
+
+DATE = "2024-01-01"
+CREATED_LOG_ID = CREATE_FOOD_LOG_RESPONSE_JSON["foodLog"]["logId"]
+
+
+def food_log(
+    meal_type_id: int = 1, calories: float = 500, date: str = DATE, **nutrients
+) -> FoodLog:
+    """Logged Asken meal. Nutrients not given are protein 10g, fat 5g and carbs 20g."""
+    return FoodLog(
+        date=date,
+        meal_type_id=meal_type_id,
+        calories=calories,
+        logged=True,
+        **{"protein": 10, "fat": 5, "carbs": 20, **nutrients},
+    )
@@ -1,7 +1,11 @@
+import time
+
 import pytest
 from unittest.mock import patch, MagicMock
 
-from src.asken import Asken
+from src.asken import Asken, nutrition_block_fingerprint
+from src.cache import FoodLogCache
+from src.models.asken import FoodLog
 
 ONE_MEAL_LOG_MOCK = MagicMock(
     model_dump=MagicMock(
@@ -178,6 +182,98 @@ class TestAsken:
         result = a.fetch_one_meal_log("2024-01-01", 1)
         assert result is None
 
+    def test_fetch_food_log_uses_cache(self, mock_session, tmp_path):
+        mock_session.return_value.get.return_value.text = (
+            "食事記録が無いためアドバイスが計算できません"
+        )
+        a = Asken("a@b.com", "pw", cache=FoodLogCache(str(tmp_path), "a@b.com"))
+
+        assert a.fetch_food_log("2024-01-01", 1) is None
+        assert a.fetch_food_log("2024-01-01", 1) is None
+        assert mock_session.return_value.get.call_count == 1
+        assert a.metrics.snapshot()["cache_hits"] == 1
+
+    def test_iter_food_logs_in_order(self, mock_session):
+        a = Asken("a@b.com", "pw")
+
+        def fetch(date, meal_type_id):
+            # 後の日付ほど早く返しても、日付順に返されること
+            time.sleep(0.01 * (3 - int(date[-1])))
+            if meal_type_id == 2:
+                return None
+            return FoodLog(date=date, meal_type_id=meal_type_id)
+
+        with patch.object(a, "fetch_food_log", side_effect=fetch):
+            logs = list(
+                a.iter_food_logs("2024-01-01", "2024-01-03", [1, 2, 3], prefetch=3)
+            )
+
+        assert [(log.date, log.meal_type_id) for log in logs] == [
+            (date, meal_type_id)
+            for date in ["2024-01-01", "2024-01-02", "2024-01-03"]
+            for meal_type_id in [1, 3]
+        ]
+
+    def test_iter_food_logs_bounded_prefetch(self, mock_session):
+        a = Asken("a@b.com", "pw")
+        fetch = MagicMock(
+            side_effect=lambda date, meal_type_id: FoodLog(
+                date=date, meal_type_id=meal_type_id
+            )
+        )
+
+        with patch.object(a, "fetch_food_log", fetch):
+            logs = a.iter_food_logs("2024-01-01", "2024-12-31", [1], prefetch=2)
+            next(logs)
+            time.sleep(0.05)
+            logs.close()
+
+        # 取り出した1件と先読みの2件を超えて取得しない
+        assert fetch.call_count <= 3
+
+    def test_skip_parsing_unchanged_page(self, mock_session):
+        a = Asken("a@b.com", "pw")
+
+        with patch.object(
+            a, "_scrape_food_log", wraps=a._scrape_food_log
+        ) as mock_scrape:
+            first = a.fetch_one_meal_log("2024-01-01", 1)
+            second = a.fetch_one_meal_log("2024-01-01", 1)
+            a.fetch_one_meal_log("2024-01-01", 2)
+
+        assert first == second and first is not second
+        # 別の食事は指紋が同じでも解析する
+        assert mock_scrape.call_count == 2
+        assert a.metrics.snapshot()["parse_skips"] == 1
+
+    def test_parse_changed_page(self, mock_session):
+        html = mock_session.return_value.get.return_value.text
+        a = Asken("a@b.com", "pw")
+        first = a.fetch_one_meal_log("2024-01-01", 1)
+
+        mock_session.return_value.get.return_value.text = html.replace(
+            "942kcal", "1000kcal"
+        )
+        second = a.fetch_one_meal_log("2024-01-01", 1)
+
+        assert first is not None and first.calories == 942
+        assert second is not None and second.calories == 1000
+
+    def test_nutrition_block_fingerprint(self):
+        with open("tests/data/html/asken_food_log.html", "r", encoding="utf-8") as f:
+            html = f.read()
+
+        fingerprint = nutrition_block_fingerprint(html)
+
+        assert fingerprint is not None
+        # 栄養素の一覧の外側の変更は指紋に影響しない
+        assert (
+            nutrition_block_fingerprint(html.replace("<title>", "<title>new "))
+            == fingerprint
+        )
+        assert nutrition_block_fingerprint(html.replace("3.3g", "3.4g")) != fingerprint
+        assert nutrition_block_fingerprint("<html></html>") is None
+
     def test_fetch_one_meal_log_http_error(self, mock_session):
         mock_session.return_value.get.return_value.raise_for_status.side_effect = (
             Exception("http error")
@@ -0,0 +1,156 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.metrics import Metrics
+from src.models.asken import FoodLog
+from src.models.fitbit import GetFoodLogResponse
+from tests.data.json import GET_FOOD_LOG_RESPONSE_JSON
+from tests.helpers import DATE, food_log
+
+
+@pytest.fixture
+def asken() -> MagicMock:
+    return MagicMock()
+
+
+class TestAskenFitbitSync:
+    def test_sync_creates_new_meal(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = food_log(1, 500)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        results = syncer.sync_food_logs(DATE, [1]).meals
+
+        assert [r.status for r in results] == ["created"]
+        fitbit.create_food_log.assert_called_once()
+        fitbit.delete_food_log.assert_not_called()
+
+    def test_sync_replaces_changed_meal(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = food_log(2, 500)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        results = syncer.sync_food_logs(DATE, [2]).meals
+
+        assert [r.status for r in results] == ["replaced"]
+        fitbit.delete_food_log.assert_called_once_with(17406206369)
+        fitbit.create_food_log.assert_called_once()
+
+    def test_sync_skips_registered_meal(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = food_log(2, 280)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        results = syncer.sync_food_logs(DATE, [2]).meals
+
+        assert results[0].status == "skipped"
+        assert results[0].reason == "already_registered"
+        fitbit.create_food_log.assert_not_called()
+
+    def test_sync_skips_meal_without_log(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = None
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        results = syncer.sync_food_logs(DATE, [1, 2, 3, 4]).meals
+
+        assert [r.reason for r in results] == ["no_log"] * 4
+        fitbit.create_food_log.assert_not_called()
+
+    def test_dry_run_does_not_write(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.side_effect = [food_log(1, 500), food_log(2, 500)]
+        syncer = AskenFitbitSync(asken, fitbit, dry_run=True)
+
+        results = syncer.sync_food_logs(DATE, [1, 2]).meals
+
+        assert [r.status for r in results] == ["created", "replaced"]
+        assert all(r.dry_run for r in results)
+        fitbit.create_food_log.assert_not_called()
+        fitbit.delete_food_log.assert_not_called()
+
+
+class TestDailyTotalPrecheck:
+    @staticmethod
+    def fitbit_day(name: str, calories: float) -> GetFoodLogResponse:
+        response = GetFoodLogResponse(**GET_FOOD_LOG_RESPONSE_JSON)
+        response.foods[0].loggedFood.name = name
+        response.summary.calories = calories
+        response.summary.protein = 10
+        response.summary.fat = 5
+        response.summary.carbs = 20
+        return response
+
+    def test_skip_all_meals_when_totals_match(
+        self, asken: MagicMock, fitbit: MagicMock
+    ):
+        fitbit.fetch_food_log.return_value = self.fitbit_day("昼食（あすけん）", 500)
+        asken.fetch_food_log.return_value = food_log(5, 500.4)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        results = syncer.sync_food_logs(DATE).meals
+
+        assert [r.reason for r in results] == ["in_sync"] * 4
+        asken.fetch_food_log.assert_called_once_with(DATE, 5)
+        fitbit.fetch_food_log.assert_called_once_with(DATE)
+
+    def test_sync_meals_when_totals_differ(self, asken: MagicMock, fitbit: MagicMock):
+        fitbit.fetch_food_log.return_value = self.fitbit_day("昼食（あすけん）", 500)
+        asken.fetch_food_log.return_value = food_log(5, 800)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        syncer.sync_food_logs(DATE, [2])
+
+        # 事前チェックで取得したFitbitの食事記録を再利用する
+        fitbit.fetch_food_log.assert_called_once_with(DATE)
+        assert asken.fetch_food_log.call_count == 2
+
+    def test_use_food_log_fetched_at_startup(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = food_log(5, 800)
+        syncer = AskenFitbitSync(asken, fitbit)
+        syncer.fitbit_sink.keep_prefetched(
+            DATE, self.fitbit_day("昼食（あすけん）", 500)
+        )
+
+        syncer.sync_food_logs(DATE, [2])
+
+        fitbit.fetch_food_log.assert_not_called()
+
+    def test_no_precheck_when_other_foods_exist(
+        self, asken: MagicMock, fitbit: MagicMock
+    ):
+        fitbit.fetch_food_log.return_value = self.fitbit_day("りんご", 500)
+        asken.fetch_food_log.return_value = food_log(5, 500)
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        syncer.sync_food_logs(DATE, [2])
+
+        asken.fetch_food_log.assert_called_once_with(DATE, 2)
+
+
+class TestSyncReport:
+    def test_report_counts_calls(self, asken: MagicMock, fitbit: MagicMock):
+        asken.metrics = Metrics()
+        fitbit.metrics = Metrics()
+
+        def fetch_food_log(date: str, meal_type_id: int) -> FoodLog:
+            asken.metrics.record_response(MagicMock(content=b"x" * 10))
+            return food_log(meal_type_id, 500)
+
+        asken.fetch_food_log.side_effect = fetch_food_log
+        syncer = AskenFitbitSync(asken, fitbit, precheck=False)
+
+        report = syncer.sync_food_logs(DATE, [1, 3])
+
+        assert report.ok
+        assert [m.status for m in report.meals] == ["created", "created"]
+        assert report.upstreams["asken"].calls == 2
+        assert report.upstreams["asken"].bytes == 20
+        assert {"scrape", "publish:fitbit", "total"} <= set(report.phases)
+        assert report.sinks[0].name == "fitbit"
+        assert report.sinks[0].succeeded == 2
+
+    def test_report_is_json_serializable(self, asken: MagicMock, fitbit: MagicMock):
+        asken.fetch_food_log.return_value = None
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        report = syncer.sync_food_logs(DATE, [1])
+
+        assert report.model_dump(mode="json")["meals"][0]["reason"] == "no_log"
@@ -0,0 +1,47 @@
+from unittest.mock import MagicMock
+
+from src.audit import DriftAuditor
+from src.models.asken import FoodLog
+
+
+def daily_log(date: str, calories: float) -> FoodLog:
+    return FoodLog(date=date, meal_type_id=5, calories=calories, logged=True)
+
+
+class TestDriftAuditor:
+    def test_report_only_drifting_days(self):
+        asken = MagicMock()
+        asken.fetch_food_log.side_effect = lambda date, meal_type_id: {
+            "2024-01-01": daily_log("2024-01-01", 1800.4),
+            "2024-01-02": daily_log("2024-01-02", 2000),
+            "2024-01-03": None,
+        }[date]
+        fitbit = MagicMock()
+        fitbit.fetch_calories_in_series.return_value = {
+            "2024-01-01": 1800,
+            "2024-01-02": 1500,
+            "2024-01-03": 300,
+        }
+
+        drifts = DriftAuditor(asken, fitbit).audit("2024-01-01", "2024-01-03")
+
+        assert [(d.date, d.difference) for d in drifts] == [
+            ("2024-01-02", -500),
+            ("2024-01-03", 300),
+        ]
+        fitbit.fetch_calories_in_series.assert_called_once_with(
+            "2024-01-01", "2024-01-03"
+        )
+        asken.fetch_food_log.assert_any_call("2024-01-02", 5)
+
+    def test_split_range_by_api_limit(self):
+        fitbit = MagicMock()
+        fitbit.fetch_calories_in_series.return_value = {}
+        auditor = DriftAuditor(MagicMock(), fitbit)
+
+        auditor.fetch_fitbit_calories("2020-01-01", "2023-12-31")
+
+        assert [c.args for c in fitbit.fetch_calories_in_series.call_args_list] == [
+            ("2020-01-01", "2022-12-30"),
+            ("2022-12-31", "2023-12-31"),
+        ]
@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+from src.cache import FoodLogCache
+from src.const import CACHE_TTL_OLD, CACHE_TTL_RECENT, CACHE_TTL_TODAY
+from tests.helpers import food_log
+
+
+class TestFoodLogCache:
+    def test_put_and_get(self, tmp_path):
+        cache = FoodLogCache(str(tmp_path), "a@b.com")
+        cache.put("2024-01-01", 1, food_log(date="2024-01-01"))
+
+        hit, cached = cache.get("2024-01-01", 1)
+
+        assert hit
+        assert cached == food_log(date="2024-01-01")
+
+    def test_no_log_is_cached(self, tmp_path):
+        cache = FoodLogCache(str(tmp_path), "a@b.com")
+        cache.put("2024-01-01", 4, None)
+
+        assert cache.get("2024-01-01", 4) == (True, None)
+
+    def test_miss(self, tmp_path):
+        cache = FoodLogCache(str(tmp_path), "a@b.com")
+
+        assert cache.get("2024-01-01", 1) == (False, None)
+
+    def test_accounts_are_separated(self, tmp_path):
+        FoodLogCache(str(tmp_path), "a@b.com").put(
+            "2024-01-01", 1, food_log(date="2024-01-01")
+        )
+
+        assert not FoodLogCache(str(tmp_path), "c@d.com").get("2024-01-01", 1)[0]
+
+    def test_refresh_bypasses_cache(self, tmp_path):
+        FoodLogCache(str(tmp_path), "a@b.com").put(
+            "2024-01-01", 1, food_log(date="2024-01-01")
+        )
+
+        assert not FoodLogCache(str(tmp_path), "a@b.com", refresh=True).get(
+            "2024-01-01", 1
+        )[0]
+
+    @pytest.mark.parametrize(
+        "date, ttl",
+        [
+            ("2024-01-10", CACHE_TTL_TODAY),
+            ("2024-01-05", CACHE_TTL_RECENT),
+            ("2024-01-01", CACHE_TTL_OLD),
+        ],
+    )
+    def test_ttl_tiers(self, date: str, ttl: float):
+        assert FoodLogCache.ttl(date, today="2024-01-10") == ttl
+
+    def test_expired_entry(self, tmp_path, monkeypatch: pytest.MonkeyPatch):
+        cache = FoodLogCache(str(tmp_path), "a@b.com")
+        today = time.strftime("%Y-%m-%d")
+        cache.put(today, 1, food_log(date=today))
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + CACHE_TTL_TODAY + 1)
+
+        assert not cache.get(today, 1)[0]
+
+    def test_lru_eviction(self, tmp_path):
+        cache = FoodLogCache(str(tmp_path), "a@b.com")
+        cache.put("2024-01-01", 1, food_log(date="2024-01-01"))
+        size = os.path.getsize(next(tmp_path.glob("*/*.json")))
+        # 2件までしか入らない
+        cache = FoodLogCache(str(tmp_path), "a@b.com", max_bytes=size * 5 // 2)
+
+        cache.put("2024-01-02", 1, food_log(date="2024-01-02"))
+        path = next(tmp_path.glob("*/2024-01-02_1.json"))
+        os.utime(path, (time.time() - 60, time.time() - 60))
+        # 2024-01-01を参照して最近使われたものにする
+        cache.get("2024-01-01", 1)
+        cache.put("2024-01-03", 1, food_log(date="2024-01-03"))
+
+        assert cache.get("2024-01-01", 1)[0]
+        assert not cache.get("2024-01-02", 1)[0]
+        assert cache.get("2024-01-03", 1)[0]
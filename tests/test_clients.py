@@ -0,0 +1,166 @@
+from unittest.mock import MagicMock, patch
+import time
+
+import pytest
+
+from src.asken import Asken, AskenAuthError
+from src.clients import ClientRegistry
+from src.lambda_function import main
+from src.ledger import SqliteLedger
+from src.models.sync import SyncReport
+
+
+def asken(alive: bool = True) -> MagicMock:
+    client = MagicMock()
+    client.is_session_alive.return_value = alive
+    return client
+
+
+@pytest.fixture
+def asken_client():
+    with patch("src.asken.requests.Session") as session:
+        session.return_value.cookies = []
+        yield Asken("a@b.com", "pw")
+
+
+class TestClientRegistry:
+    def test_reuse(self):
+        registry = ClientRegistry()
+        login = MagicMock(side_effect=[asken(), asken()])
+
+        first = registry.asken("a@b.com", "pw", login)
+        second = registry.asken("a@b.com", "pw", login)
+
+        assert first is second
+        login.assert_called_once()
+        assert registry.metrics.snapshot() == {
+            "asken_creations": 1,
+            "asken_reuses": 1,
+        }
+
+    def test_scoped_to_account(self):
+        registry = ClientRegistry()
+        login = MagicMock(side_effect=[asken(), asken()])
+
+        assert registry.asken("a@b.com", "pw", login) is not registry.asken(
+            "c@d.com", "pw", login
+        )
+
+    def test_login_again_when_password_changed(self):
+        registry = ClientRegistry()
+        login = MagicMock(side_effect=[asken(), asken()])
+
+        first = registry.asken("a@b.com", "pw", login)
+        second = registry.asken("a@b.com", "new-pw", login)
+
+        assert first is not second
+
+    def test_login_again_when_session_is_not_alive(self):
+        registry = ClientRegistry(asken_max_age=60)
+        login = MagicMock(side_effect=[asken(alive=False), asken()])
+
+        first = registry.asken("a@b.com", "pw", login)
+        second = registry.asken("a@b.com", "pw", login)
+
+        assert first is not second
+        first.is_session_alive.assert_called_once_with(60)
+
+    def test_fitbit_reused_until_client_id_changes(self):
+        registry = ClientRegistry()
+        create = MagicMock(side_effect=[MagicMock(), MagicMock()])
+
+        first = registry.fitbit("a@b.com", "client", create)
+        assert registry.fitbit("a@b.com", "client", create) is first
+        assert registry.fitbit("a@b.com", "other", create) is not first
+
+    def test_invalidate(self):
+        registry = ClientRegistry()
+        login = MagicMock(side_effect=[asken(), asken()])
+        fitbit = registry.fitbit("a@b.com", "client", MagicMock)
+
+        first = registry.asken("a@b.com", "pw", login)
+        registry.invalidate("a@b.com", "asken")
+
+        assert registry.asken("a@b.com", "pw", login) is not first
+        assert registry.fitbit("a@b.com", "client", MagicMock) is fitbit
+
+    def test_ledger_kept_open(self, tmp_path):
+        registry = ClientRegistry()
+        path = str(tmp_path / "ledger.sqlite3")
+        open_ledger = MagicMock(side_effect=lambda: SqliteLedger(path, "a@b.com"))
+
+        first = registry.ledger("a@b.com", path, open_ledger)
+
+        assert registry.ledger("a@b.com", path, open_ledger) is first
+        open_ledger.assert_called_once()
+
+    def test_ledger_closed_when_replaced(self, tmp_path):
+        registry = ClientRegistry()
+        first = MagicMock(spec=SqliteLedger)
+        registry.ledger("a@b.com", str(tmp_path / "a.sqlite3"), lambda: first)
+
+        registry.ledger("a@b.com", str(tmp_path / "b.sqlite3"), MagicMock)
+        first.close.assert_called_once()
+
+        second = MagicMock(spec=SqliteLedger)
+        registry.ledger("a@b.com", str(tmp_path / "a.sqlite3"), lambda: second)
+        registry.invalidate("a@b.com")
+        second.close.assert_called_once()
+
+
+class TestAskenSessionHealth:
+    def test_alive(self, asken_client):
+        assert asken_client.is_session_alive(60)
+
+    def test_too_old(self, asken_client):
+        asken_client._logged_in_at = time.monotonic() - 61
+
+        assert not asken_client.is_session_alive(60)
+
+    def test_cookie_expired(self, asken_client):
+        asken_client._session.cookies = [MagicMock(expires=time.time() - 1)]
+
+        assert not asken_client.is_session_alive(60)
+
+    def test_redirected_to_login(self, asken_client):
+        asken_client._session.get.return_value = MagicMock(
+            status_code=200, url="https://www.asken.jp/login/"
+        )
+
+        with pytest.raises(AskenAuthError):
+            asken_client.fetch_daily_food_log("2024-01-01")
+
+        assert asken_client.auth_failed
+        assert not asken_client.is_session_alive(60)
+
+
+class TestMainRelogin:
+    def test_retry_with_new_login(self, monkeypatch):
+        expired = MagicMock()
+        expired.sync_dates.side_effect = AskenAuthError("Asken session expired")
+        renewed = MagicMock()
+        renewed.sync_dates.return_value = SyncReport(dates=["2024-01-01"])
+        create_syncer = MagicMock(side_effect=[expired, renewed])
+        monkeypatch.setattr("src.lambda_function.create_syncer", create_syncer)
+        monkeypatch.setattr("src.lambda_function.get_token_store", MagicMock())
+        registry = ClientRegistry()
+        registry.invalidate = MagicMock()  # type: ignore
+
+        report = main(
+            ["2024-01-01"], "a@b.com", "pw", "client", "a", "r", clients=registry
+        )
+
+        assert report.dates == ["2024-01-01"]
+        assert create_syncer.call_count == 2
+        registry.invalidate.assert_called_once_with("a@b.com", "asken")
+
+    def test_raise_without_registry(self, monkeypatch):
+        expired = MagicMock()
+        expired.sync_dates.side_effect = AskenAuthError("Asken session expired")
+        monkeypatch.setattr(
+            "src.lambda_function.create_syncer", MagicMock(return_value=expired)
+        )
+        monkeypatch.setattr("src.lambda_function.get_token_store", MagicMock())
+
+        with pytest.raises(AskenAuthError):
+            main(["2024-01-01"], "a@b.com", "pw", "client", "a", "r")
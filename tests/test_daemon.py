@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+import urllib.request
+from unittest.mock import MagicMock
+
+from src.daemon import SyncDaemon, create_trigger_server
+from src.models.sync import SyncReport
+
+
+class TestSyncDaemon:
+    def test_syncer_is_reused(self):
+        syncer = MagicMock()
+        syncer.sync_dates.side_effect = lambda dates, meals: SyncReport(dates=dates)
+        create = MagicMock(return_value=syncer)
+        daemon = SyncDaemon(create, days=2)
+
+        daemon.run_once()
+        daemon.run_once(["2024-01-01"])
+
+        create.assert_called_once()
+        assert len(syncer.sync_dates.call_args_list[0].args[0]) == 2
+        assert daemon.last_report == SyncReport(dates=["2024-01-01"])
+
+    def test_syncer_is_recreated_after_failure(self):
+        syncer = MagicMock()
+        syncer.sync_dates.side_effect = [
+            ConnectionError("expired"),
+            SyncReport(dates=[]),
+        ]
+        create = MagicMock(return_value=syncer)
+        daemon = SyncDaemon(create)
+
+        assert daemon.run_once(["2024-01-01"]).error == "expired"
+        daemon.run_once(["2024-01-01"])
+
+        assert create.call_count == 2
+
+    def test_trigger_server(self):
+        synced = threading.Event()
+        syncer = MagicMock()
+
+        def sync_dates(dates, meals):
+            if dates == ["2024-01-01"]:
+                synced.set()
+            return SyncReport(dates=dates)
+
+        syncer.sync_dates.side_effect = sync_dates
+        daemon = SyncDaemon(lambda: syncer, interval=60)
+        server = create_trigger_server(daemon, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        runner = threading.Thread(target=daemon.run, daemon=True)
+        runner.start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        try:
+            request = urllib.request.Request(
+                f"{url}/sync", data=json.dumps({"dates": ["2024-01-01"]}).encode()
+            )
+            with urllib.request.urlopen(request) as response:
+                assert response.status == 202
+            assert synced.wait(5)
+
+            # 同期が終わってからレポートが更新されるまで待つ
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                with urllib.request.urlopen(f"{url}/status") as response:
+                    status = json.load(response)
+                if status["report"]["dates"] == ["2024-01-01"]:
+                    break
+                time.sleep(0.01)
+            assert status["report"]["dates"] == ["2024-01-01"]
+        finally:
+            daemon.stop()
+            server.shutdown()
+            runner.join(5)
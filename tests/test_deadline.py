@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock
+
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.deadline import Deadline, prioritize_dates
+from src.models.asken import FoodLog
+from src.models.fitbit import GetFoodLogResponse
+from tests.data.json import GET_FOOD_LOG_RESPONSE_JSON
+from tests.helpers import DATE, food_log
+
+
+class TestDeadline:
+    def test_no_deadline(self):
+        assert Deadline().has_time_for(10**9)
+
+    def test_expired_deadline(self):
+        assert not Deadline(0).has_time_for(1)
+
+    def test_from_lambda_context(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 10_000
+
+        deadline = Deadline.from_lambda_context(context, margin=3.0)
+
+        assert 6 < deadline.remaining() <= 7
+
+    def test_prioritize_dates(self):
+        dates = ["2024-01-01", "2024-01-03", "2024-01-05", "2024-01-03"]
+
+        assert prioritize_dates(dates, today="2024-01-03") == [
+            "2024-01-03",
+            "2024-01-05",
+            "2024-01-01",
+        ]
+
+
+class TestDeadlineAwareSync:
+    def test_all_meals_pending_without_time(self):
+        asken = MagicMock()
+        fitbit = MagicMock()
+        syncer = AskenFitbitSync(asken, fitbit)
+
+        report = syncer.sync_dates(["2024-01-01", "2024-01-02"], deadline=Deadline(0))
+
+        assert {m.reason for m in report.meals} == {"deadline"}
+        assert report.pending_dates == ["2024-01-02", "2024-01-01"]
+        assert not report.completed
+        asken.fetch_food_log.assert_not_called()
+        fitbit.fetch_food_log.assert_not_called()
+
+    def test_never_delete_without_time_to_create(self):
+        asken = MagicMock()
+        asken.fetch_food_log.return_value = food_log(2, 500)
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = GetFoodLogResponse(
+            **GET_FOOD_LOG_RESPONSE_JSON
+        )
+        # スクレイピングまでは間に合うが、削除と再登録の2リクエスト分の時間はない
+        syncer = AskenFitbitSync(asken, fitbit, precheck=False, request_budget=1.0)
+        deadline = Deadline(4.5)
+        syncer._meal_budget = lambda meal_type_id: 0.0  # type: ignore[method-assign]
+
+        def fetch_food_log(date: str, meal_type_id: int) -> FoodLog:
+            deadline._at -= 3.0
+            return food_log(meal_type_id, 500)
+
+        asken.fetch_food_log.side_effect = fetch_food_log
+
+        report = syncer.sync_dates([DATE], [2], deadline=deadline)
+
+        assert [m.reason for m in report.meals] == ["deadline"]
+        assert report.pending_dates == [DATE]
+        fitbit.delete_food_log.assert_not_called()
+        fitbit.create_food_log.assert_not_called()
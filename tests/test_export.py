@@ -0,0 +1,53 @@
+import os
+
+from src.export import NUTRITION_COLUMNS, NutritionStore
+from tests.helpers import food_log
+
+
+class TestNutritionStore:
+    def test_write_partitions_by_month(self, tmp_path):
+        store = NutritionStore(str(tmp_path))
+
+        written = store.write(
+            [
+                food_log(1, 500, "2024-01-31", solt=1.5),
+                food_log(1, 600, "2024-02-01", solt=1.5),
+                food_log(2, 700, "2024-02-01", solt=1.5),
+            ]
+        )
+
+        assert written == 3
+        assert store.months() == ["2024-01", "2024-02"]
+        columns = store.read("2024-02")
+        assert list(columns["date"]) == [20240201, 20240201]
+        assert list(columns["meal_type_id"]) == [1, 2]
+        assert list(columns["calories"]) == [600, 700]
+        assert list(columns["solt"]) == [1.5, 1.5]
+        assert set(NUTRITION_COLUMNS) <= set(columns)
+
+    def test_write_only_new_or_changed_rows(self, tmp_path):
+        store = NutritionStore(str(tmp_path))
+        store.write(
+            [
+                food_log(1, 500, "2024-01-01", solt=1.5),
+                food_log(2, 600, "2024-01-01", solt=1.5),
+            ]
+        )
+
+        assert store.write([food_log(1, 500, "2024-01-01", solt=1.5)]) == 0
+        assert store.write([food_log(2, 650, "2024-01-01", solt=1.5)]) == 1
+
+        columns = store.read("2024-01")
+        assert list(columns["calories"]) == [500, 650]
+
+    def test_read_ignores_partially_appended_rows(self, tmp_path):
+        store = NutritionStore(str(tmp_path))
+        store.write([food_log(1, 500, "2024-01-01", solt=1.5)])
+
+        # キー列の追記前に中断した状態を再現
+        with open(os.path.join(tmp_path, "2024-01", "calories.bin"), "ab") as f:
+            f.write(b"\x00" * 8)
+
+        assert len(store.read("2024-01")["calories"]) == 1
+        store.write([food_log(1, 800, "2024-01-02", solt=1.5)])
+        assert list(store.read("2024-01")["calories"]) == [500, 800]
@@ -11,6 +11,7 @@ from src.models.fitbit import (
     GetFoodLogResponse,
 )
 from tests.data.json import (
+    CALORIES_IN_SERIES_RESPONSE_JSON,
     GET_FOOD_LOG_RESPONSE_JSON,
     CREATE_FOOD_LOG_PARAMS_JSON,
     CREATE_FOOD_LOG_RESPONSE_JSON,
@@ -120,6 +121,22 @@ class TestFitbit:
 
             fitbit._callback_on_token_refreshed.assert_not_called()
 
+    # ===== Fetch Calories In Series =====
+    def test_fetch_calories_in_series_success(
+        self, fitbit: Fitbit, mock_get: MagicMock
+    ):
+        mock_get.return_value.json.return_value = CALORIES_IN_SERIES_RESPONSE_JSON
+        mock_get.return_value.raise_for_status.side_effect = None
+
+        response = fitbit.fetch_calories_in_series("2024-06-01", "2024-06-02")
+        assert response == {"2024-06-01": 1800.0, "2024-06-02": 0.0}
+
+        requested_url = mock_get.call_args[0][0]
+        assert (
+            requested_url
+            == f"{FITBIT_HOST}/1/user/-/foods/log/caloriesIn/date/2024-06-01/2024-06-02.json"
+        ), "URL mismatch"
+
     # ===== Create Food Log =====
     def test_create_food_log_success(self, fitbit: Fitbit, mock_post: MagicMock):
         mock_json = CREATE_FOOD_LOG_RESPONSE_JSON
@@ -0,0 +1,90 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.hedging import Hedger, LatencyTracker
+
+
+class TestLatencyTracker:
+    def test_initial_threshold(self):
+        tracker = LatencyTracker(min_samples=3, initial_threshold=2.0)
+        tracker.record(0.1)
+
+        assert tracker.threshold() == 2.0
+
+    def test_percentile_threshold(self):
+        tracker = LatencyTracker(percentile=0.9, min_samples=1)
+        for i in range(1, 11):
+            tracker.record(i / 10)
+
+        assert tracker.threshold() == pytest.approx(0.9)
+        stats = tracker.latency_stats()
+        assert stats["count"] == 10
+        assert stats["p50"] == pytest.approx(0.5)
+        assert stats["max"] == pytest.approx(1.0)
+
+
+class TestHedger:
+    @staticmethod
+    def slow_then_fast(release: threading.Event):
+        calls = []
+        fast = MagicMock(name="fast")
+        slow = MagicMock(name="slow")
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                release.wait(5)
+                return slow
+            return fast
+
+        return send, fast, slow
+
+    def test_fast_request_is_not_hedged(self):
+        hedger = Hedger(LatencyTracker(initial_threshold=1.0), max_hedge_ratio=1.0)
+        response = MagicMock()
+
+        assert hedger.request(lambda: response) is response
+        assert hedger.hedges == 0
+
+    def test_slow_request_is_hedged(self):
+        release = threading.Event()
+        send, fast, slow = self.slow_then_fast(release)
+        hedger = Hedger(LatencyTracker(initial_threshold=0.01), max_hedge_ratio=1.0)
+
+        try:
+            assert hedger.request(send) is fast
+        finally:
+            release.set()
+            hedger.shutdown()
+
+        assert hedger.hedges == 1
+        assert hedger.hedge_wins == 1
+
+    def test_hedges_are_capped(self):
+        release = threading.Event()
+        send, fast, slow = self.slow_then_fast(release)
+        hedger = Hedger(LatencyTracker(initial_threshold=0.01), max_hedge_ratio=0.0)
+
+        threading.Timer(0.05, release.set).start()
+
+        assert hedger.request(send) is slow
+        assert hedger.hedges == 0
+
+    def test_hedge_covers_failed_request(self):
+        release = threading.Event()
+        response = MagicMock()
+        calls = []
+
+        def send():
+            calls.append(None)
+            if len(calls) == 1:
+                release.wait(5)
+                raise ConnectionError("reset")
+            release.set()
+            return response
+
+        hedger = Hedger(LatencyTracker(initial_threshold=0.01), max_hedge_ratio=1.0)
+
+        assert hedger.request(send) is response
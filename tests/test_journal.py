@@ -0,0 +1,170 @@
+from unittest.mock import MagicMock
+import os
+
+import pytest
+from requests.exceptions import HTTPError
+
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.const import MEAL_TYPES
+from src.journal import WriteJournal
+from src.models.fitbit import GetFoodLogResponse
+from src.sinks import FitbitSink
+from tests.data.json import GET_FOOD_LOG_RESPONSE_JSON
+from tests.helpers import CREATED_LOG_ID, DATE, food_log
+
+
+def registered_lunch(log_id: int, calories: float) -> GetFoodLogResponse:
+    """Fitbit food day which has a lunch entry of this tool."""
+    return registered_meal(2, log_id, calories)
+
+
+def registered_meal(
+    meal_type_id: int, log_id: int, calories: float
+) -> GetFoodLogResponse:
+    """Fitbit food day which has only an entry of this tool for the meal."""
+    response = GetFoodLogResponse(**GET_FOOD_LOG_RESPONSE_JSON)
+    food = response.foods[0]
+    food.logId = log_id
+    food.loggedFood.mealTypeId = MEAL_TYPES[meal_type_id]["fitbit_id"]
+    food.loggedFood.name = MEAL_TYPES[meal_type_id]["name"]
+    food.loggedFood.calories = calories
+    response.foods = [food]
+    return response
+
+
+class TestWriteJournal:
+    def test_pending_survives_restart(self, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        replaced = journal.plan(DATE, 1, food_log(), delete_log_id=42)
+        created = journal.plan(DATE, 2, food_log())
+        done = journal.plan(DATE, 3, food_log())
+        journal.mark_deleted(replaced)
+        journal.mark_done(done)
+
+        pending = WriteJournal(str(tmp_path), "a@b.com").pending()
+
+        assert [(entry.id, entry.deleted) for entry in pending] == [
+            (replaced, True),
+            (created, False),
+        ]
+        assert pending[0].meal == food_log()
+        assert pending[0].delete_log_id == 42
+
+    def test_emptied_when_all_done(self, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        journal.mark_done(journal.plan(DATE, 1, food_log()))
+
+        assert [os.path.getsize(path) for path in tmp_path.iterdir()] == [0]
+
+    def test_supersede_same_meal(self, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        journal.plan(DATE, 1, food_log(), delete_log_id=42)
+        latest = journal.plan(DATE, 1, food_log(calories=800), delete_log_id=42)
+
+        assert [entry.id for entry in journal.pending()] == [latest]
+
+    def test_ignore_torn_line(self, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        planned = journal.plan(DATE, 1, food_log(), delete_log_id=42)
+        path = next(tmp_path.iterdir())
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"op": "del')
+
+        reopened = WriteJournal(str(tmp_path), "a@b.com")
+        done = reopened.plan(DATE, 2, food_log())
+        reopened.mark_done(done)
+
+        assert [
+            entry.id for entry in WriteJournal(str(tmp_path), "a@b.com").pending()
+        ] == [planned]
+
+
+class TestFitbitSinkJournal:
+    def test_recover_after_crash_between_delete_and_create(
+        self, fitbit: MagicMock, tmp_path
+    ):
+        fitbit.fetch_food_log.return_value = registered_lunch(42, 500)
+        fitbit.create_food_log.side_effect = SystemExit
+        sink = FitbitSink(fitbit, journal=WriteJournal(str(tmp_path), "a@b.com"))
+        with pytest.raises(SystemExit):
+            sink.write(DATE, {2: food_log(calories=800, meal_type_id=2)})
+        fitbit.delete_food_log.assert_called_once_with(42)
+
+        fitbit.reset_mock()
+        fitbit.create_food_log.side_effect = None
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+
+        results = FitbitSink(fitbit, journal=journal).recover()
+
+        assert [(result.status, result.reason) for result in results] == [
+            ("replaced", "recovered")
+        ]
+        assert results[0].log_id == CREATED_LOG_ID
+        fitbit.fetch_food_log.assert_not_called()
+        fitbit.delete_food_log.assert_not_called()
+        fitbit.create_food_log.assert_called_once()
+        assert journal.pending() == []
+
+    def test_delete_again_if_unknown(self, fitbit: MagicMock, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        journal.plan(DATE, 1, food_log(), delete_log_id=42)
+        fitbit.delete_food_log.side_effect = HTTPError(
+            "not found", response=MagicMock(status_code=404)
+        )
+
+        results = FitbitSink(fitbit, journal=journal).recover()
+
+        assert results[0].status == "replaced"
+        fitbit.delete_food_log.assert_called_once_with(42)
+        fitbit.create_food_log.assert_called_once()
+
+    def test_recover_discards_prefetched_day(self, fitbit: MagicMock, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        journal.mark_deleted(journal.plan(DATE, 1, food_log(), delete_log_id=123))
+        # 先読みした日には削除後、再登録前の状態が残っている
+        empty_day = GetFoodLogResponse(**GET_FOOD_LOG_RESPONSE_JSON)
+        empty_day.foods = []
+        fitbit.fetch_food_log.side_effect = lambda date: (
+            registered_meal(1, CREATED_LOG_ID, 500)
+            if fitbit.create_food_log.called
+            else empty_day
+        )
+        asken = MagicMock()
+        asken.fetch_food_log.return_value = food_log()
+        syncer = AskenFitbitSync(asken, fitbit, journal=journal)
+        syncer.fitbit_sink.prefetch_food_log(DATE)
+
+        report = syncer.sync_dates([DATE], [1])
+
+        assert [(meal.status, meal.reason) for meal in report.meals] == [
+            ("replaced", "recovered"),
+            ("skipped", "already_registered"),
+        ]
+        fitbit.create_food_log.assert_called_once()
+
+    def test_keep_failed_recovery(self, fitbit: MagicMock, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+        journal.plan(DATE, 1, food_log())
+        fitbit.create_food_log.side_effect = ValueError("fitbit down")
+
+        results = FitbitSink(fitbit, journal=journal).recover()
+
+        assert results[0].status == "failed"
+        assert results[0].error == "fitbit down"
+        assert len(journal.pending()) == 1
+
+    def test_finished_write_is_done(self, fitbit: MagicMock, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+
+        FitbitSink(fitbit, journal=journal).write(DATE, {1: food_log(calories=800)})
+
+        assert journal.pending() == []
+
+    def test_dry_run_is_not_journaled(self, fitbit: MagicMock, tmp_path):
+        journal = WriteJournal(str(tmp_path), "a@b.com")
+
+        FitbitSink(fitbit, dry_run=True, journal=journal).write(
+            DATE, {1: food_log(calories=800)}
+        )
+
+        assert journal.pending() == []
@@ -0,0 +1,108 @@
+from unittest.mock import MagicMock
+
+import pytest
+from requests.exceptions import HTTPError
+
+from src.ledger import LedgerEntry, SqliteLedger, fingerprint
+from src.sinks import FitbitSink
+from tests.helpers import CREATED_LOG_ID, DATE, food_log
+
+
+@pytest.fixture
+def ledger(tmp_path) -> SqliteLedger:
+    return SqliteLedger(str(tmp_path / "ledger.sqlite3"), "a@b.com")
+
+
+class TestSqliteLedger:
+    def test_put_get_forget(self, ledger: SqliteLedger, tmp_path):
+        ledger.put(DATE, 1, LedgerEntry(fingerprint="abc", log_id=1))
+        ledger.put(DATE, 2, LedgerEntry(fingerprint="def"))
+
+        reopened = SqliteLedger(str(tmp_path / "ledger.sqlite3"), "a@b.com")
+        assert reopened.get(DATE, 1) == LedgerEntry(fingerprint="abc", log_id=1)
+        assert reopened.get(DATE, 2) == LedgerEntry(fingerprint="def")
+
+        ledger.forget(DATE, 1)
+        assert ledger.get(DATE, 1) is None
+        ledger.forget(DATE)
+        assert ledger.get(DATE, 2) is None
+
+    def test_scoped_to_account(self, ledger: SqliteLedger, tmp_path):
+        ledger.put(DATE, 1, LedgerEntry(fingerprint="abc", log_id=1))
+
+        other = SqliteLedger(str(tmp_path / "ledger.sqlite3"), "c@d.com")
+
+        assert other.get(DATE, 1) is None
+
+    def test_fingerprint(self):
+        assert fingerprint(food_log()) == fingerprint(food_log(calcium=100))
+        assert fingerprint(food_log()) != fingerprint(food_log(calories=501))
+        assert fingerprint(None) == "none"
+
+
+class TestFitbitSinkLedger:
+    def test_skip_unchanged_without_fetching(
+        self, fitbit: MagicMock, ledger: SqliteLedger
+    ):
+        sink = FitbitSink(fitbit, ledger=ledger)
+        sink.publish(DATE, {1: food_log()})
+        fitbit.reset_mock()
+
+        results = sink.publish(DATE, {1: food_log()})
+
+        assert results[0].reason == "unchanged"
+        assert results[0].log_id == CREATED_LOG_ID
+        fitbit.fetch_food_log.assert_not_called()
+        fitbit.create_food_log.assert_not_called()
+
+    def test_replace_by_log_id(self, fitbit: MagicMock, ledger: SqliteLedger):
+        ledger.put(DATE, 1, LedgerEntry(fingerprint=fingerprint(food_log()), log_id=42))
+        sink = FitbitSink(fitbit, ledger=ledger)
+
+        results = sink.publish(DATE, {1: food_log(calories=800)})
+
+        assert results[0].status == "replaced"
+        fitbit.fetch_food_log.assert_not_called()
+        fitbit.delete_food_log.assert_called_once_with(42)
+        assert ledger.get(DATE, 1) == LedgerEntry(
+            fingerprint=fingerprint(food_log(calories=800)), log_id=CREATED_LOG_ID
+        )
+
+    def test_log_deleted_by_user(self, fitbit: MagicMock, ledger: SqliteLedger):
+        ledger.put(DATE, 1, LedgerEntry(fingerprint=fingerprint(food_log()), log_id=42))
+        fitbit.delete_food_log.side_effect = HTTPError(
+            "not found", response=MagicMock(status_code=404)
+        )
+        sink = FitbitSink(fitbit, ledger=ledger)
+
+        results = sink.publish(DATE, {1: food_log(calories=800)})
+
+        assert results[0].status == "replaced"
+        fitbit.create_food_log.assert_called_once()
+
+    def test_forget_failed_meal(self, fitbit: MagicMock, ledger: SqliteLedger):
+        ledger.put(DATE, 1, LedgerEntry(fingerprint=fingerprint(food_log()), log_id=42))
+        fitbit.create_food_log.return_value = None
+        sink = FitbitSink(fitbit, ledger=ledger)
+
+        results = sink.publish(DATE, {1: food_log(calories=800)})
+
+        assert results[0].status == "deleted"
+        assert ledger.get(DATE, 1) is None
+
+    def test_created_without_log_id(self, fitbit: MagicMock, ledger: SqliteLedger):
+        fitbit.create_food_log.return_value = {"foodLog": {}}
+        sink = FitbitSink(fitbit, ledger=ledger)
+
+        results = sink.publish(DATE, {1: food_log()})
+
+        assert results[0].status == "created"
+        assert results[0].log_id is None
+        assert ledger.get(DATE, 1) is None
+
+    def test_dry_run_does_not_record(self, fitbit: MagicMock, ledger: SqliteLedger):
+        sink = FitbitSink(fitbit, dry_run=True, ledger=ledger)
+
+        sink.publish(DATE, {1: food_log()})
+
+        assert ledger.get(DATE, 1) is None
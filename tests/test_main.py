@@ -0,0 +1,135 @@
+import argparse
+import io
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.__main__ import (
+    NdjsonWriter,
+    build_parser,
+    parse_meal_type_ids,
+    resolve_dates,
+    run,
+    sync_day,
+)
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.journal import WriteJournal
+from src.models.asken import FoodLog
+from src.models.fitbit import GetFoodLogResponse
+from src.models.sync import MealSyncResult
+from tests.data.json import CREATE_FOOD_LOG_RESPONSE_JSON, GET_FOOD_LOG_RESPONSE_JSON
+
+
+class TestMain:
+    def test_parse_meal_type_ids(self):
+        assert parse_meal_type_ids("1,3") == [1, 3]
+
+    @pytest.mark.parametrize("value", ["", "a", "1,5"])
+    def test_parse_meal_type_ids_invalid(self, value: str):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_meal_type_ids(value)
+
+    def test_resolve_dates_range(self):
+        args = build_parser().parse_args(
+            ["--start", "2024-01-30", "--end", "2024-02-02"]
+        )
+        assert resolve_dates(args) == [
+            "2024-01-30",
+            "2024-01-31",
+            "2024-02-01",
+            "2024-02-02",
+        ]
+
+    def test_resolve_dates_conflict(self):
+        args = build_parser().parse_args(
+            ["--date", "2024-01-01", "--start", "2024-01-01"]
+        )
+        with pytest.raises(ValueError):
+            resolve_dates(args)
+
+    def test_sync_day_writes_ndjson(self):
+        stream = io.StringIO()
+        syncer = MagicMock()
+        syncer.iter_sync_food_logs.return_value = iter(
+            [
+                MealSyncResult(date="2024-01-01", meal_type_id=1, status="created"),
+                MealSyncResult(date="2024-01-01", meal_type_id=2, status="skipped"),
+            ]
+        )
+
+        ok = sync_day(syncer, "2024-01-01", [1, 2], NdjsonWriter(stream))
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert ok
+        assert [r["status"] for r in records] == ["created", "skipped"]
+
+    def test_sync_day_reports_failure(self):
+        stream = io.StringIO()
+        syncer = MagicMock()
+        syncer.iter_sync_food_logs.side_effect = Exception("boom")
+
+        ok = sync_day(syncer, "2024-01-01", [1, 2], NdjsonWriter(stream))
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert not ok
+        assert [r["status"] for r in records] == ["failed", "failed"]
+        assert records[0]["error"] == "boom"
+
+    @pytest.mark.parametrize("mode", [[], ["--pipeline"], ["--compact"]])
+    def test_run_recovers_journal(self, mode: list[str], tmp_path, monkeypatch, capsys):
+        credentials = tmp_path / "credentials.json"
+        credentials.write_text(
+            json.dumps(
+                {
+                    "mail": "a@b.com",
+                    "password": "pw",
+                    "client_id": "client",
+                    "access_token": "access",
+                    "refresh_token": "refresh",
+                }
+            )
+        )
+        WriteJournal(str(tmp_path), "a@b.com").plan(
+            "2024-01-01",
+            2,
+            FoodLog(date="2024-01-01", meal_type_id=2, calories=500, logged=True),
+            delete_log_id=42,
+        )
+        asken = MagicMock()
+        asken.fetch_food_log.return_value = None
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = GetFoodLogResponse(
+            **GET_FOOD_LOG_RESPONSE_JSON
+        )
+        fitbit.create_food_log.return_value = CREATE_FOOD_LOG_RESPONSE_JSON
+
+        def create_syncer(**kwargs):
+            return AskenFitbitSync(
+                asken,
+                fitbit,
+                precheck=False,
+                journal=WriteJournal(kwargs["journal_dir"], kwargs["mail"]),
+            )
+
+        monkeypatch.setattr("src.__main__.create_syncer", create_syncer)
+        args = build_parser().parse_args(
+            [
+                "--date",
+                "2024-01-02",
+                "--meals",
+                "1",
+                "--credentials",
+                str(credentials),
+                "--journal-dir",
+                str(tmp_path),
+                *mode,
+            ]
+        )
+
+        assert run(args, resolve_dates(args)) == 0
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert (records[0]["date"], records[0]["reason"]) == ("2024-01-01", "recovered")
+        fitbit.delete_food_log.assert_called_once_with(42)
+        assert WriteJournal(str(tmp_path), "a@b.com").pending() == []
@@ -0,0 +1,142 @@
+from unittest.mock import MagicMock
+import json
+
+from src.deadline import Deadline
+from src.lambda_function import orchestrator_handler
+from src.models.sync import SyncReport
+from src.orchestrator import (
+    LambdaInvoker,
+    LocalInvoker,
+    Orchestrator,
+    assign_shards,
+    run_worker,
+    shard_of,
+)
+
+
+ACCOUNTS = [f"account-{i}" for i in range(100)]
+
+
+def sync_account(
+    account: str, dates: list[str], meal_type_id_list: list[int], deadline: Deadline
+) -> SyncReport:
+    return SyncReport(dates=dates)
+
+
+def worker(event: dict, context) -> dict:
+    return run_worker(event, sync_account, Deadline(event["deadline_seconds"]))
+
+
+class TestSharding:
+    def test_stable(self):
+        assert [shard_of(account, 4) for account in ACCOUNTS] == [
+            shard_of(account, 4) for account in ACCOUNTS
+        ]
+
+    def test_every_account_assigned_once(self):
+        assignment = assign_shards(ACCOUNTS, 4)
+
+        assert sorted(sum(assignment.values(), [])) == sorted(ACCOUNTS)
+        assert set(assignment) == {0, 1, 2, 3}
+
+    def test_adding_shard_moves_few_accounts(self):
+        moved = [
+            account
+            for account in ACCOUNTS
+            if shard_of(account, 4) != shard_of(account, 5)
+        ]
+
+        # 増えたシャードに移るアカウントだけが動く
+        assert all(shard_of(account, 5) == 4 for account in moved)
+        assert len(moved) < len(ACCOUNTS) / 2
+
+
+class TestOrchestrator:
+    def test_merge_reports(self):
+        orchestrator = Orchestrator(LocalInvoker(worker), shards=3, margin=1.0)
+
+        report = orchestrator.run(ACCOUNTS[:10], ["2024-01-01"], deadline=Deadline(60))
+
+        assert sorted(report.accounts) == sorted(ACCOUNTS[:10])
+        assert report.ok
+        assert not report.pending_accounts
+
+    def test_per_shard_deadline(self):
+        handler = MagicMock(side_effect=worker)
+        orchestrator = Orchestrator(LocalInvoker(handler), shards=2, margin=5.0)
+
+        orchestrator.run(ACCOUNTS[:10], ["2024-01-01"], deadline=Deadline(60))
+
+        for call in handler.call_args_list:
+            assert 50 < call.args[0]["deadline_seconds"] <= 55
+
+    def test_failed_shard(self):
+        def failing_worker(event: dict, context) -> dict:
+            if event["shard"] == 0:
+                raise RuntimeError("worker crashed")
+            return worker(event, context)
+
+        orchestrator = Orchestrator(LocalInvoker(failing_worker), shards=2)
+
+        report = orchestrator.run(ACCOUNTS[:10], ["2024-01-01"], deadline=Deadline(60))
+
+        assert report.failed_shards == [0]
+        assert sorted(report.pending_accounts) == sorted(report.shards[0])
+        assert report.accounts[report.shards[0][0]].error == "worker crashed"
+        assert not report.ok
+
+    def test_lambda_invoker(self):
+        client = MagicMock()
+        client.invoke.return_value = {
+            "Payload": MagicMock(read=MagicMock(return_value=b'{"reports": {}}'))
+        }
+        invoker = LambdaInvoker(client, "worker-{shard}")
+
+        result = invoker.invoke(2, {"accounts": []})
+
+        assert result == {"reports": {}}
+        assert client.invoke.call_args.kwargs["FunctionName"] == "worker-2"
+        assert json.loads(client.invoke.call_args.kwargs["Payload"]) == {"accounts": []}
+
+
+class TestWorker:
+    def test_pending_after_deadline(self):
+        sync = MagicMock(side_effect=sync_account)
+        event = {"shard": 0, "accounts": ["a", "b"], "dates": ["2024-01-01"]}
+
+        result = run_worker(event, sync, Deadline(0), startup_budget=1.0)
+
+        sync.assert_not_called()
+        assert result["reports"]["a"]["pending_dates"] == ["2024-01-01"]
+
+    def test_failed_account_does_not_stop_others(self):
+        def flaky(account, dates, meal_type_id_list, deadline):
+            if account == "a":
+                raise RuntimeError("login failed")
+            return sync_account(account, dates, meal_type_id_list, deadline)
+
+        event = {"shard": 0, "accounts": ["a", "b"], "dates": ["2024-01-01"]}
+
+        result = run_worker(event, flaky, Deadline())
+
+        assert result["reports"]["a"]["error"] == "login failed"
+        assert result["reports"]["b"]["pending_dates"] == []
+
+
+class TestOrchestratorHandler:
+    def test_worker_invoked_without_retries(self, monkeypatch):
+        boto3 = MagicMock()
+        client = boto3.session.Session.return_value.client.return_value
+        client.invoke.return_value = {
+            "Payload": MagicMock(read=MagicMock(return_value=b'{"reports": {}}'))
+        }
+        monkeypatch.setattr("src.lambda_function.boto3", boto3)
+        monkeypatch.setenv("WORKER_FUNCTION_NAME", "worker")
+        context = MagicMock(get_remaining_time_in_millis=MagicMock(return_value=300000))
+
+        orchestrator_handler({"accounts": ["a"], "date": "2024-01-01"}, context)
+
+        config = boto3.session.Session.return_value.client.call_args.kwargs["config"]
+        # 同期呼び出しの読み込みタイムアウトで再試行されると、同じアカウントが二重に同期される
+        assert 290 < config.read_timeout <= 300
+        assert config.retries == {"max_attempts": 0}
@@ -0,0 +1,141 @@
+from typing import Optional
+import time
+
+from src.models.asken import FoodLog
+from src.models.sync import MealSyncResult
+from src.pipeline import FoodLogMessage, InMemoryQueue, WriteStage, run_pipeline
+from src.sinks import FoodLogSink
+
+
+class RecordingSink(FoodLogSink):
+    name = "recording"
+
+    def __init__(self, fail_first: int = 0):
+        super().__init__(max_retries=0, retry_interval=0)
+        self.fail_first = fail_first
+        self.written: list[tuple[str, int]] = []
+
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        if self.fail_first:
+            self.fail_first -= 1
+            raise OSError("temporary error")
+
+        self.written.extend((date, meal_type_id) for meal_type_id in food_logs)
+        return [
+            MealSyncResult(date=date, meal_type_id=meal_type_id, status="created")
+            for meal_type_id in food_logs
+        ]
+
+
+def message(date: str, meal_type_id: int) -> FoodLogMessage:
+    food_log = FoodLog(date=date, meal_type_id=meal_type_id, calories=500, logged=True)
+    return FoodLogMessage.create(date, meal_type_id, food_log)
+
+
+class TestInMemoryQueue:
+    def test_message_is_validated_on_receive(self):
+        queue = InMemoryQueue()
+        queue.send_batch([message("2024-01-01", 1)])
+
+        received = queue.receive()
+
+        assert received[0].message.food_log is not None
+        assert received[0].message.food_log.calories == 500
+
+    def test_redelivery_after_visibility_timeout(self):
+        queue = InMemoryQueue(visibility_timeout=0.01)
+        queue.send_batch([message("2024-01-01", 1)])
+
+        first = queue.receive()
+        assert queue.receive() == []
+        time.sleep(0.02)
+        second = queue.receive()
+
+        assert second[0].message == first[0].message
+        assert second[0].receive_count == 2
+
+        queue.delete_batch([second[0].receipt_handle])
+        assert queue.approximate_count() == 0
+
+
+class TestWriteStage:
+    def test_redelivered_message_is_not_written_twice(self):
+        queue = InMemoryQueue()
+        sink = RecordingSink()
+        stage = WriteStage([sink], queue)
+        msg = message("2024-01-01", 1)
+
+        queue.send_batch([msg, msg])
+        stage.process(queue.receive())
+
+        assert sink.written == [("2024-01-01", 1)]
+        assert queue.approximate_count() == 0
+
+    def test_message_redelivered_while_publishing(self):
+        queue = InMemoryQueue(visibility_timeout=0.01)
+        sink = RecordingSink()
+        stage = WriteStage([sink], queue)
+        queue.send_batch([message("2024-01-01", 1)])
+        first = queue.receive()
+        time.sleep(0.02)
+        publish = sink.publish
+
+        def slow_publish(date, food_logs):
+            # 書き込み中に可視性タイムアウトが過ぎ、別のワーカーに再配信される
+            stage.process(queue.receive())
+            return publish(date, food_logs)
+
+        sink.publish = slow_publish  # type: ignore
+        stage.process(first)
+
+        assert sink.written == [("2024-01-01", 1)]
+        assert queue.approximate_count() == 0
+
+    def test_failure_reported_on_last_attempt(self):
+        queue = InMemoryQueue(visibility_timeout=0)
+        sink = RecordingSink(fail_first=3)
+        results: list[MealSyncResult] = []
+        stage = WriteStage([sink], queue, max_receive_count=2, on_result=results.append)
+        queue.send_batch([message("2024-01-01", 1)])
+
+        stage.process(queue.receive())
+        assert results == []
+        stage.process(queue.receive())
+        stage.process(queue.receive())
+
+        assert [r.status for r in results] == ["failed"]
+        assert len(stage.dead_letters) == 1
+        assert queue.approximate_count() == 0
+
+    def test_message_id_depends_on_payload(self):
+        assert (
+            message("2024-01-01", 1).message_id == message("2024-01-01", 1).message_id
+        )
+        assert (
+            message("2024-01-01", 1).message_id != message("2024-01-01", 2).message_id
+        )
+
+
+class TestRunPipeline:
+    def test_failed_write_is_redelivered(self):
+        sink = RecordingSink(fail_first=1)
+        results: list[MealSyncResult] = []
+
+        dead_letters = run_pipeline(
+            lambda date, meal_type_id: FoodLog(
+                date=date, meal_type_id=meal_type_id, calories=100, logged=True
+            ),
+            [sink],
+            [("2024-01-01", 1), ("2024-01-02", 1)],
+            queue=InMemoryQueue(visibility_timeout=0.05),
+            batch_size=1,
+            write_workers=1,
+            on_result=results.append,
+        )
+
+        assert dead_letters == []
+        assert sorted(sink.written) == [("2024-01-01", 1), ("2024-01-02", 1)]
+        # 再配信で成功した失敗は報告しない
+        assert [r.status for r in results] == ["created", "created"]
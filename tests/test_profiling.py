@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import pstats
+import time
+from contextlib import nullcontext
+
+import pytest
+
+from src.profiling import maybe_profile, profiling_enabled
+
+
+def busy() -> list[bytes]:
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        pass
+    return [b"x" * 1024 for _ in range(100)]
+
+
+class TestProfiling:
+    def test_disabled_is_noop(self):
+        assert isinstance(maybe_profile(False), nullcontext)
+
+    def test_enabled_by_env_or_event(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.delenv("PROFILE", raising=False)
+        assert not profiling_enabled({})
+        assert profiling_enabled({"profile": True})
+
+        monkeypatch.setenv("PROFILE", "1")
+        assert profiling_enabled(None)
+
+    def test_deterministic_profile_covers_worker_threads(self, tmp_path):
+        with maybe_profile(
+            True, name="run", directory=str(tmp_path), mode="deterministic"
+        ):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                executor.submit(busy).result()
+
+        stats = pstats.Stats(str(tmp_path / "run.pstats"))
+        assert any(func[2] == "busy" for func in stats.stats)  # type: ignore[attr-defined]
+        assert "Peak traced memory" in (tmp_path / "run.alloc.txt").read_text()
+
+    def test_sampling_profile_by_default(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("PROFILE_MODE", raising=False)
+        with maybe_profile(True, name="run", directory=str(tmp_path)):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                executor.submit(busy).result()
+
+        assert "test_profiling.py:busy" in (tmp_path / "run.collapsed").read_text()
+        assert not (tmp_path / "run.pstats").exists()
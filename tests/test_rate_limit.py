@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import threading
+import time
+
+import pytest
+import requests
+
+from src.hedging import LatencyTracker
+from src.rate_limit import AimdLimiter
+
+
+def response(status_code: int = 200) -> requests.Response:
+    res = requests.Response()
+    res.status_code = status_code
+    return res
+
+
+class TestAimdLimiter:
+    def test_increase_on_success(self):
+        limiter = AimdLimiter(initial_limit=2, max_limit=4)
+
+        for _ in range(20):
+            limiter.request(lambda: response())
+
+        assert limiter.limit == 4
+        assert limiter.stats()["peak_limit"] == 4
+
+    @pytest.mark.parametrize("status_code", [403, 429, 500, 503])
+    def test_decrease_on_overload(self, status_code: int):
+        limiter = AimdLimiter(initial_limit=8, max_limit=8)
+
+        res = limiter.request(lambda: response(status_code))
+
+        assert res.status_code == status_code
+        assert limiter.limit == 4
+        assert limiter.decreases == 1
+
+    def test_decrease_on_timeout(self):
+        limiter = AimdLimiter(initial_limit=8, max_limit=8)
+        send = MagicMock(side_effect=requests.exceptions.ReadTimeout())
+
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            limiter.request(send)
+
+        assert limiter.limit == 4
+
+    def test_other_errors_keep_limit(self):
+        limiter = AimdLimiter(initial_limit=8, max_limit=8)
+
+        with pytest.raises(ValueError):
+            limiter.request(MagicMock(side_effect=ValueError()))
+
+        assert limiter.limit == 8
+
+    def test_decrease_on_latency_spike(self):
+        tracker = LatencyTracker(percentile=0.1, min_samples=1, initial_threshold=0.0)
+        tracker.record(0.001)
+        limiter = AimdLimiter(
+            initial_limit=8, max_limit=8, min_baseline=0.001, tracker=tracker
+        )
+
+        def slow() -> requests.Response:
+            time.sleep(0.05)
+            return response()
+
+        limiter.request(slow)
+
+        assert limiter.limit == 4
+
+    def test_never_below_min_limit(self):
+        limiter = AimdLimiter(initial_limit=2, min_limit=1, max_limit=8)
+
+        for _ in range(5):
+            limiter.request(lambda: response(429))
+
+        assert limiter.limit == 1
+
+    def test_one_decrease_per_overload(self):
+        # 同じ過負荷で同時に失敗したリクエストは、まとめて1回だけ制限を下げる
+        limiter = AimdLimiter(initial_limit=4, max_limit=4)
+        barrier = threading.Barrier(4)
+
+        def rejected() -> requests.Response:
+            barrier.wait()
+            return response(429)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: limiter.request(rejected), range(4)))
+
+        assert limiter.decreases == 1
+        assert limiter.limit == 2
+
+    def test_in_flight_within_limit(self):
+        limiter = AimdLimiter(initial_limit=2, max_limit=2)
+        lock = threading.Lock()
+        in_flight = 0
+        peak = 0
+
+        def send() -> requests.Response:
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+            return response()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: limiter.request(send), range(16)))
+
+        assert peak == 2
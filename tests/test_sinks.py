@@ -0,0 +1,228 @@
+from typing import Optional
+from unittest.mock import MagicMock
+
+from requests.exceptions import ConnectionError, HTTPError
+
+from src.asken_fitbit_sync import AskenFitbitSync
+from src.custom_foods import CustomFoodCache
+from src.models.asken import FoodLog
+from src.models.fitbit import GetFoodLogResponse
+from src.models.sync import MealSyncResult
+from src.sinks import CsvSink, FitbitSink, FoodLogSink
+from tests.data.json import CREATE_FOOD_LOG_RESPONSE_JSON, GET_FOOD_LOG_RESPONSE_JSON
+from tests.helpers import DATE, food_log
+
+
+class FlakySink(FoodLogSink):
+    name = "flaky"
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(retry_interval=0, **kwargs)
+        self.failures = failures
+        self.calls = 0
+
+    def write(
+        self, date: str, food_logs: dict[int, Optional[FoodLog]]
+    ) -> list[MealSyncResult]:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("temporary error")
+
+        return [
+            MealSyncResult(date=date, meal_type_id=meal_type_id, status="created")
+            for meal_type_id in food_logs
+        ]
+
+
+class TestFoodLogSink:
+    def test_publish_retries(self):
+        sink = FlakySink(failures=1, max_retries=2)
+
+        results = sink.publish(DATE, {1: food_log(1)})
+
+        assert [r.status for r in results] == ["created"]
+        assert [r.sink for r in results] == ["flaky"]
+        assert sink.stats.retries == 1
+        assert sink.stats.succeeded == 1
+
+    def test_publish_gives_up(self):
+        sink = FlakySink(failures=3, max_retries=2)
+
+        results = sink.publish(DATE, {1: food_log(1), 2: None})
+
+        assert [r.status for r in results] == ["failed", "failed"]
+        assert sink.stats.retries == 2
+        assert sink.stats.failed == 2
+
+    def test_csv_sink(self, tmp_path):
+        path = tmp_path / "food_logs.csv"
+        sink = CsvSink(str(path))
+
+        sink.publish(DATE, {1: food_log(1), 2: None})
+        sink.publish("2024-01-02", {1: food_log(1)})
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert lines[0].startswith("date,meal_type_id,calories")
+        assert len(lines) == 3
+
+
+class TestAskenFitbitSyncSinks:
+    def test_scrape_once_for_all_sinks(self):
+        asken = MagicMock()
+        asken.fetch_food_log.side_effect = lambda date, meal_type_id: food_log(
+            meal_type_id
+        )
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = GetFoodLogResponse(
+            **GET_FOOD_LOG_RESPONSE_JSON
+        )
+        extra = FlakySink(failures=0)
+        syncer = AskenFitbitSync(asken, fitbit, sinks=[extra])
+
+        results = syncer.sync_food_logs(DATE, [1, 2]).meals
+
+        assert asken.fetch_food_log.call_count == 2
+        assert sorted((r.sink, r.meal_type_id) for r in results) == [
+            ("fitbit", 1),
+            ("fitbit", 2),
+            ("flaky", 1),
+            ("flaky", 2),
+        ]
+
+
+class TestFitbitSink:
+    def test_reuse_custom_food(self, fitbit: MagicMock):
+        sink = FitbitSink(fitbit, custom_foods=CustomFoodCache())
+
+        sink.publish(DATE, {1: food_log(1)})
+        sink.publish("2024-01-02", {1: food_log(1)})
+
+        first, second = (call.args[0] for call in fitbit.create_food_log.call_args_list)
+        assert first.foodId is None
+        assert first.foodName == "朝食（あすけん）"
+        assert second.foodId == 82294
+        assert second.foodName is None
+
+    def test_recreate_deleted_custom_food(self, fitbit: MagicMock):
+        custom_foods = CustomFoodCache()
+        custom_foods.put(1, food_log(1), 123, DATE)
+        fitbit.create_food_log.side_effect = [
+            HTTPError("not found", response=MagicMock(status_code=404)),
+            CREATE_FOOD_LOG_RESPONSE_JSON,
+        ]
+        sink = FitbitSink(fitbit, custom_foods=custom_foods)
+
+        results = sink.publish(DATE, {1: food_log(1)})
+
+        assert results[0].status == "created"
+        assert fitbit.create_food_log.call_args.args[0].foodName == "朝食（あすけん）"
+        assert custom_foods.get(1, food_log(1)) == 82294
+
+    def test_prune_unused_custom_foods(self, fitbit: MagicMock, tmp_path):
+        custom_foods = CustomFoodCache(str(tmp_path / "foods.json"))
+        custom_foods.put(1, food_log(1), 1, "2024-01-01")
+        custom_foods.put(2, food_log(2), 2, "2024-06-01")
+        sink = FitbitSink(fitbit, custom_foods=custom_foods)
+
+        assert sink.prune_custom_foods(max_age_days=30, today="2024-06-10") == 1
+        assert sink.prune_custom_foods(max_age_days=30, today="2024-06-10") == 0
+
+        fitbit.delete_food.assert_called_once_with(1)
+        reloaded = CustomFoodCache(str(tmp_path / "foods.json"))
+        assert reloaded.get(1, food_log(1)) is None
+        assert reloaded.get(2, food_log(2)) == 2
+
+    def test_created_without_food_id(self, fitbit: MagicMock):
+        fitbit.create_food_log.return_value = {"foodLog": {"logId": 1}}
+        custom_foods = CustomFoodCache()
+        sink = FitbitSink(fitbit, custom_foods=custom_foods)
+
+        results = sink.publish(DATE, {1: food_log(1)})
+
+        assert results[0].status == "created"
+        assert custom_foods.get(1, food_log(1)) is None
+
+    def test_keep_custom_food_used_for_old_date(self, fitbit: MagicMock):
+        sink = FitbitSink(fitbit, custom_foods=CustomFoodCache())
+
+        # 過去の日付を登録しても、使ったのは今日なので削除しない
+        sink.publish("2024-01-01", {1: food_log(1)})
+
+        assert sink.prune_custom_foods() == 0
+        fitbit.delete_food.assert_not_called()
+
+
+class TestCompaction:
+    @staticmethod
+    def fitbit_day(*entries: tuple[int, float]) -> GetFoodLogResponse:
+        """Fitbit food day which has lunch entries of this tool with (logId, calories)."""
+        response = GetFoodLogResponse(**GET_FOOD_LOG_RESPONSE_JSON)
+        template = response.foods[0]
+        response.foods = []
+        for log_id, calories in entries:
+            food = template.model_copy(deep=True)
+            food.logId = log_id
+            food.loggedFood.name = "昼食（あすけん）"
+            food.loggedFood.calories = calories
+            response.foods.append(food)
+        return response
+
+    def test_sync_keeps_correct_entry(self):
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = self.fitbit_day(
+            (1, 500), (2, 280), (3, 500)
+        )
+        sink = FitbitSink(fitbit)
+
+        results = sink.publish(DATE, {2: food_log(2)})
+
+        assert results[0].reason == "already_registered"
+        assert results[0].duplicates_deleted == 2
+        deleted = [call.args[0] for call in fitbit.delete_food_log.call_args_list]
+        assert deleted == [1, 2]
+        fitbit.create_food_log.assert_not_called()
+
+    def test_duplicate_already_deleted(self):
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = self.fitbit_day((1, 500), (2, 280))
+        # 同時に実行したcompactが先に削除している
+        fitbit.delete_food_log.side_effect = HTTPError(
+            "not found", response=MagicMock(status_code=404)
+        )
+        sink = FitbitSink(fitbit)
+
+        results = sink.publish(DATE, {2: food_log(2)})
+
+        assert results[0].status == "skipped"
+        assert results[0].duplicates_deleted == 1
+
+    def test_compaction_is_bounded(self):
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = self.fitbit_day(
+            *((log_id, 500) for log_id in range(1, 6))
+        )
+        sink = FitbitSink(fitbit, compaction_batch_size=2)
+
+        results = sink.compact(DATE, [2])
+
+        assert results[0].status == "compacted"
+        assert results[0].reason == "partially_compacted"
+        assert results[0].duplicates_deleted == 2
+        assert fitbit.delete_food_log.call_count == 2
+
+    def test_compact_dates(self):
+        fitbit = MagicMock()
+        fitbit.fetch_food_log.return_value = self.fitbit_day((1, 500), (2, 600))
+        syncer = AskenFitbitSync(MagicMock(), fitbit)
+
+        report = syncer.compact_dates(["2024-01-01", "2024-01-02"], [1, 2])
+
+        assert report.ok
+        assert sorted((m.date, m.meal_type_id, m.status) for m in report.meals) == [
+            ("2024-01-01", 1, "skipped"),
+            ("2024-01-01", 2, "compacted"),
+            ("2024-01-02", 1, "skipped"),
+            ("2024-01-02", 2, "compacted"),
+        ]
+        # 最新の登録を残す
+        assert {call.args[0] for call in fitbit.delete_food_log.call_args_list} == {1}
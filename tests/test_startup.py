@@ -0,0 +1,115 @@
+from unittest.mock import MagicMock
+import threading
+import time
+
+import pytest
+
+from src.lambda_function import _syncer_options_from_env, create_syncer
+from src.startup import TaskGraph
+
+
+class TestTaskGraph:
+    def test_independent_steps_overlap(self):
+        graph = TaskGraph()
+        barrier = threading.Barrier(2, timeout=5)
+
+        def step(result: str) -> str:
+            # 同時に実行されていなければバリアがタイムアウトする
+            barrier.wait()
+            return result
+
+        graph.add("asken_login", lambda: step("asken"))
+        graph.add("fitbit_day", lambda: step("fitbit"))
+
+        results = graph.run()
+
+        assert results == {"asken_login": "asken", "fitbit_day": "fitbit"}
+
+    def test_dependencies_receive_results(self):
+        order = []
+        graph = TaskGraph()
+        graph.add("secret", lambda: order.append("secret") or {"mail": "a@b.com"})
+        graph.add(
+            "login",
+            lambda secret: order.append("login") or secret["mail"],
+            depends_on=("secret",),
+        )
+
+        results = graph.run()
+
+        assert results["login"] == "a@b.com"
+        assert order == ["secret", "login"]
+
+    def test_phases(self):
+        phases: dict[str, float] = {}
+        graph = TaskGraph()
+        graph.add("slow", lambda: time.sleep(0.02))
+
+        graph.run(phases)
+
+        assert phases["startup:slow"] >= 0.02
+
+    def test_error_stops_dependents(self):
+        called = []
+        graph = TaskGraph()
+        graph.add("secret", lambda: (_ for _ in ()).throw(RuntimeError("denied")))
+        graph.add("login", lambda secret: called.append(secret), depends_on=("secret",))
+
+        with pytest.raises(RuntimeError, match="denied"):
+            graph.run()
+        assert not called
+
+    def test_unknown_dependency(self):
+        graph = TaskGraph()
+
+        with pytest.raises(ValueError):
+            graph.add("login", lambda secret: None, depends_on=("secret",))
+
+
+class TestCreateSyncer:
+    @pytest.fixture
+    def fitbit(self, monkeypatch) -> MagicMock:
+        fitbit = MagicMock()
+        monkeypatch.delenv("ENV", raising=False)
+        monkeypatch.setattr("src.lambda_function.Asken", MagicMock())
+        monkeypatch.setattr(
+            "src.lambda_function.Fitbit", MagicMock(return_value=fitbit)
+        )
+        return fitbit
+
+    def test_prefetch_during_login(self, fitbit: MagicMock):
+        create_syncer(
+            "a@b.com", "pw", "client", "access", "refresh", prefetch_date="2024-01-01"
+        )
+
+        fitbit.fetch_food_log.assert_called_once_with("2024-01-01")
+
+    def test_no_prefetch_with_ledger(self, fitbit: MagicMock, tmp_path):
+        create_syncer(
+            "a@b.com",
+            "pw",
+            "client",
+            "access",
+            "refresh",
+            prefetch_date="2024-01-01",
+            ledger_path=str(tmp_path / "ledger.sqlite3"),
+        )
+
+        # 台帳があれば、変わっていない食事のためにFitbitを取得しない
+        fitbit.fetch_food_log.assert_not_called()
+
+
+class TestSyncerOptionsFromEnv:
+    def test_options(self, monkeypatch):
+        monkeypatch.setenv("ASKEN_HEDGE", "1")
+        monkeypatch.setenv("CUSTOM_FOODS_PATH", "/tmp/{account}.json")
+        monkeypatch.setenv("LEDGER_PATH", "/tmp/ledger.sqlite3")
+        monkeypatch.delenv("CACHE_DIR", raising=False)
+
+        options = _syncer_options_from_env("secret")
+
+        assert options["hedge"]
+        assert options["cache_dir"] is None
+        assert options["custom_foods_path"] == "/tmp/secret.json"
+        assert options["ledger_path"] == "/tmp/ledger.sqlite3"
+        assert _syncer_options_from_env()["custom_foods_path"] == "/tmp/{account}.json"
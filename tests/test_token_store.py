@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+import json
+
+import pytest
+from botocore.exceptions import ClientError  # type: ignore
+
+from src.fitbit import Fitbit
+from src.token_store import (
+    FileTokenStore,
+    SecretsManagerTokenStore,
+    TokenConflictError,
+)
+from tests.data.json.fitbit import REFRESH_ACCESS_TOKEN_RESPONSE
+
+
+@pytest.fixture
+def credentials_path(tmp_path) -> str:
+    path = tmp_path / "credentials.json"
+    path.write_text(
+        json.dumps(
+            {
+                "mail": "a@b.com",
+                "access_token": "access_token",
+                "refresh_token": "refresh_token",
+            }
+        )
+    )
+    return str(path)
+
+
+@pytest.fixture
+def mock_post():
+    with patch("src.fitbit.requests.post") as mock_post:
+        mock_post.return_value.json.return_value = REFRESH_ACCESS_TOKEN_RESPONSE
+        yield mock_post
+
+
+class TestFileTokenStore:
+    def test_save_keeps_other_fields(self, credentials_path: str):
+        store = FileTokenStore(credentials_path)
+        loaded = store.load()
+
+        saved = store.save("new_access", "new_refresh", loaded.version)
+
+        assert store.load() == saved
+        assert saved.version != loaded.version
+        with open(credentials_path) as f:
+            assert json.load(f)["mail"] == "a@b.com"
+
+    def test_save_conflict(self, credentials_path: str):
+        store = FileTokenStore(credentials_path)
+        stale = store.load()
+        store.save("new_access", "new_refresh", stale.version)
+
+        with pytest.raises(TokenConflictError):
+            store.save("other_access", "other_refresh", stale.version)
+        assert store.load().access_token == "new_access"
+
+
+class TestSecretsManagerTokenStore:
+    @pytest.fixture
+    def client(self) -> MagicMock:
+        client = MagicMock()
+        client.get_secret_value.return_value = {
+            "SecretString": json.dumps(
+                {"mail": "a@b.com", "access_token": "a", "refresh_token": "r"}
+            ),
+            "VersionId": "v1",
+        }
+        client.put_secret_value.return_value = {"VersionId": "v2"}
+        return client
+
+    def test_save_moves_current_stage(self, client: MagicMock):
+        store = SecretsManagerTokenStore(client, "secret")
+
+        saved = store.save("new_access", "new_refresh", "v1")
+
+        assert saved.version == "v2"
+        put_kwargs = client.put_secret_value.call_args.kwargs
+        assert put_kwargs["VersionStages"] == ["AWSPENDING"]
+        assert json.loads(put_kwargs["SecretString"])["mail"] == "a@b.com"
+        client.update_secret_version_stage.assert_called_once_with(
+            SecretId="secret",
+            VersionStage="AWSCURRENT",
+            MoveToVersionId="v2",
+            RemoveFromVersionId="v1",
+        )
+
+    def test_save_stale_version(self, client: MagicMock):
+        store = SecretsManagerTokenStore(client, "secret")
+
+        with pytest.raises(TokenConflictError):
+            store.save("new_access", "new_refresh", "v0")
+        client.put_secret_value.assert_not_called()
+
+    def test_save_lost_race(self, client: MagicMock):
+        # 読み込み後、ステージの移動までの間に他のプロセスが更新した場合
+        client.update_secret_version_stage.side_effect = ClientError(
+            {"Error": {"Code": "InvalidParameterException"}},
+            "UpdateSecretVersionStage",
+        )
+        store = SecretsManagerTokenStore(client, "secret")
+
+        with pytest.raises(TokenConflictError):
+            store.save("new_access", "new_refresh", "v1")
+        client.update_secret_version_stage.assert_called_with(
+            SecretId="secret", VersionStage="AWSPENDING", RemoveFromVersionId="v2"
+        )
+
+
+class TestFitbitTokenStore:
+    def test_refresh_saves_to_store(self, credentials_path: str, mock_post):
+        store = FileTokenStore(credentials_path)
+        fitbit = Fitbit("client_id", "access_token", "refresh_token", token_store=store)
+
+        fitbit.refresh_access_token()
+
+        mock_post.assert_called_once()
+        assert mock_post.call_args.kwargs["data"]["refresh_token"] == "refresh_token"
+        assert (
+            store.load().access_token == REFRESH_ACCESS_TOKEN_RESPONSE["access_token"]
+        )
+
+    def test_adopt_tokens_refreshed_by_another_process(
+        self, credentials_path: str, mock_post
+    ):
+        store = FileTokenStore(credentials_path)
+        store.save("new_access", "new_refresh", store.load().version)
+        callback = MagicMock()
+        fitbit = Fitbit(
+            "client_id",
+            "access_token",
+            "refresh_token",
+            callback_on_token_refreshed=callback,
+            token_store=store,
+        )
+
+        tokens = fitbit.refresh_access_token()
+
+        mock_post.assert_not_called()
+        assert tokens == {"access_token": "new_access", "refresh_token": "new_refresh"}
+        assert fitbit._access_token == "new_access"
+        callback.assert_called_once_with("new_access", "new_refresh")
+
+    def test_adopt_on_conflict(self, credentials_path: str, mock_post):
+        store = FileTokenStore(credentials_path)
+        store.save = MagicMock(side_effect=TokenConflictError())  # type: ignore
+        store.load = MagicMock(  # type: ignore
+            side_effect=[
+                FileTokenStore(credentials_path).load(),
+                FileTokenStore(credentials_path)
+                .load()
+                .model_copy(update={"access_token": "winner", "version": "v2"}),
+            ]
+        )
+        fitbit = Fitbit("client_id", "access_token", "refresh_token", token_store=store)
+
+        fitbit.refresh_access_token()
+
+        assert fitbit._access_token == "winner"
+
+    def test_concurrent_refresh_calls_api_once(self, credentials_path: str, mock_post):
+        clients = [
+            Fitbit(
+                "client_id",
+                "access_token",
+                "refresh_token",
+                token_store=FileTokenStore(credentials_path),
+            )
+            for _ in range(4)
+        ]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda client: client.refresh_access_token(), clients))
+
+        mock_post.assert_called_once()
+        assert {client._access_token for client in clients} == {
+            REFRESH_ACCESS_TOKEN_RESPONSE["access_token"]
+        }
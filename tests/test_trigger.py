@@ -0,0 +1,353 @@
+from unittest.mock import ANY, MagicMock
+import base64
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from src.deadline import Deadline
+from src.models.sync import SyncReport, TriggerResult
+from botocore.exceptions import ClientError  # type: ignore
+
+from src.trigger import (
+    DynamoDBTriggerStore,
+    InMemoryTriggerStore,
+    SyncTrigger,
+    create_function_url_server,
+    handle_function_url,
+)
+
+
+def report_of(account: str, dates: list[str], deadline: Deadline) -> SyncReport:
+    return SyncReport(dates=dates)
+
+
+def event(body: dict, headers: dict = {}) -> dict:
+    return {"headers": headers, "body": json.dumps(body), "isBase64Encoded": False}
+
+
+class TestSyncTrigger:
+    def test_coalesce_within_window(self):
+        sync = MagicMock(side_effect=report_of)
+        trigger = SyncTrigger(sync, window=0.1)
+
+        first = trigger.submit("a@b.com", ["2024-01-01"])
+        second = trigger.submit("a@b.com", ["2024-01-02", "2024-01-01"])
+        report = trigger.wait(first.ticket, timeout=5)
+
+        assert second.ticket == first.ticket
+        sync.assert_called_once_with("a@b.com", ["2024-01-01", "2024-01-02"], ANY)
+        assert report == SyncReport(dates=["2024-01-01", "2024-01-02"])
+
+    def test_accounts_are_synced_separately(self):
+        sync = MagicMock(side_effect=report_of)
+        trigger = SyncTrigger(sync, window=0.05)
+
+        first = trigger.submit("a@b.com", ["2024-01-01"])
+        second = trigger.submit("c@d.com", ["2024-01-01"])
+        trigger.wait(first.ticket, timeout=5)
+        trigger.wait(second.ticket, timeout=5)
+
+        assert first.ticket != second.ticket
+        assert sync.call_count == 2
+
+    def test_duplicate_key_while_running(self):
+        running = threading.Event()
+        release = threading.Event()
+
+        def slow_sync(account: str, dates: list[str], deadline: Deadline) -> SyncReport:
+            running.set()
+            release.wait(5)
+            return report_of(account, dates, deadline)
+
+        sync = MagicMock(side_effect=slow_sync)
+        trigger = SyncTrigger(sync, window=0.01)
+
+        first = trigger.submit("a@b.com", ["2024-01-01"], idempotency_key="key")
+        assert running.wait(5)
+        retried = trigger.submit("a@b.com", ["2024-01-01"], idempotency_key="key")
+        release.set()
+
+        assert retried.duplicate
+        assert retried.ticket == first.ticket
+        assert trigger.wait(retried.ticket, timeout=5) is not None
+        sync.assert_called_once()
+
+    def test_trigger_while_running_waits_for_next_sync(self):
+        running = threading.Event()
+        release = threading.Event()
+        overlapped = []
+        active = threading.Lock()
+
+        def slow_sync(account: str, dates: list[str], deadline: Deadline) -> SyncReport:
+            if not active.acquire(blocking=False):
+                overlapped.append(dates)
+                return report_of(account, dates, deadline)
+            try:
+                running.set()
+                release.wait(5)
+                return report_of(account, dates, deadline)
+            finally:
+                active.release()
+
+        sync = MagicMock(side_effect=slow_sync)
+        trigger = SyncTrigger(sync, window=0.01)
+
+        first = trigger.submit("a@b.com", ["2024-01-01"])
+        assert running.wait(5)
+        second = trigger.submit("a@b.com", ["2024-01-02"])
+        release.set()
+        report = trigger.wait(second.ticket, timeout=5)
+
+        assert second.ticket != first.ticket
+        assert report == SyncReport(dates=["2024-01-02"])
+        assert not overlapped
+
+    def test_coalesce_across_processes(self):
+        # 実行環境ごとのトリガーが状態を共有する
+        store = InMemoryTriggerStore()
+        sync = MagicMock(side_effect=report_of)
+        first = SyncTrigger(sync, window=0.1, store=store)
+        second = SyncTrigger(sync, window=0.1, store=store)
+
+        opened = first.submit("a@b.com", ["2024-01-01"], idempotency_key="key")
+        joined = second.submit("a@b.com", ["2024-01-02"])
+        retried = second.submit("a@b.com", ["2024-01-01"], idempotency_key="key")
+
+        assert joined.ticket == opened.ticket
+        assert retried.duplicate and retried.ticket == opened.ticket
+        assert second.wait(joined.ticket, timeout=5) == SyncReport(
+            dates=["2024-01-01", "2024-01-02"]
+        )
+        sync.assert_called_once_with("a@b.com", ["2024-01-01", "2024-01-02"], ANY)
+
+    def test_unknown_ticket(self):
+        trigger = SyncTrigger(MagicMock(side_effect=report_of), window=0.01)
+
+        assert trigger.wait("unknown") is None
+
+    def test_failed_sync_reports_pending_dates(self):
+        trigger = SyncTrigger(MagicMock(side_effect=RuntimeError("boom")), window=0.01)
+
+        result = trigger.submit("a@b.com", ["2024-01-01"])
+        report = trigger.wait(result.ticket, timeout=5)
+
+        assert report is not None
+        assert report.error == "boom"
+        assert report.pending_dates == ["2024-01-01"]
+
+
+class TestFunctionUrl:
+    def test_handle(self):
+        trigger = SyncTrigger(MagicMock(side_effect=report_of), window=0.01)
+
+        response = handle_function_url(
+            trigger,
+            "a@b.com",
+            event({"dates": ["2024-01-01"]}, {"Idempotency-Key": "abc"}),
+            timeout=5,
+        )
+
+        assert response["statusCode"] == 200
+        body = json.loads(response["body"])
+        assert body["report"]["dates"] == ["2024-01-01"]
+        assert not body["duplicate"]
+
+    def test_base64_body(self):
+        trigger = SyncTrigger(MagicMock(side_effect=report_of), window=0.01)
+        body = base64.b64encode(json.dumps({"date": "2024-01-01"}).encode()).decode()
+
+        response = handle_function_url(
+            trigger,
+            "a@b.com",
+            {"body": body, "isBase64Encoded": True},
+            timeout=5,
+        )
+
+        assert json.loads(response["body"])["dates"] == ["2024-01-01"]
+
+    @pytest.mark.parametrize("body", [{"dates": "2024-01-01"}, {"dates": ["01/01"]}])
+    def test_bad_request(self, body: dict):
+        sync = MagicMock()
+        trigger = SyncTrigger(sync, window=0.01)
+
+        response = handle_function_url(trigger, "a@b.com", event(body))
+
+        assert response["statusCode"] == 400
+        sync.assert_not_called()
+
+    def test_sync_within_deadline_of_invocation(self):
+        sync = MagicMock(side_effect=report_of)
+        trigger = SyncTrigger(sync, window=0.01)
+        deadline = Deadline(60)
+
+        handle_function_url(
+            trigger,
+            "a@b.com",
+            event({"dates": ["2024-01-01"]}),
+            timeout=5,
+            deadline=deadline,
+        )
+
+        sync.assert_called_once_with("a@b.com", ["2024-01-01"], deadline)
+
+    def test_not_finished_in_time(self):
+        store = InMemoryTriggerStore()
+        owner = SyncTrigger(MagicMock(side_effect=report_of), window=0.3, store=store)
+        opened = owner.submit("a@b.com", ["2024-01-01"])
+        trigger = SyncTrigger(MagicMock(), window=0.3, store=store)
+
+        response = handle_function_url(
+            trigger, "a@b.com", event({"dates": ["2024-01-01"]}), timeout=0.01
+        )
+
+        assert response["statusCode"] == 202
+        assert "report" not in json.loads(response["body"])
+        # テスト後にタイマーのスレッドが閉じたログに書き込まないよう、同期の終了を待つ
+        assert owner.wait(opened.ticket) is not None
+
+    def test_own_sync_is_waited_for(self):
+        # 応答後に実行環境が凍結されると、この呼び出しで始めた同期が止まってしまう
+        trigger = SyncTrigger(MagicMock(side_effect=report_of), window=0.2)
+
+        response = handle_function_url(
+            trigger, "a@b.com", event({"dates": ["2024-01-01"]}), timeout=0.01
+        )
+
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["report"]["dates"] == ["2024-01-01"]
+
+    def test_local_server(self):
+        trigger = SyncTrigger(MagicMock(side_effect=report_of), window=0.01)
+        server = create_function_url_server(
+            lambda event, context: handle_function_url(
+                trigger, "a@b.com", event, timeout=5
+            ),
+            port=0,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{server.server_address[1]}/sync",
+                data=json.dumps({"dates": ["2024-01-01"]}).encode(),
+                headers={"Idempotency-Key": "abc"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                body = json.loads(response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert body["report"]["dates"] == ["2024-01-01"]
+
+
+def conditional_check_failed(operation: str) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": "ConditionalCheckFailedException"}}, operation
+    )
+
+
+class TestDynamoDBTriggerStore:
+    def test_join_open_batch(self):
+        client = MagicMock()
+        client.update_item.return_value = {
+            "Attributes": {
+                "ticket": {"S": "first"},
+                "dates": {"SS": ["2024-01-02", "2024-01-01"]},
+            }
+        }
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        assert store.join("a@b.com", ["2024-01-02"], "second") == (
+            "first",
+            ["2024-01-01", "2024-01-02"],
+        )
+        client.put_item.assert_not_called()
+
+    def test_open_batch(self):
+        client = MagicMock()
+        client.update_item.side_effect = conditional_check_failed("UpdateItem")
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        assert store.join("a@b.com", ["2024-01-01"], "first") == (
+            "first",
+            ["2024-01-01"],
+        )
+        item = client.put_item.call_args.kwargs["Item"]
+        assert item["pk"] == {"S": "open#a@b.com"}
+        assert item["ticket"] == {"S": "first"}
+
+    def test_duplicate_dates(self):
+        client = MagicMock()
+        client.update_item.side_effect = conditional_check_failed("UpdateItem")
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        store.join("a@b.com", ["2024-01-01", "2024-01-01"], "first")
+
+        # DynamoDBは重複した値を含む文字列セットを拒否する
+        assert client.update_item.call_args.kwargs["ExpressionAttributeValues"][
+            ":dates"
+        ] == {"SS": ["2024-01-01"]}
+        assert client.put_item.call_args.kwargs["Item"]["dates"] == {
+            "SS": ["2024-01-01"]
+        }
+
+    def test_join_batch_opened_concurrently(self):
+        client = MagicMock()
+        client.update_item.side_effect = [
+            conditional_check_failed("UpdateItem"),
+            {"Attributes": {"ticket": {"S": "other"}, "dates": {"SS": ["2024-01-01"]}}},
+        ]
+        client.put_item.side_effect = conditional_check_failed("PutItem")
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        assert store.join("a@b.com", ["2024-01-01"], "mine") == (
+            "other",
+            ["2024-01-01"],
+        )
+
+    def test_claimed_key(self):
+        claimed = TriggerResult(ticket="first", dates=["2024-01-01"])
+        client = MagicMock()
+        client.put_item.side_effect = conditional_check_failed("PutItem")
+        client.get_item.return_value = {
+            "Item": {
+                "result": {"S": claimed.model_dump_json()},
+                "expires_at": {"N": str(time.time() + 60)},
+            }
+        }
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        assert store.claim_key("key", TriggerResult(ticket="second", dates=[])) == (
+            claimed
+        )
+
+    def test_expired_report_is_ignored(self):
+        client = MagicMock()
+        client.get_item.return_value = {
+            "Item": {
+                "report": {"S": SyncReport(dates=[]).model_dump_json()},
+                "expires_at": {"N": str(time.time() - 1)},
+            }
+        }
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        assert store.report("ticket") is None
+
+    def test_lock_waits_for_lease(self, monkeypatch):
+        monkeypatch.setattr("src.trigger.time.sleep", MagicMock())
+        client = MagicMock()
+        client.put_item.side_effect = [conditional_check_failed("PutItem"), {}]
+        store = DynamoDBTriggerStore(client, "triggers")
+
+        with store.lock("a@b.com"):
+            assert client.put_item.call_count == 2
+            client.delete_item.assert_not_called()
+
+        owner = client.put_item.call_args.kwargs["Item"]["owner"]
+        assert client.delete_item.call_args.kwargs["ExpressionAttributeValues"] == {
+            ":owner": owner
+        }